@@ -5,7 +5,7 @@ import os
 import re
 from enum import StrEnum
 from importlib import import_module
-from typing import Callable, Dict, Final, Iterable, List, Set, Tuple, Union
+from typing import Any, Callable, Dict, Final, Iterable, List, Set, Tuple, Union
 
 from django.apps import apps
 from django.conf import settings
@@ -13,7 +13,6 @@ from django.core.exceptions import ImproperlyConfigured
 from django.db.utils import DEFAULT_DB_ALIAS
 
 from fias.enum import CEnumMeta
-from fias.models import AbstractModel
 
 __all__ = [
     "DEFAULT_DB_ALIAS",
@@ -147,10 +146,14 @@ if not (
 см. fias.importer.filters
 указывается список путей к функциям-фильтрам
 фильтры применяются к *каждому* объекту
+(записи fias.importer.record.Record с атрибутами полей модели)
 один за другим, пока не закончатся,
 либо пока какой-нибудь из них не вернёт None
 если фильтр вернул None, объект не импортируется в БД
 
+фильтр, помеченный декоратором fias.importer.filters.batch_filter,
+получает сразу список записей и возвращает список True/False той же длины
+
 пример:
 
 FIAS_TABLE_ROW_FILTERS = {
@@ -163,7 +166,7 @@ FIAS_TABLE_ROW_FILTERS = {
 }
 """
 row_filters: Dict[TableName, List[str]] = getattr(settings, "FIAS_TABLE_ROW_FILTERS", {})
-TABLE_ROW_FILTERS: Dict[TableName, List[Callable[[AbstractModel], Union[AbstractModel, None]]]] = {}
+TABLE_ROW_FILTERS: Dict[TableName, List[Callable[..., Any]]] = {}
 _DEFAULT_TABLE_ROW_FILTERS: Dict[TableName, List[str]] = {
     TableName.HOUSE: [
         "fias.importer.filters.filter_is_actual",
@@ -5,44 +5,100 @@ import codecs
 import csv
 import logging
 import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import closing, contextmanager
 from functools import partial
 from pathlib import Path
-from typing import List, Tuple, Union, cast
+from threading import Lock
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
 import django
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
-from django.db import connections
+from django.db import router, transaction
 from django.db.models import Min
 
 from fias import config
 from fias.config import STORE_INACTIVE_TABLES, VALIDATE_HOUSE_PARAM_IDS, TableName
-from fias.importer.loader import TableLoader, TableUpdater
+from fias.importer.downloader import RangeNotSupportedError
+from fias.importer.fixscope import (
+    FIX_SCOPE_LIMIT,
+    FixScope,
+    forget_fixed,
+    get_child_tables,
+    mark_fixed,
+)
+from fias.importer.loader import TableLoader, TableUpdater, Writer
+from fias.importer.maintenance import FixChunking, run_chunked
+from fias.importer.scheduler import TaskGraph, pool_connections
+from fias.importer.shadow import (
+    SHADOW_SCHEMA,
+    prepare_shadow,
+    set_logged,
+    swap_shadow,
+    use_schema,
+)
 from fias.importer.signals import (
     post_drop_indexes,
     post_import,
+    post_import_table,
     post_restore_indexes,
     post_update,
     pre_drop_indexes,
     pre_import,
+    pre_import_table,
     pre_restore_indexes,
     pre_update,
 )
+from fias.importer.sizing import BatchSizing
 from fias.importer.source import (
     DirectoryTableList,
     LocalArchiveTableList,
     RemoteArchiveTableList,
+    RemoteZipTableList,
+    StreamingArchiveTableList,
     TableList,
     TableListLoadingError,
+    is_selective,
+    is_streaming,
+    prefetch_archives,
+)
+from fias.importer.table import (
+    BadTableError,
+    NetChangeTable,
+    Table,
+    get_model,
+    get_table_refs,
 )
-from fias.importer.table import BadTableError, Table, get_model
 from fias.models import AbstractIsActiveModel, HouseParam, ParamType, Status, Version
 from gar_loader.indexes import remove_indexes_from_model, restore_indexes_for_model
 
 logger = logging.getLogger(__name__)
 
 
+def get_remote_tablelist(url: str, version: Union[Version, None], tempdir: Union[Path, None]) -> TableList:
+    try:
+        if is_selective(url):
+            return RemoteZipTableList(src=url, version=version, tempdir=tempdir)
+        if is_streaming(url):
+            return StreamingArchiveTableList(src=url, version=version, tempdir=tempdir)
+    except RangeNotSupportedError as e:
+        logger.warning(f"{e}. Downloading the whole archive.")
+    return RemoteArchiveTableList(src=url, version=version, tempdir=tempdir)
+
+
 def get_tablelist(
     path: Union[Path, str, None] = None,
     version: Union[Version, None] = None,
@@ -59,13 +115,13 @@ def get_tablelist(
         latest_version = Version.objects.latest("dumpdate")
         url = getattr(latest_version, f"complete_{data_format}_url")
 
-        tablelist = RemoteArchiveTableList(src=url, version=latest_version, tempdir=tempdir)
+        tablelist = get_remote_tablelist(url, version=latest_version, tempdir=tempdir)
 
     else:
         try:
             url = str(path)
             URLValidator()(url)
-            tablelist = RemoteArchiveTableList(src=url, version=version, tempdir=tempdir)
+            tablelist = get_remote_tablelist(url, version=version, tempdir=tempdir)
         except ValidationError:
             path = Path(path)
             if path.is_file():
@@ -82,38 +138,287 @@ def get_table_names(tables: Union[Tuple[TableName, ...], None]) -> Tuple[TableNa
     return tables if tables else config.TABLES
 
 
-def remove_orphans(tables: List[TableName]) -> None:
+def remove_orphans(
+    tables: List[TableName], scope: Union[FixScope, None] = None, chunking: Union[FixChunking, None] = None
+) -> None:
     # There are two levels of model hierarchy, so we can remove orphans in any order.
     for table in tables:
-        get_model(table).objects.delete_orphans()
+        model = get_model(table)
+        keys = scope.ref_keys(table) if scope is not None else None
+        if keys is None and chunking is not None:
+            count = run_chunked(
+                f"Orphans of `{table}`", model, lambda bounds: model.objects.delete_orphans(bounds=bounds), chunking
+            )
+            logger.info(f"Removed {count} orphans of `{table}`.")
+        else:
+            model.objects.delete_orphans(keys)
+
+
+# Примерное количество строк таблицы в диапазоне первичного ключа, в котором неактивные записи
+# удаляются одним запросом (отдельной транзакцией)
+NOT_ACTIVE_BATCH = 100000
 
 
-def remove_not_active(tables: List[TableName]) -> None:
+def _delete_not_active_chunk(
+    model: Type[AbstractIsActiveModel], counts: Dict[Union[str, None], int], lock: Lock, bounds: Tuple[int, int]
+) -> int:
+    deleted = model.objects.delete_not_active(bounds=bounds)
+    with lock:
+        for region, count in deleted.items():
+            counts[region] = counts.get(region, 0) + count
+    return sum(deleted.values())
+
+
+def remove_not_active(
+    tables: List[TableName], scope: Union[FixScope, None] = None, chunking: Union[FixChunking, None] = None
+) -> None:
     for table in filter(lambda t: t not in STORE_INACTIVE_TABLES, tables):
         model = get_model(table)
-        if issubclass(model, AbstractIsActiveModel):
-            model.objects.filter(isactive=False).delete()
+        if not issubclass(model, AbstractIsActiveModel):
+            continue
+        keys = scope.not_active_keys(table) if scope is not None else None
+        if keys is not None and not keys:
+            continue
+
+        counts: Dict[Union[str, None], int] = {}
+        if keys is not None:
+            # Записи, ссылающиеся на удаляемые объекты, удаляются в той же транзакции: если запуск прервётся,
+            # неактивные объекты останутся и будут найдены снова
+            with transaction.atomic(using=router.db_for_write(model)):
+                counts = model.objects.delete_not_active(keys)
+                for child in get_child_tables(table):
+                    get_model(child).objects.delete_orphans(keys)
+        else:
+            if scope is not None:
+                # Ключи удалённых объектов не сохраняются, поэтому прерванное исправление
+                # должно проверить ссылающиеся таблицы целиком
+                forget_fixed(get_child_tables(table))
+            # Поле isactive не проиндексировано, поэтому таблица удаляется по диапазонам первичного ключа:
+            # каждая строка просматривается один раз
+            run_chunked(
+                f"Inactive records of `{table}`",
+                model,
+                partial(_delete_not_active_chunk, model, counts, Lock()),
+                chunking or FixChunking(rows=NOT_ACTIVE_BATCH, workers=1),
+                by_pk=True,
+            )
+
+        for region, count in sorted(counts.items(), key=lambda rc: rc[0] or ""):
+            logger.info(f"Removed {count} inactive records of `{table}`" + (f", region {region}." if region else "."))
 
 
-def update_tree_ver(tables: List[TableName], min_ver: int) -> None:
+def update_tree_ver(
+    tables: List[TableName],
+    min_ver: int,
+    scope: Union[FixScope, None] = None,
+    chunking: Union[FixChunking, None] = None,
+) -> None:
     for table in tables:
-        get_model(table).objects.update_tree_ver(min_ver)
+        model = get_model(table)
+        # Версия переносится и из записей, оставшихся неисправленными после прерванных запусков
+        fixed_ver = scope.fixed_ver(table) if scope is not None else None
+        table_min_ver = min(min_ver, fixed_ver + 1) if fixed_ver is not None else min_ver
+        if chunking is not None:
+            count = run_chunked(
+                f"Tree version from `{table}`",
+                model,
+                lambda bounds: model.objects.update_tree_ver(table_min_ver, bounds=bounds),
+                chunking,
+            )
+            logger.info(f"Tree version is updated for {count} objects referenced by `{table}`.")
+        else:
+            model.objects.update_tree_ver(table_min_ver)
+
+
+def add_fix_tasks(
+    graph: TaskGraph,
+    tables: List[TableName],
+    min_ver: int,
+    ready: Union[Dict[TableName, str], None] = None,
+    scope: Union[FixScope, None] = None,
+    chunking: Union[FixChunking, None] = None,
+) -> None:
+    """
+    Добавляет в граф шаги исправления данных. Шаг таблицы запускается, как только готовы
+    сама таблица и таблицы, на которые она ссылается (ready - задачи готовности таблиц).
+    Если задан scope, шаги ограничиваются записями, изменёнными после прошлого исправления; если задан chunking,
+    шаги по всей таблице выполняются по диапазонам ссылочного поля в нескольких соединениях
+    """
+    ready_tasks = ready or {}
+    refs = {tbl: [ref for ref in get_table_refs(tbl) if ref in tables] for tbl in tables}
+
+    def ready_deps(*tbls: TableName) -> List[str]:
+        return [ready_tasks[tbl] for tbl in tbls if tbl in ready_tasks]
+
+    # Версия дерева переносится из таблицы в таблицы, на которые она ссылается.
+    # Изменения одной таблицы выполняются по очереди
+    writers: Dict[TableName, List[str]] = {tbl: [] for tbl in tables}
+    for tbl in tables:
+        if not get_table_refs(tbl):
+            continue
+        deps = ready_deps(tbl, *refs[tbl]) + [writers[ref][-1] for ref in refs[tbl] if writers[ref]]
+        name = graph.add(f"tree_ver:{tbl}", partial(update_tree_ver, [tbl], min_ver, scope, chunking), deps, local=True)
+        for ref in refs[tbl]:
+            writers[ref].append(name)
+
+    # Неактивные записи ссылающихся таблиц удаляются раньше: удаление объектов меняет и их
+    for tbl in sorted(tables, key=lambda t: not get_table_refs(t)):
+        deps = ready_deps(tbl) + writers[tbl]
+        if f"tree_ver:{tbl}" in graph:
+            deps.append(f"tree_ver:{tbl}")
+        deps += [f"not_active:{child}" for child in get_child_tables(tbl) if child in tables]
+        graph.add(f"not_active:{tbl}", partial(remove_not_active, [tbl], scope, chunking), deps, local=True)
+
+    for tbl in tables:
+        if get_table_refs(tbl):
+            deps = [f"not_active:{tbl}"] + [f"not_active:{ref}" for ref in refs[tbl]]
+            graph.add(f"orphans:{tbl}", partial(remove_orphans, [tbl], scope, chunking), deps, local=True)
+
+
+# Оценка памяти процесса загрузки: интерпретатор с Django и разбор XML
+WORKER_BASE_MEMORY = 128 * 1024 * 1024
+# Примерный размер одной записи в XML-файле и в памяти процесса, байт
+XML_RECORD_SIZE = 256
+RECORD_MEMORY = 1024
+
+
+def estimate_memory(
+    size: int,
+    limit: int,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    sizing: Union[BatchSizing, None] = None,
+) -> int:
+    """
+    Оценка памяти процесса, загружающего файл размером size: в памяти одновременно находятся
+    пачка разбираемых записей и пачки в очереди записи, но не больше записей, чем есть в файле
+    """
+    batch = sizing.max_size if sizing is not None else limit
+    batches = write_queue + write_workers + 1 if write_workers else 1
+    return WORKER_BASE_MEMORY + min(size // XML_RECORD_SIZE + 1, batch * batches) * RECORD_MEMORY
+
+
+def group_tables(
+    tablelist: TableList, tables: List[Table], coalesce_size: Union[int, None]
+) -> List[Tuple[int, List[Table]]]:
+    """
+    Группирует файлы в задачи загрузки. Файлы не меньше coalesce_size и части файлов загружаются
+    отдельными задачами, мелкие файлы объединяются в задачи суммарным размером до coalesce_size.
+    Возвращает пары (размер, файлы) в порядке убывания размера
+    """
+    sized = sorted(((t.get_size(tablelist), t) for t in tables), key=lambda st: -st[0])
+    groups: List[Tuple[int, List[Table]]] = []
+    small: List[Table] = []
+    small_size = 0
+    for size, table in sized:
+        if not coalesce_size or table.part is not None or size >= coalesce_size:
+            groups.append((size, [table]))
+            continue
+        if small and small_size + size > coalesce_size:
+            groups.append((small_size, small))
+            small, small_size = [], 0
+        small.append(table)
+        small_size += size
+    if small:
+        groups.append((small_size, small))
+    return sorted(groups, key=lambda g: -g[0])
+
+
+def _task_weight(tablelist: TableList, size: int, group: List[Table]) -> int:
+    """Порядок запуска задачи: сначала крупные файлы, а при загрузке во время скачивания - по порядку в архиве"""
+    if isinstance(tablelist, StreamingArchiveTableList):
+        return -min(tablelist.get_file_offset(t.filename) for t in group)
+    return size
+
+
+def _wait_download(tablelist: TableList) -> None:
+    """Архив, файлы которого загружались во время скачивания, должен быть скачан до конца"""
+    if isinstance(tablelist, StreamingArchiveTableList):
+        tablelist.wait()
 
 
 def _w_load_data(
-    table: Table,
+    tables: List[Table],
     tablelist: TableList,
     limit: int,
+    writer: Writer,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    schema: Union[str, None] = None,
 ) -> int:
-    loader = TableLoader(limit=limit)
-    loader.load(tablelist=tablelist, table=table)
-    st = Status(region=table.region, table=table.name, ver=tablelist.version)
-    st.save()
+    # Процесс, запущенный через spawn, не наследует настройку соединений
+    use_schema(schema)
+    statuses: List[Status] = []
+    with pool_connections():
+        try:
+            for table in tables:
+                loader = TableLoader(
+                    limit=limit,
+                    writer=writer,
+                    write_workers=write_workers,
+                    write_queue=write_queue,
+                    quarantine=quarantine,
+                    sizing=sizing,
+                )
+                loader.load(tablelist=tablelist, table=table)
+                # Статус таблицы, загружаемой по частям, сохраняется после загрузки всех частей,
+                # статус таблицы из теневой схемы - при её переносе на место рабочей
+                if table.part is None and schema is None:
+                    statuses.append(Status(region=table.region, table=table.name, ver=tablelist.version))
+        finally:
+            # Статусы уже загруженных файлов задачи сохраняются и при ошибке в следующем
+            Status.objects.bulk_create(statuses)
 
-    connections.close_all()
     return 0
 
 
+def _finish_table(
+    tablelist: TableList,
+    tbl: TableName,
+    split: List[Table],
+    restore_indexes: bool,
+    process_pk: bool,
+    shadow: bool,
+    statuses: List[Status],
+    index_workers: int = 1,
+) -> None:
+    """Завершение загрузки таблицы после загрузки всех её файлов"""
+    first_table = tablelist.tables[tbl][0]
+
+    # Все части загружены
+    for t in split:
+        post_import_table.send(sender=TableLoader, table=t)
+        if not shadow:
+            st = Status(region=t.region, table=t.name, ver=tablelist.version)
+            st.save()
+    if shadow:
+        statuses += [Status(region=t.region, table=t.name, ver=tablelist.version) for t in tablelist.tables[tbl]]
+
+    # Восстанавливаем удалённые индексы
+    if shadow:
+        set_logged(first_table.model)
+    if restore_indexes:
+        pre_restore_indexes.send(sender=object.__class__, table=first_table)
+        restore_indexes_for_model(model=first_table.model, pk=process_pk, workers=index_workers)
+        post_restore_indexes.send(sender=object.__class__, table=first_table)
+
+
+def _workers(threads: Union[int, None]) -> int:
+    """Количество процессов пула и потоков основного процесса для построения индексов и исправления данных"""
+    return threads or os.cpu_count() or 1
+
+
+def split_tables(tablelist: TableList, tables: List[Table], split_size: Union[int, None]) -> List[Table]:
+    if not split_size:
+        return tables
+    parts: List[Table] = []
+    for table in tables:
+        parts += table.split(tablelist=tablelist, size=split_size)
+    return parts
+
+
 def load_complete_data(
     path: str | None = None,
     data_format: str = "xml",
@@ -124,6 +429,17 @@ def load_complete_data(
     keep_pk: bool = True,
     tempdir: Union[Path, None] = None,
     threads: Union[int, None] = None,
+    writer: Writer = Writer.ORM,
+    split_size: Union[int, None] = None,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    shadow: bool = False,
+    coalesce_size: Union[int, None] = None,
+    memory_budget: int = 0,
+    fix_chunking: Union[FixChunking, None] = None,
+    index_workers: int = 1,
 ) -> None:
     tablelist = get_tablelist(path=path, data_format=data_format, tempdir=tempdir)
 
@@ -131,6 +447,18 @@ def load_complete_data(
     pre_import.send(sender=object.__class__, version=tablelist.version)
 
     processed: List[TableName] = []
+    statuses: List[Status] = []
+    # Файлы всех таблиц загружаются в общем пуле, остальные шаги запускаются по готовности их данных
+    graph = TaskGraph()
+    ready: Dict[TableName, str] = {}
+
+    # Таблицы строятся заново в теневой схеме, рабочие таблицы не меняются до переноса
+    schema: Union[str, None] = None
+    live_schema = ""
+    if shadow:
+        shadow_tables = [tbl for tbl in get_table_names(tables) if tbl in tablelist.tables]
+        live_schema = prepare_shadow([get_model(tbl) for tbl in shadow_tables])
+        schema = SHADOW_SCHEMA
 
     for tbl in get_table_names(tables):
         # Пропускаем таблицы, которых нет в архиве
@@ -140,7 +468,7 @@ def load_complete_data(
         st_qs = Status.objects.filter(table=tbl)
         if config.REGIONS != config.ALL:
             st_qs = st_qs.filter(region__in=config.REGIONS)
-        if st_qs.exists():
+        if not shadow and st_qs.exists():
             if truncate:
                 st_qs.delete()
             else:
@@ -156,80 +484,139 @@ def load_complete_data(
         processed.append(tbl)
 
         # Очищаем таблицу перед импортом
-        if truncate:
+        if truncate and not shadow:
             first_table.truncate()
 
         process_pk = not keep_pk
 
-        # Удаляем индексы из модели перед импортом
-        if not keep_indexes:
+        # Удаляем индексы из модели перед импортом, в теневой схеме индексы строятся после загрузки всегда
+        restore_indexes = not keep_indexes or shadow
+        if restore_indexes:
             pre_drop_indexes.send(sender=object.__class__, table=first_table)
             remove_indexes_from_model(model=first_table.model, pk=process_pk)
             post_drop_indexes.send(sender=object.__class__, table=first_table)
 
         # Импортируем все таблицы модели
-        worker = partial(_w_load_data, tablelist=tablelist, limit=limit)
+        worker = partial(
+            _w_load_data,
+            tablelist=tablelist,
+            limit=limit,
+            writer=writer,
+            write_workers=write_workers,
+            write_queue=write_queue,
+            quarantine=quarantine,
+            sizing=sizing,
+            schema=schema,
+        )
+        tables_to_load = split_tables(tablelist, tablelist.tables[tbl], split_size)
+        split = [t for t in tablelist.tables[tbl] if t not in tables_to_load]
+        for t in split:
+            pre_import_table.send(sender=TableLoader, table=t)
+
+        loads = [
+            graph.add(
+                f"load:{group[0].label}" if len(group) == 1 else f"load:{tbl}:{i}",
+                partial(worker, group),
+                weight=_task_weight(tablelist, size, group),
+                memory=estimate_memory(
+                    max(t.get_size(tablelist) for t in group), limit, write_workers, write_queue, sizing
+                ),
+            )
+            for i, (size, group) in enumerate(group_tables(tablelist, tables_to_load, coalesce_size))
+        ]
+        ready[tbl] = graph.add(
+            f"finish:{tbl}",
+            partial(_finish_table, tablelist, tbl, split, restore_indexes, process_pk, shadow, statuses, index_workers),
+            loads,
+            local=True,
+        )
 
-        if 1 == threads:
-            for t in tablelist.tables[tbl]:
-                worker(t)
-        else:
-            with ProcessPoolExecutor(max_workers=threads, initializer=django.setup) as executor:
-                print(list(executor.map(worker, tablelist.tables[tbl])))
-
-        # Восстанавливаем удалённые индексы
-        if not keep_indexes:
-            pre_restore_indexes.send(sender=object.__class__, table=first_table)
-            restore_indexes_for_model(model=first_table.model, pk=process_pk)
-            post_restore_indexes.send(sender=object.__class__, table=first_table)
-
-    logger.info("Update tree version.")
-    update_tree_ver(processed, 0)
-    logger.info("Remove deactivated records.")
-    remove_not_active(processed)
-    logger.info("Remove orphans.")
-    remove_orphans(processed)
+    add_fix_tasks(graph, processed, 0, ready, chunking=fix_chunking)
+    logger.info("Load tables, update tree version, remove deactivated records and orphans.")
+    if 1 == threads:
+        graph.run()
+    else:
+        with ProcessPoolExecutor(max_workers=threads, initializer=django.setup) as executor:
+            graph.run(
+                executor,
+                local_workers=_workers(threads),
+                pool_workers=_workers(threads),
+                memory_budget=memory_budget,
+            )
+    _wait_download(tablelist)
+
+    # Данные загруженных таблиц исправлены целиком
+    if shadow:
+        for st in statuses:
+            st.fixed_ver = tablelist.version.ver
+        swap_shadow(live_schema, [get_model(tbl) for tbl in shadow_tables], statuses)
+    else:
+        mark_fixed(processed)
 
     post_import.send(sender=object.__class__, version=tablelist.version)
     logger.info(f"Data v.{tablelist.version} loaded.")
 
 
 def _w_update_data(
-    table: Table,
+    tables: List[Table],
     tablelist: TableList,
     skip: bool,
     limit: int,
+    writer: Writer,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
 ) -> int:
-    try:
-        st = Status.objects.get(table=table.name, region=table.region)
-    except Status.DoesNotExist:
-        logger.info(f"Can not update table `{table.name}`, region `{table.region}`: no data in database. Skipping…")
-        return 1
-    if st.ver.ver >= tablelist.version.ver:
-        logger.info(
-            (
-                f"Update of the table `{table.name}` is not needed "
-                f"[{st.ver.ver} >= {tablelist.version.ver}]. Skipping…"
-            )
-        )
-        return 1
-    loader = TableUpdater(limit=limit)
-    try:
-        loader.load(tablelist=tablelist, table=table)
-    except BadTableError as e:
-        if skip:
-            logger.error(str(e))
-        else:
-            raise
-    st.ver = tablelist.version
-    st.save()
-
-    connections.close_all()
-    return 0
+    statuses: List[Status] = []
+    with pool_connections():
+        try:
+            for table in tables:
+                try:
+                    st = Status.objects.get(table=table.name, region=table.region)
+                except Status.DoesNotExist:
+                    logger.info(
+                        f"Can not update table `{table.name}`, region `{table.region}`: "
+                        "no data in database. Skipping…"
+                    )
+                    continue
+                if st.ver.ver >= tablelist.version.ver:
+                    logger.info(
+                        (
+                            f"Update of the table `{table.name}` is not needed "
+                            f"[{st.ver.ver} >= {tablelist.version.ver}]. Skipping…"
+                        )
+                    )
+                    continue
+                if isinstance(table, NetChangeTable):
+                    # Дельты, уже применённые к таблице, не применяются повторно
+                    table = table.after(st.ver.ver)
+                loader = TableUpdater(
+                    limit=limit,
+                    writer=writer,
+                    write_workers=write_workers,
+                    write_queue=write_queue,
+                    quarantine=quarantine,
+                    sizing=sizing,
+                )
+                try:
+                    loader.load(tablelist=tablelist, table=table)
+                except BadTableError as e:
+                    if skip:
+                        logger.error(str(e))
+                    else:
+                        raise
+                st.ver = tablelist.version
+                statuses.append(st)
+        finally:
+            # Версии уже обновлённых файлов задачи сохраняются и при ошибке в следующем
+            Status.objects.bulk_update(statuses, ["ver"])
+
+    return 0 if len(statuses) == len(tables) else 1
 
 
 def update_data(
-    path: Union[Path, None] = None,
+    path: Union[Path, str, None] = None,
     version: Union[Version, None] = None,
     skip: bool = False,
     data_format: str = "xml",
@@ -237,12 +624,30 @@ def update_data(
     tables: Union[Tuple[TableName, ...], None] = None,
     tempdir: Union[Path, None] = None,
     threads: Union[int, None] = None,
+    writer: Writer = Writer.ORM,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    executor: Union[Executor, None] = None,
+    coalesce_size: Union[int, None] = None,
+    memory_budget: int = 0,
 ) -> Tuple[List[TableName], int]:
     tablelist = get_tablelist(path=path, version=version, data_format=data_format, tempdir=tempdir)
 
-    worker = partial(_w_update_data, tablelist=tablelist, skip=skip, limit=limit)
+    worker = partial(
+        _w_update_data,
+        tablelist=tablelist,
+        skip=skip,
+        limit=limit,
+        writer=writer,
+        write_workers=write_workers,
+        write_queue=write_queue,
+        quarantine=quarantine,
+        sizing=sizing,
+    )
 
-    tables_to_process: List[Table] = []
+    graph = TaskGraph()
     processed: List[TableName] = []
     for tbl in get_table_names(tables):
         # Пропускаем таблицы, которых нет в архиве
@@ -250,27 +655,153 @@ def update_data(
             continue
 
         processed.append(tbl)
-        tables_to_process += tablelist.tables[tbl]
+        for i, (size, group) in enumerate(group_tables(tablelist, tablelist.tables[tbl], coalesce_size)):
+            graph.add(
+                f"update:{group[0].label}" if len(group) == 1 else f"update:{tbl}:{i}",
+                partial(worker, group),
+                weight=_task_weight(tablelist, size, group),
+                memory=estimate_memory(
+                    max(t.get_size(tablelist) for t in group), limit, write_workers, write_queue, sizing
+                ),
+            )
 
-    if 1 == threads:
-        for t in tables_to_process:
-            worker(t)
+    _run_update(graph, executor, threads, memory_budget)
+    _wait_download(tablelist)
+    return processed, tablelist.version.ver
+
+
+def _run_update(
+    graph: TaskGraph, executor: Union[Executor, None], threads: Union[int, None], memory_budget: int
+) -> None:
+    run = partial(graph.run, pool_workers=_workers(threads), memory_budget=memory_budget)
+    if executor is None and 1 != threads:
+        with update_executor(threads) as own_executor:
+            run(own_executor)
     else:
-        with ProcessPoolExecutor(
-            max_workers=threads, initializer=django.setup, mp_context=multiprocessing.get_context("spawn")
-        ) as executor:
-            print(list(executor.map(worker, tables_to_process)))
+        run(executor)
 
-    return processed, tablelist.version.ver
+
+def update_net_data(
+    sources: List[Tuple[Version, Union[Path, str]]],
+    skip: bool = False,
+    data_format: str = "xml",
+    limit: int = 10000,
+    tables: Union[Tuple[TableName, ...], None] = None,
+    tempdir: Union[Path, None] = None,
+    threads: Union[int, None] = None,
+    writer: Writer = Writer.ORM,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    executor: Union[Executor, None] = None,
+    coalesce_size: Union[int, None] = None,
+    memory_budget: int = 0,
+) -> Tuple[List[TableName], int]:
+    """
+    Применяет несколько дельт одним проходом: для каждой таблицы региона из всех дельт остаётся
+    только последняя версия каждой записи, а статус таблицы сразу переходит к последней версии.
+    Возвращает обработанные таблицы и первую из применённых версий
+    """
+    tablelists: List[TableList] = []
+    for i, (version, src) in enumerate(sources):
+        # Архивы дельт разных версий называются одинаково и должны быть открыты одновременно,
+        # поэтому каждая скачиваемая дельта получает свой каталог
+        part_tempdir = tempdir
+        if tempdir is not None and isinstance(src, str):
+            part_tempdir = tempdir / f"{i:04d}"
+            part_tempdir.mkdir(exist_ok=True)
+        tablelists.append(get_tablelist(path=src, version=version, data_format=data_format, tempdir=part_tempdir))
+    tablelist = tablelists[-1]
+
+    worker = partial(
+        _w_update_data,
+        tablelist=tablelist,
+        skip=skip,
+        limit=limit,
+        writer=writer,
+        write_workers=write_workers,
+        write_queue=write_queue,
+        quarantine=quarantine,
+        sizing=sizing,
+    )
+
+    graph = TaskGraph()
+    processed: List[TableName] = []
+    for tbl in get_table_names(tables):
+        parts: Dict[Tuple[Union[str, None], bool], List[Tuple[TableList, Table]]] = {}
+        for part_tablelist in tablelists:
+            for table in part_tablelist.tables.get(tbl, []):
+                parts.setdefault((table.region, table.deleted), []).append((part_tablelist, table))
+        # Пропускаем таблицы, которых нет ни в одном архиве
+        if not parts:
+            continue
+
+        processed.append(tbl)
+        net_tables: List[Table] = [NetChangeTable(list(p)) for p in parts.values()]
+        for i, (size, group) in enumerate(group_tables(tablelist, net_tables, coalesce_size)):
+            graph.add(
+                f"update:{group[0].label}" if len(group) == 1 else f"update:{tbl}:{i}",
+                partial(worker, group),
+                weight=size,
+                # Итоговые изменения таблицы собираются в памяти целиком
+                memory=WORKER_BASE_MEMORY
+                + (max(t.get_size(tablelist) for t in group) // XML_RECORD_SIZE + 1) * RECORD_MEMORY,
+            )
+
+    _run_update(graph, executor, threads, memory_budget)
+    for part_tablelist in tablelists:
+        _wait_download(part_tablelist)
+    return processed, tablelists[0].version.ver
+
+
+def _apply_deltas(group: List[Tuple[Version, Union[Path, str]]], **kwargs: Any) -> Tuple[List[TableName], int]:
+    if len(group) > 1:
+        return update_net_data(sources=group, **kwargs)
+    version, src = group[0]
+    return update_data(path=src, version=version, **kwargs)
 
 
-def fix_data(tables: List[TableName], min_ver: int) -> None:
-    logger.info("Update tree version.")
-    update_tree_ver(tables, min_ver)
-    logger.info("Remove deactivated records.")
-    remove_not_active(tables)
-    logger.info("Remove orphans.")
-    remove_orphans(tables)
+def _group_deltas(
+    deltas: Iterable[Tuple[Version, Union[Path, str]]], consolidate: int
+) -> Iterator[List[Tuple[Version, Union[Path, str]]]]:
+    """Группы подряд идущих дельт, применяемых вместе; без объединения - по одной дельте"""
+    group: List[Tuple[Version, Union[Path, str]]] = []
+    for delta in deltas:
+        group.append(delta)
+        if len(group) >= max(1, consolidate):
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+@contextmanager
+def update_executor(threads: Union[int, None]) -> Iterator[Union[Executor, None]]:
+    """Общий пул процессов для обновления из нескольких дельт"""
+    if 1 == threads:
+        yield None
+        return
+    with ProcessPoolExecutor(
+        max_workers=threads, initializer=django.setup, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        yield executor
+
+
+def fix_data(
+    tables: List[TableName],
+    min_ver: int,
+    threads: Union[int, None] = 1,
+    chunking: Union[FixChunking, None] = None,
+) -> None:
+    logger.info("Update tree version, remove deactivated records and orphans.")
+    tables = [tbl for tbl in TableName if tbl in tables]
+    graph = TaskGraph()
+    # После обновления исправляются только записи, изменённые после прошлого исправления
+    scope = FixScope() if min_ver and FIX_SCOPE_LIMIT else None
+    add_fix_tasks(graph, tables, min_ver, scope=scope, chunking=chunking)
+    graph.run(local_workers=1 if 1 == threads else _workers(threads))
+    mark_fixed(tables)
 
 
 def _get_min_version() -> Union[int, None]:
@@ -287,6 +818,15 @@ def manual_update_data(
     tables: Union[Tuple[TableName, ...], None] = None,
     tempdir: Union[Path, None] = None,
     threads: Union[int, None] = None,
+    writer: Writer = Writer.ORM,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    coalesce_size: Union[int, None] = None,
+    memory_budget: int = 0,
+    consolidate: int = 0,
+    fix_chunking: Union[FixChunking, None] = None,
 ) -> Union[int, None]:
     min_version = _get_min_version()
 
@@ -302,41 +842,68 @@ def manual_update_data(
 
         min_ver = Version.objects.get(ver=min_version)
 
+        deltas: List[Tuple[Version, Union[Path, str]]] = []
+        missing: Union[Version, None] = None
         for version in Version.objects.filter(ver__gt=min_version).order_by("ver"):
             try:
-                src = version_map[version]
+                deltas.append((version, version_map[version]))
             except KeyError:
-                if least_version is not None:
-                    fix_data(list(processed), least_version)
-                raise TableListLoadingError(f"No file for version {version}.")
-
-            logger.info(f"Updating from v.{min_ver} to v.{version}.")
-            pre_update.send(sender=object.__class__, before=min_ver, after=version)
-
-            c_processed, c_ver = update_data(
-                path=src,
-                version=version,
-                skip=skip,
-                data_format=data_format,
-                limit=limit,
-                tables=tables,
-                tempdir=tempdir,
-                threads=threads,
-            )
-            processed |= set(c_processed)
-            if least_version is None:
-                least_version = c_ver
-
-            post_update.send(sender=object.__class__, before=min_ver, after=version)
-            logger.info(f"Data v.{min_ver} is updated to v.{version}.")
-            min_ver = version
+                missing = version
+                break
+
+        with update_executor(threads) as executor:
+            for group in _group_deltas(deltas, consolidate):
+                version = group[-1][0]
+                logger.info(f"Updating from v.{min_ver} to v.{version}.")
+                pre_update.send(sender=object.__class__, before=min_ver, after=version)
+
+                c_processed, c_ver = _apply_deltas(
+                    group,
+                    skip=skip,
+                    data_format=data_format,
+                    limit=limit,
+                    tables=tables,
+                    tempdir=tempdir,
+                    threads=threads,
+                    writer=writer,
+                    write_workers=write_workers,
+                    write_queue=write_queue,
+                    quarantine=quarantine,
+                    sizing=sizing,
+                    executor=executor,
+                    coalesce_size=coalesce_size,
+                    memory_budget=memory_budget,
+                )
+                processed |= set(c_processed)
+                if least_version is None:
+                    least_version = c_ver
+
+                post_update.send(sender=object.__class__, before=min_ver, after=version)
+                logger.info(f"Data v.{min_ver} is updated to v.{version}.")
+                min_ver = version
+
+        if missing is not None:
+            if least_version is not None:
+                fix_data(list(processed), least_version, threads, fix_chunking)
+            raise TableListLoadingError(f"No file for version {missing}.")
         if least_version is not None:
-            fix_data(list(processed), least_version)
+            fix_data(list(processed), least_version, threads, fix_chunking)
         return least_version
     else:
         raise TableListLoadingError("Not available. Please import the data before updating")
 
 
+def _delta_sources(
+    urls: List[str], tempdir: Union[Path, None], prefetch: int
+) -> Generator[Union[str, Path], None, None]:
+    """Источники дельт по порядку версий: адреса или архивы, скачанные заранее в фоне"""
+    # Выборочно читаемые и загружаемые во время скачивания архивы не скачиваются заранее
+    if prefetch and not any(is_selective(url) or is_streaming(url) for url in urls):
+        yield from prefetch_archives(urls, tempdir=tempdir, lookahead=prefetch)
+    else:
+        yield from urls
+
+
 def auto_update_data(
     skip: bool,
     data_format: str = "xml",
@@ -344,6 +911,16 @@ def auto_update_data(
     tables: Union[Tuple[TableName, ...] | None] = None,
     tempdir: Union[Path, None] = None,
     threads: Union[int, None] = None,
+    writer: Writer = Writer.ORM,
+    write_workers: int = 0,
+    write_queue: int = 2,
+    quarantine: Union[Path, None] = None,
+    sizing: Union[BatchSizing, None] = None,
+    coalesce_size: Union[int, None] = None,
+    memory_budget: int = 0,
+    prefetch: int = 0,
+    consolidate: int = 0,
+    fix_chunking: Union[FixChunking, None] = None,
 ) -> Union[int, None]:
     min_version = _get_min_version()
 
@@ -353,31 +930,45 @@ def auto_update_data(
         processed = set()
         least_version = None
 
-        for version in Version.objects.filter(ver__gt=min_version).order_by("ver"):
-            pre_update.send(sender=object.__class__, before=min_ver, after=version)
-
-            url = getattr(version, "delta_{0}_url".format(data_format))
-            c_processed, c_ver = update_data(
-                path=url,
-                version=version,
-                skip=skip,
-                data_format=data_format,
-                limit=limit,
-                tables=tables,
-                tempdir=tempdir,
-                threads=threads,
-            )
+        versions = list(Version.objects.filter(ver__gt=min_version).order_by("ver"))
+        urls = [getattr(version, "delta_{0}_url".format(data_format)) for version in versions]
+        # Следующие дельты скачиваются, пока применяется текущая; применяются строго по порядку версий.
+        # Объединяемые дельты открываются одновременно, поэтому заранее не скачиваются
+        if consolidate > 1:
+            prefetch = 0
+        with update_executor(threads) as executor, closing(_delta_sources(urls, tempdir, prefetch)) as sources:
+            for group in _group_deltas(zip(versions, sources), consolidate):
+                version = group[-1][0]
+                pre_update.send(sender=object.__class__, before=min_ver, after=version)
+
+                c_processed, c_ver = _apply_deltas(
+                    group,
+                    skip=skip,
+                    data_format=data_format,
+                    limit=limit,
+                    tables=tables,
+                    tempdir=tempdir,
+                    threads=threads,
+                    writer=writer,
+                    write_workers=write_workers,
+                    write_queue=write_queue,
+                    quarantine=quarantine,
+                    sizing=sizing,
+                    executor=executor,
+                    coalesce_size=coalesce_size,
+                    memory_budget=memory_budget,
+                )
 
-            processed |= set(c_processed)
-            if least_version is None:
-                least_version = c_ver
+                processed |= set(c_processed)
+                if least_version is None:
+                    least_version = c_ver
 
-            post_update.send(sender=object.__class__, before=min_ver, after=version)
-            logger.info(f"Data v.{min_ver} is updated to v.{version}.")
-            min_ver = version
+                post_update.send(sender=object.__class__, before=min_ver, after=version)
+                logger.info(f"Data v.{min_ver} is updated to v.{version}.")
+                min_ver = version
 
         if least_version is not None:
-            fix_data(list(processed), least_version)
+            fix_data(list(processed), least_version, threads, fix_chunking)
         return least_version
     else:
         raise TableListLoadingError("Not available. Please import the data before updating")
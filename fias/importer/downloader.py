@@ -1,18 +1,134 @@
 import contextlib
+import io
+import json
+import os
 import tempfile
-from http.client import HTTPMessage
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.client import HTTPException, HTTPMessage
 from pathlib import Path
-from typing import IO, Callable, List, Tuple
-from urllib.error import ContentTooShortError
+from threading import Event, Lock
+from typing import IO, Any, Callable, List, Tuple
+from urllib.error import ContentTooShortError, HTTPError
 from urllib.request import Request, urlopen
 
 
+def probe_range(url: str, timeout: float = 60.0) -> Tuple[int | None, HTTPMessage]:
+    """Размер файла, если сервер поддерживает запросы диапазонов"""
+    with contextlib.closing(urlopen(Request(url, headers={"Range": "bytes=0-0"}), timeout=timeout)) as fp:
+        headers: HTTPMessage = fp.info()
+        if fp.status != 206 or "content-range" not in headers:
+            return None, headers
+        total = headers["content-range"].split("/")[-1]
+        return (int(total) if total.isdigit() else None), headers
+
+
+class RangeNotSupportedError(Exception):
+    pass
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Файл на HTTP-сервере с произвольным доступом через запросы диапазонов.
+    Последовательное чтение продолжает открытый ответ, а следующий диапазон запрашивается вдвое большим
+    (до max_window); переход в другое место открывает новый запрос с min_window
+    """
+
+    min_window = 64 * 1024
+    max_window = 64 * 1024 * 1024
+
+    def __init__(self, url: str, retries: int = 5, timeout: float = 60.0):
+        super().__init__()
+        self.url = url
+        self.retries = retries
+        self.timeout = timeout
+        size, _ = probe_range(url, timeout=timeout)
+        if size is None:
+            raise RangeNotSupportedError(f"Server does not support range requests for `{url}`")
+        self.size = size
+        self._pos = 0
+        self._response: Any = None
+        self._response_pos = 0
+        self._response_end = 0
+        self._window = self.min_window
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def _close_response(self) -> None:
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def readinto(self, buffer: Any) -> int:
+        size = min(len(buffer), self.size - self._pos)
+        if size <= 0:
+            return 0
+        retries = self.retries
+        while True:
+            try:
+                if self._response is None or self._response_pos != self._pos or self._pos >= self._response_end:
+                    sequential = self._response is not None and self._response_pos == self._pos
+                    self._close_response()
+                    self._window = min(self._window * 2, self.max_window) if sequential else self.min_window
+                    end = min(self._pos + max(self._window, size), self.size)
+                    request = Request(self.url, headers={"Range": f"bytes={self._pos}-{end - 1}"})
+                    self._response = urlopen(request, timeout=self.timeout)
+                    self._response_pos = self._pos
+                    self._response_end = end
+                    if self._response.status != 206:
+                        raise RangeNotSupportedError(f"Server ignored range request for `{self.url}`")
+                read = self._response.readinto(memoryview(buffer)[: min(size, self._response_end - self._pos)])
+                if not read:
+                    raise HTTPException(f"retrieval incomplete at {self._pos} of {self.size}")
+            except HTTPError:
+                raise
+            except (HTTPException, OSError):
+                self._close_response()
+                retries -= 1
+                if retries <= 0:
+                    raise
+                continue
+            self._pos += read
+            self._response_pos = self._pos
+            return int(read)
+
+    def close(self) -> None:
+        self._close_response()
+        super().close()
+
+
 class Downloader:
     class RetriesExceededError(Exception):
         pass
 
     _url_temp_files: List[Path]
 
+    # Сегментное скачивание: сегмент не меньше min_segment_size, буфер чтения растёт от min до max_buffer_size
+    min_segment_size = 64 * 1024 * 1024
+    min_buffer_size = 64 * 1024
+    max_buffer_size = 4 * 1024 * 1024
+    # Интервалы, секунд: вызова reporthook, сохранения состояния сегментов; время ожидания ответа сервера
+    progress_interval = 0.5
+    state_interval = 5.0
+    timeout = 60.0
+
     def __init__(self) -> None:
         super().__init__()
         self._url_temp_files = []
@@ -97,8 +213,142 @@ class Downloader:
                 return self._get(url, tfp, file_name, is_new, reporthook)
             except ContentTooShortError:
                 retries -= 1
+                # Файл закрыт после обрыва, докачиваем с места обрыва
+                tfp, file_name, is_new = self._open_file(file_name, append_file=True)
         raise self.RetriesExceededError()
 
+    def _split(self, size: int, segments: int) -> List[List[int]]:
+        count = max(1, min(segments, size // self.min_segment_size))
+        bounds = [size * i // count for i in range(count + 1)]
+        # Сегмент: начало, конец (не включая), скачано байт
+        return [[bounds[i], bounds[i + 1], 0] for i in range(count)]
+
+    @staticmethod
+    def _state_path(file_name: Path) -> Path:
+        return file_name.with_name(file_name.name + ".segments")
+
+    def _load_state(self, file_name: Path, url: str, size: int, validator: str) -> List[List[int]] | None:
+        try:
+            if file_name.stat().st_size != size:
+                return None
+            state = json.loads(self._state_path(file_name).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != size or state.get("validator") != validator:
+            return None
+        segments: List[List[int]] = state["segments"]
+        return segments
+
+    def _save_state(self, file_name: Path, url: str, size: int, validator: str, segments: List[List[int]]) -> None:
+        state_path = self._state_path(file_name)
+        tmp_path = state_path.with_name(state_path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"url": url, "size": size, "validator": validator, "segments": segments}), encoding="utf-8"
+        )
+        os.replace(tmp_path, state_path)
+
+    def _get_segment(
+        self, url: str, file_name: Path, segment: List[int], lock: Lock, stop: Event, retries: int
+    ) -> None:
+        start, end = segment[0], segment[1]
+        buffer_size = self.min_buffer_size
+        # Без буферизации: скачанными в состоянии считаются только байты, переданные ОС
+        with file_name.open("r+b", buffering=0) as f:
+            while start + segment[2] < end and not stop.is_set():
+                offset = start + segment[2]
+                request = Request(url, headers={"Range": f"bytes={offset}-{end - 1}"})
+                try:
+                    with contextlib.closing(urlopen(request, timeout=self.timeout)) as fp:
+                        if fp.status != 206:
+                            raise HTTPException(f"range request is not supported, status {fp.status}")
+                        f.seek(offset)
+                        while offset < end and not stop.is_set():
+                            started = time.monotonic()
+                            block = memoryview(fp.read(min(buffer_size, end - offset)))
+                            if not block:
+                                break
+                            # Быстро заполненный буфер увеличивается: меньше системных вызовов на гигабайт
+                            if len(block) == buffer_size and time.monotonic() - started < 0.1:
+                                buffer_size = min(buffer_size * 2, self.max_buffer_size)
+                            while block:
+                                written = f.write(block)
+                                block = block[written:]
+                                offset += written
+                                with lock:
+                                    segment[2] += written
+                    if offset < end and not stop.is_set():
+                        raise HTTPException(f"segment retrieval incomplete at {offset} of {end}")
+                except HTTPError:
+                    raise
+                except (HTTPException, OSError):
+                    retries -= 1
+                    if retries <= 0:
+                        raise self.RetriesExceededError()
+
+    def download_segmented(
+        self,
+        url: str,
+        file_name: Path | None = None,
+        segments: int = 4,
+        reporthook: Callable[[int, int, int], None] | None = None,
+        retries: int = 5,
+    ) -> Tuple[Path, HTTPMessage]:
+        """
+        Скачивает файл несколькими параллельными запросами диапазонов в заранее выделенный файл.
+        Состояние сегментов сохраняется рядом с файлом, прерванное скачивание в тот же файл продолжается
+        с места остановки каждого сегмента. Если сервер не поддерживает диапазоны - скачивает одним потоком
+        """
+        size, headers = probe_range(url, timeout=self.timeout)
+        if size is None or segments < 2:
+            return self.download(url, file_name=file_name, reporthook=reporthook, retries=retries)
+
+        if file_name is None:
+            tfp, file_name, _ = self._open_file()
+            tfp.close()
+        validator = headers.get("ETag") or headers.get("Last-Modified") or ""
+        loaded = self._load_state(file_name, url, size, validator)
+        if loaded is not None:
+            state = loaded
+        else:
+            state = self._split(size, segments)
+            with file_name.open("wb") as f:
+                f.truncate(size)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(f.fileno(), 0, size)
+            self._save_state(file_name, url, size, validator, state)
+
+        lock = Lock()
+        stop = Event()
+
+        def snapshot() -> Tuple[int, List[List[int]]]:
+            with lock:
+                return sum(s[2] for s in state), [list(s) for s in state]
+
+        with ThreadPoolExecutor(max_workers=len(state), thread_name_prefix="fias-download") as executor:
+            futures = [executor.submit(self._get_segment, url, file_name, s, lock, stop, retries) for s in state]
+            saved = time.monotonic()
+            try:
+                while True:
+                    done, not_done = wait(futures, timeout=self.progress_interval)
+                    for future in done:
+                        future.result()
+                    downloaded, segments_state = snapshot()
+                    if reporthook:
+                        reporthook(downloaded, 1, size)
+                    if not not_done:
+                        break
+                    if time.monotonic() - saved >= self.state_interval:
+                        self._save_state(file_name, url, size, validator, segments_state)
+                        saved = time.monotonic()
+            except BaseException:
+                stop.set()
+                wait(futures)
+                self._save_state(file_name, url, size, validator, snapshot()[1])
+                raise
+
+        self._state_path(file_name).unlink(True)
+        return file_name, headers
+
     def urlcleanup(self) -> None:
         for temp_file in self._url_temp_files:
             try:
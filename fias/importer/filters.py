@@ -1,28 +1,31 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals
 
-from typing import Union
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, List, Protocol, Union
 
 from fias import config
 from fias.config import PARAM_MAP, TableName
-from fias.models import AddrObj, AddrObjParam, House, HouseParam
-from fias.models.common import AbstractObj
-from fias.models.hierarchy import AbstractHierarchy
+from fias.importer.record import Record
 
+# Фильтры получают не экземпляры моделей, а записи Record с теми же атрибутами.
 
-def filter_is_actual(item: AbstractObj) -> Union[AbstractObj, None]:
+ItemFilter = Callable[[Record], Union[Record, None]]
+
+
+def filter_is_actual(item: Record) -> Union[Record, None]:
     if item.isactual:
         return item
     return None
 
 
-def filter_is_active(item: AbstractHierarchy) -> Union[AbstractHierarchy, None]:
+def filter_is_active(item: Record) -> Union[Record, None]:
     if item.isactive:
         return item
     return None
 
 
-def filter_house_type(item: House) -> Union[House, None]:
+def filter_house_type(item: Record) -> Union[Record, None]:
     if config.HOUSE_TYPES == config.ALL or item.housetype is not None and item.housetype in config.HOUSE_TYPES:
         return item
     return None
@@ -31,7 +34,7 @@ def filter_house_type(item: House) -> Union[House, None]:
 _house_param_ids = {p_id for p_id, _ in PARAM_MAP[TableName.HOUSE_PARAM][1]}
 
 
-def filter_house_param(item: HouseParam) -> Union[HouseParam, None]:
+def filter_house_param(item: Record) -> Union[Record, None]:
     if item.typeid in _house_param_ids:
         return item
     return None
@@ -40,12 +43,183 @@ def filter_house_param(item: HouseParam) -> Union[HouseParam, None]:
 _addr_obj_param_ids = {p_id for p_id, _ in PARAM_MAP[TableName.ADDR_OBJ_PARAM][1]}
 
 
-def filter_addr_obj_param(item: AddrObjParam) -> Union[AddrObjParam, None]:
+def filter_addr_obj_param(item: Record) -> Union[Record, None]:
     if item.typeid in _addr_obj_param_ids:
         return item
     return None
 
 
-def replace_quotes_in_names(item: AddrObj) -> AddrObj:
+def replace_quotes_in_names(item: Record) -> Record:
     item.name = item.name.replace("&quot;", '"')
     return item
+
+
+"""
+Предикаты для строк XML до их преобразования в записи.
+Получают исходные строковые значения атрибутов и отбрасывают строку, только если
+соответствующий фильтр гарантированно её отбросит. Если атрибута нет или значение
+нельзя разобрать, строка пропускается дальше, и решение принимает обычный фильтр.
+"""
+
+
+class RawRow(Protocol):
+    def get(self, key: str) -> Union[str, None]:
+        ...
+
+
+RawPredicate = Callable[[RawRow], bool]
+
+# Так же, как при разборе BooleanField в XMLIterator
+_raw_true_values = frozenset(("1", "y", "yes", "t", "true", "on", "+"))
+
+
+def _raw_bool(value: Union[str, None]) -> bool:
+    return value is None or value in _raw_true_values
+
+
+def _raw_int_in(value: Union[str, None], ids: Union[Iterable[int], str]) -> bool:
+    if value is None:
+        return True
+    try:
+        return int(value) in ids
+    except ValueError:
+        return True
+
+
+def raw_is_actual(row: RawRow) -> bool:
+    return _raw_bool(row.get("ISACTUAL"))
+
+
+def raw_is_active(row: RawRow) -> bool:
+    return _raw_bool(row.get("ISACTIVE"))
+
+
+def raw_house_type(row: RawRow) -> bool:
+    if config.HOUSE_TYPES == config.ALL:
+        return True
+    value = row.get("HOUSETYPE")
+    # Пустое значение превращается в None и отбрасывается filter_house_type
+    return value != "" and _raw_int_in(value, config.HOUSE_TYPES)
+
+
+def raw_house_param(row: RawRow) -> bool:
+    return _raw_int_in(row.get("TYPEID"), _house_param_ids)
+
+
+def raw_addr_obj_param(row: RawRow) -> bool:
+    return _raw_int_in(row.get("TYPEID"), _addr_obj_param_ids)
+
+
+RAW_FILTERS: Dict[ItemFilter, RawPredicate] = {
+    filter_is_actual: raw_is_actual,
+    filter_is_active: raw_is_active,
+    filter_house_type: raw_house_type,
+    filter_house_param: raw_house_param,
+    filter_addr_obj_param: raw_addr_obj_param,
+}
+
+
+"""
+Фильтры пачек записей.
+Фильтр получает список записей и возвращает маску: True - запись остаётся, False - отбрасывается.
+Фильтр может изменять записи и заменять элементы списка, но не менять его длину.
+Пользовательский фильтр, помеченный декоратором batch_filter, получает сразу всю пачку,
+остальные фильтры вызываются для каждой записи через as_batch_filter.
+"""
+
+BatchFilter = Callable[[List[Record]], List[bool]]
+
+
+def batch_filter(func: BatchFilter) -> BatchFilter:
+    setattr(func, "batch", True)
+    return func
+
+
+def is_batch_filter(func: Callable[..., Any]) -> bool:
+    return bool(getattr(func, "batch", False))
+
+
+_get_isactual = attrgetter("isactual")
+_get_isactive = attrgetter("isactive")
+_get_housetype = attrgetter("housetype")
+_get_typeid = attrgetter("typeid")
+
+
+@batch_filter
+def batch_is_actual(items: List[Record]) -> List[bool]:
+    return list(map(bool, map(_get_isactual, items)))
+
+
+@batch_filter
+def batch_is_active(items: List[Record]) -> List[bool]:
+    return list(map(bool, map(_get_isactive, items)))
+
+
+@batch_filter
+def batch_house_type(items: List[Record]) -> List[bool]:
+    house_types = config.HOUSE_TYPES
+    if house_types == config.ALL:
+        return [True] * len(items)
+    return [t is not None and t in house_types for t in map(_get_housetype, items)]
+
+
+@batch_filter
+def batch_house_param(items: List[Record]) -> List[bool]:
+    return [t in _house_param_ids for t in map(_get_typeid, items)]
+
+
+@batch_filter
+def batch_addr_obj_param(items: List[Record]) -> List[bool]:
+    return [t in _addr_obj_param_ids for t in map(_get_typeid, items)]
+
+
+@batch_filter
+def batch_replace_quotes_in_names(items: List[Record]) -> List[bool]:
+    for item in items:
+        item.name = item.name.replace("&quot;", '"')
+    return [True] * len(items)
+
+
+BATCH_FILTERS: Dict[ItemFilter, BatchFilter] = {
+    filter_is_actual: batch_is_actual,
+    filter_is_active: batch_is_active,
+    filter_house_type: batch_house_type,
+    filter_house_param: batch_house_param,
+    filter_addr_obj_param: batch_addr_obj_param,
+    replace_quotes_in_names: batch_replace_quotes_in_names,
+}
+
+
+def as_batch_filter(func: Callable[..., Any]) -> BatchFilter:
+    if is_batch_filter(func):
+        return func
+    try:
+        return BATCH_FILTERS[func]
+    except KeyError:
+        pass
+
+    item_filter: ItemFilter = func
+
+    def filter_items(items: List[Record]) -> List[bool]:
+        mask = []
+        for i, item in enumerate(items):
+            filtered_item = item_filter(item)
+            if filtered_item is not None and filtered_item is not item:
+                items[i] = filtered_item
+            mask.append(filtered_item is not None)
+        return mask
+
+    return filter_items
+
+
+def as_item_filter(func: Callable[..., Any]) -> ItemFilter:
+    if not is_batch_filter(func):
+        return func
+
+    items_filter: BatchFilter = func
+
+    def filter_item(item: Record) -> Union[Record, None]:
+        items = [item]
+        return items[0] if items_filter(items)[0] else None
+
+    return filter_item
@@ -0,0 +1,115 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import logging
+from typing import Dict, Iterable, List, Set, Type, Union, cast
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, F, Min, Q
+
+from fias import config
+from fias.config import TableName
+from fias.importer.table import get_model, get_table_refs
+from fias.models import AbstractIsActiveModel, Status
+
+__all__ = ["FIX_SCOPE_LIMIT", "FixScope", "get_child_tables", "mark_fixed", "forget_fixed"]
+
+logger = logging.getLogger(__name__)
+
+# Предельное количество затронутых ключей таблицы, при котором исправление данных ограничивается ими,
+# 0 - исправление всегда выполняется по всей таблице
+FIX_SCOPE_LIMIT: int = getattr(settings, "FIAS_FIX_SCOPE_LIMIT", 100000)
+
+
+def get_child_tables(table: TableName) -> List[TableName]:
+    """Обрабатываемые таблицы, записи которых ссылаются на записи таблицы"""
+    return [tbl for tbl in config.TABLES if table in get_table_refs(tbl)]
+
+
+def mark_fixed(tables: Iterable[TableName]) -> None:
+    """Запоминает, что данные таблиц исправлены по их текущие версии"""
+    Status.objects.filter(table__in=list(tables)).update(fixed_ver=F("ver"))
+
+
+def forget_fixed(tables: Iterable[TableName]) -> None:
+    """Версия исправления таблиц становится неизвестной: при следующем исправлении они проверяются целиком"""
+    Status.objects.filter(table__in=list(tables)).update(fixed_ver=None)
+
+
+class FixScope(object):
+    """
+    Записи, по которым исправляются данные вместо полного просмотра таблиц. Загрузчик записывает
+    в каждую строку версию дельты, а после исправления данных в статусах таблицы запоминается версия,
+    по которую они исправлены (fixed_ver). Поэтому непроверенные строки - строки с версией больше неё
+    (поле ver проиндексировано), в том числе оставшиеся от прерванных запусков. Записи, ссылающиеся
+    на удаляемые неактивные объекты, удаляются в одной транзакции с ними; если неактивные объекты
+    удаляются по всей таблице, версия исправления ссылающихся таблиц до окончания исправления
+    становится неизвестной. Если версия исправления неизвестна или ключей больше limit, таблица
+    исправляется целиком. Шаги одной таблицы выполняются по очереди, поэтому блокировки не нужны
+    """
+
+    def __init__(self, limit: int = FIX_SCOPE_LIMIT):
+        self.limit = limit
+        # Ключи объектов, удалённых как неактивные; None - их слишком много
+        self.deleted: Dict[TableName, Union[Set[int], None]] = {}
+        self._fixed: Dict[TableName, Union[int, None]] = {}
+
+    @staticmethod
+    def supported(table: TableName) -> bool:
+        model = get_model(table)
+        return connections[router.db_for_write(model)].vendor == "postgresql"
+
+    def fixed_ver(self, table: TableName) -> Union[int, None]:
+        """Версия, по которую исправлены данные всех регионов таблицы; None - неизвестно"""
+        if table not in self._fixed:
+            result = Status.objects.filter(table=table).aggregate(
+                fixed=Min("fixed_ver"), unknown=Count("pk", filter=Q(fixed_ver__isnull=True))
+            )
+            self._fixed[table] = None if result["unknown"] else result["fixed"]
+            if self._fixed[table] is None:
+                logger.info(f"Table `{table}` has no completed data fix, it is fixed as a whole.")
+        return self._fixed[table]
+
+    def not_active_keys(self, table: TableName) -> Union[List[int], None]:
+        """Ключи неактивных записей, изменённых после исправления данных; None - исправлять всю таблицу"""
+        fixed_ver = self.fixed_ver(table)
+        if fixed_ver is None or not self.supported(table):
+            self.deleted[table] = None
+            return None
+        model = cast(Type[AbstractIsActiveModel], get_model(table))
+        keys = list(
+            model.objects.filter(isactive=False, ver__gt=fixed_ver).values_list("pk", flat=True)[: self.limit + 1]
+        )
+        if len(keys) > self.limit:
+            self.deleted[table] = None
+            return None
+        self.deleted[table] = set(keys)
+        return keys
+
+    def ref_keys(self, table: TableName) -> Union[List[int], None]:
+        """
+        Значения ссылочного поля записей таблицы, изменённых после исправления данных, и ключи удалённых
+        объектов, на которые она ссылается; None - исправлять всю таблицу
+        """
+        model = get_model(table)
+        field = model.objects.get_ref_field()
+        fixed_ver = self.fixed_ver(table)
+        if field is None or fixed_ver is None or not self.supported(table):
+            return None
+
+        keys: Set[int] = set(
+            model.objects.filter(ver__gt=fixed_ver)
+            .values_list(field.attname, flat=True)
+            .order_by()
+            .distinct()[: self.limit + 1]
+        )
+        for ref in get_table_refs(table):
+            deleted = self.deleted.get(ref, set())
+            if deleted is None:
+                return None
+            keys |= deleted
+        if len(keys) > self.limit:
+            logger.info(f"Table `{table}` has more than {self.limit} changed keys, it is fixed as a whole.")
+            return None
+        return sorted(keys)
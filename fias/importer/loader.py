@@ -1,29 +1,50 @@
 # coding: utf-8
-from __future__ import absolute_import, unicode_literals
+from __future__ import absolute_import, annotations, unicode_literals
 
 import datetime
 import logging
+from enum import StrEnum
+from itertools import compress
+from pathlib import Path
+from queue import Queue
 from sys import stdout
-from typing import Any, List
+from threading import Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, List, Set, Tuple, Union
 
 from django import db
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import (
+    DatabaseError,
+    DataError,
+    IntegrityError,
+    connections,
+    router,
+    transaction,
+)
 from progress import Infinite
 
 from fias.config import TableName
+from fias.importer.quarantine import Quarantine
+from fias.importer.record import Record
 from fias.importer.signals import post_import_table, pre_import_table
-from fias.importer.table.table import AbstractTableList, Table
+from fias.importer.sizing import AdaptiveBatchSize, BatchSizing
+from fias.importer.table.table import AbstractTableList, Table, TableIterator
 from fias.importer.validators import (
-    get_common_validator,
-    get_create_validator,
-    get_update_validator,
+    get_common_batch_validator,
+    get_create_batch_validator,
+    get_raw_create_predicates,
+    get_update_batch_validator,
 )
-from fias.models import AbstractModel
 
 logger = logging.getLogger(__name__)
 
 
+class Writer(StrEnum):
+    ORM = "orm"
+    COPY = "copy"
+
+
 class LoadingBar(Infinite):  # type: ignore
     file = stdout
     check_tty: bool = False
@@ -31,7 +52,7 @@ class LoadingBar(Infinite):  # type: ignore
     text: str = (
         "T: %(table)s."
         " L: %(loaded)d | U: %(updated)d"
-        " | S: %(skipped)d[E:%(errors)d]"
+        " | S: %(skipped)d[E:%(errors)d|RAW:%(rejected)d]"
         " | R: %(depth)d[%(stack_str)s]"
         " \tFN: %(filename)s"
     )
@@ -40,6 +61,7 @@ class LoadingBar(Infinite):  # type: ignore
     updated: int = 0
     skipped: int = 0
     errors: int = 0
+    rejected: int = 0
     depth: int = 0
     stack: List[str]
     stack_str: str = "0"
@@ -49,6 +71,8 @@ class LoadingBar(Infinite):  # type: ignore
         self.table = table
         self.filename = filename
         self.stack = []
+        # Индикатор обновляется и из потоков записи
+        self._lock = Lock()
         super(LoadingBar, self).__init__(message=message, **kwargs)
 
     def __getitem__(self, key: str) -> Any:
@@ -62,9 +86,24 @@ class LoadingBar(Infinite):  # type: ignore
         updated: int = 0,
         skipped: int = 0,
         errors: int = 0,
+        rejected: int = 0,
         regress_depth: int = 0,
         regress_len: int = 0,
         regress_iteration: int = 0,
+    ) -> None:
+        with self._lock:
+            self._update(loaded, updated, skipped, errors, rejected, regress_depth, regress_len, regress_iteration)
+
+    def _update(
+        self,
+        loaded: int,
+        updated: int,
+        skipped: int,
+        errors: int,
+        rejected: int,
+        regress_depth: int,
+        regress_len: int,
+        regress_iteration: int,
     ) -> None:
         if loaded:
             self.loaded = loaded
@@ -74,6 +113,8 @@ class LoadingBar(Infinite):  # type: ignore
             self.skipped = skipped
         if errors:
             self.errors = errors
+        if rejected:
+            self.rejected = rejected
 
         self.depth = regress_depth
         if not self.depth:
@@ -95,16 +136,92 @@ class LoadingBar(Infinite):  # type: ignore
         self.writeln(ln)
 
 
+WriteTask = Tuple[Table, List[Record], LoadingBar]
+
+
+class BatchWriterPool(object):
+    """
+    Запись пачек в отдельных потоках, пока разбор файла продолжается.
+    Очередь ограничена: при заполнении разбор ждёт, пока потоки записи её разгрузят
+    """
+
+    def __init__(self, write: Callable[[Table, List[Record], LoadingBar], None], workers: int, queue_size: int):
+        self._write = write
+        self._queue: Queue[Union[WriteTask, None]] = Queue(maxsize=max(1, queue_size))
+        self._error: Union[BaseException, None] = None
+        self._threads = [Thread(target=self._run, name=f"fias-writer-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                task = self._queue.get()
+                try:
+                    if task is None:
+                        return
+                    # После ошибки оставшиеся пачки не пишутся, но очередь разгружается
+                    if self._error is None:
+                        self._write(*task)
+                except BaseException as e:
+                    self._error = e
+                finally:
+                    self._queue.task_done()
+        finally:
+            # У каждого потока своё соединение с БД
+            connections.close_all()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def put(self, table: Table, objects: List[Record], bar: LoadingBar) -> None:
+        self._raise_error()
+        self._queue.put((table, objects, bar))
+
+    def join(self) -> None:
+        self._queue.join()
+        self._raise_error()
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> BatchWriterPool:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
 class TableLoader(object):
-    def __init__(self, limit: int = 10000):
+    def __init__(
+        self,
+        limit: int = 10000,
+        writer: Writer = Writer.ORM,
+        write_workers: int = 0,
+        write_queue: int = 2,
+        quarantine: Union[Path, None] = None,
+        sizing: Union[BatchSizing, None] = None,
+    ):
         self.limit = int(limit)
+        self.writer = Writer(writer)
+        self.write_workers = write_workers
+        self.write_queue = write_queue
+        self.quarantine = Quarantine(quarantine) if quarantine is not None else None
+        self.sizing = sizing
+        self.batch_size: Union[AdaptiveBatchSize, None] = None
+        self._pool: Union[BatchWriterPool, None] = None
+        self._lock = Lock()
         self.counter = 0
         self.upd_counter = 0
         self.skip_counter = 0
         self.err_counter = 0
         self.today = datetime.date.today()
 
-    def regressive_create(self, table: Table, objects: List[AbstractModel], bar: LoadingBar, depth: int = 1) -> None:
+    def regressive_create(self, table: Table, objects: List[Record], bar: LoadingBar, depth: int = 1) -> None:
         count = len(objects)
         batch_len = count // 3 or 1
         batch_count = count // batch_len
@@ -115,119 +232,335 @@ class TableLoader(object):
             batch = objects[i * batch_len : (i + 1) * batch_len]
             bar.update(regress_depth=depth, regress_len=batch_len, regress_iteration=i + 1)
             try:
-                table.model.objects.bulk_create(batch)
-            except (IntegrityError, ValueError):
+                with transaction.atomic(using=router.db_for_write(table.model)):
+                    table.model.objects.bulk_create([item.to_model() for item in batch])
+            except (IntegrityError, DataError, ValueError):
                 if batch_len <= 1:
-                    self.counter -= 1
-                    self.skip_counter += 1
-                    self.err_counter += 1
-                    bar.update(loaded=self.counter, skipped=self.skip_counter, errors=self.err_counter)
-                    if batch_len > 0:
-                        obj_s = {f.name: getattr(batch[0], f.attname) for f in table.model._meta.fields}
-                        logger.warning(f'Region {table.region} table "{table.name}" skip invalid object {obj_s}.')
+                    self.reject(table, batch, "invalid object", bar=bar)
                     continue
                 else:
                     self.regressive_create(table, batch, bar=bar, depth=depth + 1)
 
-    def create(self, table: Table, objects: List[AbstractModel], bar: LoadingBar) -> None:
+    def copy_create(self, table: Table, objects: List[Record]) -> None:
+        model = table.model
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+        fields = model._meta.fields
+        columns = ", ".join(quote_name(f.column) for f in fields)
+        raw_sql = f"COPY {quote_name(model._meta.db_table)} ({columns}) FROM STDIN"
+
+        # Ошибки psycopg приводим к исключениям Django, как это делает обычный курсор
+        with connection.wrap_database_errors:
+            with connection.cursor() as cursor:
+                with cursor.copy(raw_sql) as copy:
+                    for item in objects:
+                        copy.write_row(item.values())
+
+    def reject(self, table: Table, items: List[Record], reason: str, bar: LoadingBar) -> None:
+        if not items:
+            return
+        # Пачки могут записываться в нескольких потоках, поэтому из счётчиков меняется только счётчик ошибок
+        with self._lock:
+            self.err_counter += len(items)
+        bar.update(loaded=self.loaded, skipped=self.skipped, errors=self.err_counter)
+
+        if self.quarantine is not None:
+            self.quarantine.write(table, items, reason)
+            logger.warning(
+                f'Region {table.region} table "{table.name}" {len(items)} rows rejected ({reason}),'
+                f" see {self.quarantine.path}."
+            )
+        else:
+            for item in items:
+                logger.warning(f'Region {table.region} table "{table.name}" skip {reason} {item.as_dict()}.')
+
+    def insert_ignore(self, table: Table, objects: List[Record]) -> Set[Any]:
+        """
+        Вставка пачки через временную таблицу с пропуском конфликтующих записей.
+        Возвращает первичные ключи записей, которые попали в таблицу
+        """
+        model = table.model
+        assert model._meta.pk is not None
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+
+        db_table = quote_name(model._meta.db_table)
+        tmp_table = quote_name(f"{model._meta.db_table}_insert")
+        columns_s = ", ".join(quote_name(f.column) for f in model._meta.fields)
+        pk = quote_name(model._meta.pk.column)
+
+        with transaction.atomic(using=connection.alias):
+            with connection.wrap_database_errors:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"CREATE TEMPORARY TABLE {tmp_table} (LIKE {db_table}) ON COMMIT DROP")
+                    with cursor.copy(f"COPY {tmp_table} ({columns_s}) FROM STDIN") as copy:
+                        for item in objects:
+                            copy.write_row(item.values())
+                    cursor.execute(
+                        f"INSERT INTO {db_table} ({columns_s}) SELECT {columns_s} FROM {tmp_table}"
+                        f" ON CONFLICT DO NOTHING RETURNING {pk}"
+                    )
+                    landed = {row[0] for row in cursor.fetchall()}
+                    cursor.execute(f"DROP TABLE {tmp_table}")
+        return landed
+
+    def isolating_create(self, table: Table, objects: List[Record], bar: LoadingBar) -> None:
+        """
+        Запись пачки, в которой есть ошибочные строки.
+        Первый проход пропускает конфликты по ключам; если в пачке есть строки с недопустимыми значениями,
+        второй проход пишет строки по одной, каждую в своей точке сохранения
+        """
         try:
-            table.model.objects.bulk_create(objects)
-        except (IntegrityError, ValueError):
-            self.regressive_create(table, objects, bar)
+            landed = self.insert_ignore(table, objects)
+        except (IntegrityError, DataError, ValueError):
+            pass
+        else:
+            self.reject(table, [item for item in objects if item.pk not in landed], "duplicate key", bar=bar)
+            return
+
+        model = table.model
+        assert model._meta.pk is not None
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+        fields = model._meta.fields
+        raw_sql = (
+            f"INSERT INTO {quote_name(model._meta.db_table)} ({', '.join(quote_name(f.column) for f in fields)})"
+            f" VALUES ({', '.join(['%s'] * len(fields))})"
+            f" ON CONFLICT DO NOTHING RETURNING {quote_name(model._meta.pk.column)}"
+        )
+
+        duplicates: List[Record] = []
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                for item in objects:
+                    try:
+                        with transaction.atomic(using=connection.alias):
+                            cursor.execute(raw_sql, item.values())
+                            if cursor.fetchone() is None:
+                                duplicates.append(item)
+                    except (DatabaseError, ValueError) as e:
+                        reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                        self.reject(table, [item], reason, bar=bar)
+        self.reject(table, duplicates, "duplicate key", bar=bar)
+
+    def create(self, table: Table, objects: List[Record], bar: LoadingBar) -> None:
+        connection = connections[router.db_for_write(table.model)]
+        is_postgresql = connection.vendor == "postgresql"
+        try:
+            # Внутри внешней транзакции ошибка откатывает только точку сохранения
+            with transaction.atomic(using=connection.alias):
+                if self.writer == Writer.COPY and is_postgresql:
+                    self.copy_create(table, objects)
+                else:
+                    table.model.objects.bulk_create([item.to_model() for item in objects])
+        except (IntegrityError, DataError, ValueError):
+            if is_postgresql:
+                self.isolating_create(table, objects, bar)
+            else:
+                self.regressive_create(table, objects, bar)
 
         #  Обнуляем индикатор регрессии
         bar.update(regress_depth=0, regress_len=0)
         if settings.DEBUG:
             db.reset_queries()
 
+    @property
+    def loaded(self) -> int:
+        return self.counter - self.err_counter
+
+    @property
+    def skipped(self) -> int:
+        return self.skip_counter + self.err_counter
+
+    def batch_limit(self) -> int:
+        return self.batch_size.size if self.batch_size is not None else self.limit
+
+    def timed_create(self, table: Table, objects: List[Record], bar: LoadingBar) -> None:
+        start = monotonic()
+        self.create(table, objects, bar=bar)
+        if self.batch_size is not None:
+            self.batch_size.record(len(objects), monotonic() - start)
+
+    def write(self, table: Table, objects: List[Record], bar: LoadingBar) -> None:
+        if self._pool is None:
+            self.timed_create(table, objects, bar=bar)
+        else:
+            self._pool.put(table, objects, bar)
+
+    def flush(self) -> None:
+        if self._pool is not None:
+            self._pool.join()
+
     def load(self, tablelist: AbstractTableList, table: Table) -> None:
         logger.info(f'Region {table.region} table "{table.name}" is loading.')
-        pre_import_table.send(sender=self.__class__, table=table)
-        self.do_load(tablelist=tablelist, table=table)
-        post_import_table.send(sender=self.__class__, table=table)
+        # Для таблицы, загружаемой по частям, сигналы отправляются один раз на всю таблицу
+        if table.part is None:
+            pre_import_table.send(sender=self.__class__, table=table)
+        # Размер пачки подбирается отдельно для каждой таблицы в каждом процессе
+        if self.sizing is not None:
+            self.batch_size = AdaptiveBatchSize(self.limit, self.sizing)
+        if self.write_workers > 0:
+            with BatchWriterPool(self.timed_create, self.write_workers, self.write_queue) as self._pool:
+                self.do_load(tablelist=tablelist, table=table)
+            self._pool = None
+        else:
+            self.do_load(tablelist=tablelist, table=table)
+        if self.batch_size is not None:
+            logger.info(f'Region {table.region} table "{table.name}" batch size: {self.batch_size.summary()}.')
+        if table.part is None:
+            post_import_table.send(sender=self.__class__, table=table)
         logger.info(f'Region {table.region} table "{table.name}" has been loaded.')
 
+    def log_stats(self, table: Table, rows: TableIterator) -> None:
+        stats = rows.get_stats()
+        if stats:
+            stats_s = ", ".join(f"{k}={v}" for k, v in stats.items())
+            logger.info(f'Region {table.region} table "{table.name}" parse stats: {stats_s}.')
+
     def do_load(self, tablelist: AbstractTableList, table: Table) -> None:
-        bar = LoadingBar(table=table.name, filename=table.filename)
+        bar = LoadingBar(table=table.name, filename=table.label)
         bar.update()
 
         tn = TableName(table.name)
-        common_validator = get_common_validator(tn)
-        create_validator = get_create_validator(tn)
-
-        objects = set()
-        for item in table.rows(tablelist=tablelist):
-            if item is None or not (common_validator(item, self.today) and create_validator(item, self.today)):
-                self.skip_counter += 1
-
-                if self.skip_counter and self.skip_counter % self.limit == 0:
-                    bar.update(skipped=self.skip_counter)
-                continue
-
-            objects.add(item)
-            self.counter += 1
-
-            if self.counter and self.counter % self.limit == 0:
-                self.create(table, list(objects), bar=bar)
+        common_validator = get_common_batch_validator(tn)
+        create_validator = get_create_batch_validator(tn)
+
+        objects: Set[Record] = set()
+        # Строки, не прошедшие проверку по исходным атрибутам, отбрасываются ещё до преобразования
+        rows = table.rows(tablelist=tablelist, raw_predicates=get_raw_create_predicates(tn, self.today))
+        for batch in rows.batches(self.batch_limit):
+            valid = list(compress(batch, common_validator(batch, self.today)))
+            valid = list(compress(valid, create_validator(valid, self.today)))
+            self.skip_counter += len(batch) - len(valid)
+
+            objects.update(valid)
+            self.counter += len(valid)
+
+            if len(objects) >= self.batch_limit():
+                self.write(table, list(objects), bar=bar)
                 objects.clear()
-                bar.update(loaded=self.counter, skipped=self.skip_counter)
+            skipped = self.skipped + rows.filtered + rows.raw_rejected
+            bar.update(loaded=self.loaded, skipped=skipped, rejected=rows.raw_rejected)
 
         if objects:
-            self.create(table, list(objects), bar=bar)
+            self.write(table, list(objects), bar=bar)
+        self.flush()
 
-        bar.update(loaded=self.counter, skipped=self.skip_counter)
+        self.skip_counter += rows.filtered + rows.raw_rejected
+        bar.update(loaded=self.loaded, skipped=self.skipped, rejected=rows.raw_rejected)
         bar.finish()
+        self.log_stats(table, rows)
 
 
 class TableUpdater(TableLoader):
-    def __init__(self, limit: int = 10000):
-        self.upd_limit = 100
-        super(TableUpdater, self).__init__(limit=limit)
+    def __init__(
+        self,
+        limit: int = 10000,
+        writer: Writer = Writer.ORM,
+        write_workers: int = 0,
+        write_queue: int = 2,
+        quarantine: Union[Path, None] = None,
+        sizing: Union[BatchSizing, None] = None,
+    ):
+        super(TableUpdater, self).__init__(
+            limit=limit,
+            writer=writer,
+            write_workers=write_workers,
+            write_queue=write_queue,
+            quarantine=quarantine,
+            sizing=sizing,
+        )
+
+    def copy_upsert(self, table: Table, objects: List[Record]) -> int:
+        """
+        Обновление записей одним запросом: записи загружаются во временную таблицу,
+        затем переносятся в основную. Запись обновляется, только если она не новее загружаемой
+        """
+        model = table.model
+        assert model._meta.pk is not None
+        connection = connections[router.db_for_write(model)]
+        quote_name = connection.ops.quote_name
+
+        db_table = quote_name(model._meta.db_table)
+        tmp_table = quote_name(f"{model._meta.db_table}_upsert")
+        columns = [quote_name(f.column) for f in model._meta.fields]
+        columns_s = ", ".join(columns)
+        pk = quote_name(model._meta.pk.column)
+        updates_s = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c != pk)
+        updatedate = quote_name(model._meta.get_field("updatedate").column)
+
+        with transaction.atomic(using=connection.alias):
+            with connection.wrap_database_errors:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"CREATE TEMPORARY TABLE {tmp_table} (LIKE {db_table}) ON COMMIT DROP")
+                    with cursor.copy(f"COPY {tmp_table} ({columns_s}) FROM STDIN") as copy:
+                        for item in objects:
+                            copy.write_row(item.values())
+                    cursor.execute(
+                        f"INSERT INTO {db_table} AS t ({columns_s}) SELECT {columns_s} FROM {tmp_table}"
+                        f" ON CONFLICT ({pk}) DO UPDATE SET {updates_s}"
+                        f" WHERE t.{updatedate} <= EXCLUDED.{updatedate}"
+                    )
+                    count = int(cursor.rowcount)
+                    # Внешняя транзакция может продолжаться, поэтому удаляем таблицу сразу
+                    cursor.execute(f"DROP TABLE {tmp_table}")
+        return count
+
+    def update(self, table: Table, objects: List[Record], old_dates: Dict[Any, datetime.date]) -> int:
+        if connections[router.db_for_write(table.model)].vendor == "postgresql":
+            return self.copy_upsert(table, objects)
+
+        objects = [item for item in objects if old_dates[item.pk] <= item.updatedate]
+        fields = [f.name for f in table.model._meta.fields if not f.primary_key]
+        table.model.objects.bulk_update([item.to_model() for item in objects], fields)
+        return len(objects)
 
     def do_load(self, tablelist: AbstractTableList, table: Table) -> None:
-        bar = LoadingBar(table=table.name, filename=table.filename)
+        bar = LoadingBar(table=table.name, filename=table.label)
 
         model = table.model
 
         tn = TableName(table.name)
-        common_validator = get_common_validator(tn)
-        create_validator = get_create_validator(tn)
-        update_validator = get_update_validator(tn)
-
-        objects = set()
-        for item in table.rows(tablelist=tablelist):
-            if item is None or not common_validator(item, self.today):
-                self.skip_counter += 1
-                continue
-
-            try:
-                old_obj = model.objects.get(pk=item.pk)
-            except model.DoesNotExist:
-                if not create_validator(item, self.today):
-                    self.skip_counter += 1
-                    continue
-                else:
-                    objects.add(item)
-                    self.counter += 1
-
-            else:
-                if not update_validator(item, self.today):
-                    self.skip_counter += 1
-                    continue
-                if old_obj.updatedate <= item.updatedate:
-                    item.save()
-                    self.upd_counter += 1
-
-            if self.counter and self.counter % self.limit == 0:
-                self.create(table, list(objects), bar=bar)
-                objects.clear()
-                bar.update(loaded=self.counter)
-
-            if self.upd_counter and self.upd_counter % self.upd_limit == 0:
-                bar.update(updated=self.upd_counter)
-
-        if objects:
-            self.create(table, list(objects), bar=bar)
-
-        bar.update(loaded=self.counter, updated=self.upd_counter, skipped=self.skip_counter)
+        common_validator = get_common_batch_validator(tn)
+        create_validator = get_create_batch_validator(tn)
+        update_validator = get_update_batch_validator(tn)
+
+        rows = table.rows(tablelist=tablelist)
+        for batch in rows.batches(self.batch_limit):
+            # Из нескольких версий одной записи в пачке остаётся самая свежая
+            latest: Dict[Any, Record] = {}
+            for item in compress(batch, common_validator(batch, self.today)):
+                prev = latest.get(item.pk)
+                if prev is None or prev.updatedate <= item.updatedate:
+                    latest[item.pk] = item
+            self.skip_counter += len(batch) - len(latest)
+
+            # Записи, созданные из предыдущих пачек, должны быть уже в БД
+            self.flush()
+            old_dates: Dict[Any, datetime.date] = dict(
+                model.objects.filter(pk__in=latest.keys()).values_list("pk", "updatedate")
+            )
+
+            new_items = [item for pk, item in latest.items() if pk not in old_dates]
+            new_items = list(compress(new_items, create_validator(new_items, self.today)))
+            old_items = [item for pk, item in latest.items() if pk in old_dates]
+            old_items = list(compress(old_items, update_validator(old_items, self.today)))
+            self.skip_counter += len(latest) - len(new_items) - len(old_items)
+
+            if new_items:
+                self.counter += len(new_items)
+                self.write(table, new_items, bar=bar)
+            if old_items:
+                start = monotonic()
+                self.upd_counter += self.update(table, old_items, old_dates)
+                if self.batch_size is not None:
+                    self.batch_size.record(len(old_items), monotonic() - start)
+
+            bar.update(loaded=self.loaded, updated=self.upd_counter, skipped=self.skipped + rows.filtered)
+
+        self.flush()
+
+        self.skip_counter += rows.filtered + rows.raw_rejected
+        bar.update(loaded=self.loaded, updated=self.upd_counter, skipped=self.skipped, rejected=rows.raw_rejected)
         bar.finish()
+        self.log_stats(table, rows)
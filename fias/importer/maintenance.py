@@ -0,0 +1,116 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Event, Lock
+from time import monotonic
+from typing import Callable, Deque, List, Tuple, Type
+
+from django.db import connections, router
+
+from fias.models import AbstractModel
+
+__all__ = ["FixChunking", "split_range", "run_chunked"]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FixChunking:
+    """Разбиение шагов исправления данных по диапазонам значений ссылочного поля"""
+
+    # Примерное количество строк таблицы в одном диапазоне
+    rows: int = 1000000
+    # Количество соединений с БД, обрабатывающих диапазоны одновременно
+    workers: int = 2
+
+
+def split_range(low: int, high: int, chunks: int) -> List[Tuple[int, int]]:
+    """Делит полуинтервал [low, high) на не больше chunks непустых полуинтервалов равной ширины"""
+    chunks = max(1, min(chunks, high - low))
+    step, rest = divmod(high - low, chunks)
+    bounds: List[Tuple[int, int]] = []
+    start = low
+    for i in range(chunks):
+        end = start + step + (1 if i < rest else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _estimate_rows(model: Type[AbstractModel]) -> int:
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        # У ещё не анализированной таблицы reltuples равен -1
+        if row is not None and row[0] >= 0:
+            return int(row[0])
+    return model.objects.count()
+
+
+def run_chunked(
+    label: str,
+    model: Type[AbstractModel],
+    func: Callable[[Tuple[int, int]], int],
+    chunking: FixChunking,
+    by_pk: bool = False,
+) -> int:
+    """
+    Выполняет шаг исправления данных таблицы по диапазонам значений ссылочного поля (by_pk - первичного ключа)
+    в нескольких соединениях и сообщает о ходе выполнения по каждому диапазону. Возвращает суммарное количество строк.
+    Каждый диапазон - отдельная короткая транзакция; поток обрабатывает диапазоны по очереди в одном
+    соединении. С одним соединением диапазоны обрабатываются в соединении текущего потока
+    """
+    key_range = model.objects.get_pk_range() if by_pk else model.objects.get_ref_range()
+    if key_range is None:
+        return 0
+    chunks = -(-_estimate_rows(model) // max(1, chunking.rows))
+    ranges = split_range(key_range[0], key_range[1] + 1, chunks)
+
+    pending: Deque[Tuple[int, int]] = deque(ranges)
+    lock = Lock()
+    failed = Event()
+    done = 0
+    total = 0
+
+    def process() -> None:
+        nonlocal done, total
+        while not failed.is_set():
+            try:
+                low, high = pending.popleft()
+            except IndexError:
+                return
+            start = monotonic()
+            try:
+                count = func((low, high))
+            except BaseException:
+                # Остальные потоки не берут новые диапазоны
+                failed.set()
+                raise
+            with lock:
+                done += 1
+                total += count
+                logger.info(
+                    f"{label}: chunk {done}/{len(ranges)} [{low}, {high}) - {count} rows in {monotonic() - start:.1f}s."
+                )
+
+    def worker() -> None:
+        try:
+            process()
+        finally:
+            connections.close_all()
+
+    workers = min(max(1, chunking.workers), len(ranges))
+    if workers == 1:
+        process()
+        return total
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fias-fix") as executor:
+        futures = [executor.submit(worker) for _ in range(workers)]
+        for future in futures:
+            future.result()
+    return total
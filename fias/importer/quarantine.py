@@ -0,0 +1,52 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable
+
+from fias.importer.record import Record
+from fias.importer.table.table import Table
+
+__all__ = ["Quarantine"]
+
+
+class Quarantine(object):
+    """
+    Файл JSONL со строками, которые не удалось записать в БД.
+    Одна строка файла - одна отклонённая запись с указанием таблицы и причины.
+    В файл могут одновременно писать несколько процессов загрузки, поэтому
+    каждая порция строк дописывается в конец файла одной операцией записи
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def write(self, table: Table, items: Iterable[Record], reason: str) -> int:
+        lines = [
+            json.dumps(
+                {
+                    "table": table.name,
+                    "region": table.region,
+                    "file": table.filename,
+                    "reason": reason,
+                    "row": item.as_dict(),
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+            + "\n"
+            for item in items
+        ]
+        if not lines:
+            return 0
+
+        data = "".join(lines).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while data:
+                data = data[os.write(fd, data) :]
+        finally:
+            os.close(fd)
+        return len(lines)
@@ -0,0 +1,91 @@
+# coding: utf-8
+from __future__ import absolute_import, annotations, unicode_literals
+
+from dataclasses import field, make_dataclass
+from operator import attrgetter
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, Type, cast
+
+from fias.models import AbstractModel
+
+__all__ = ["Record", "get_record_class"]
+
+
+class Record(object):
+    """
+    Лёгкое представление строки таблицы ФИАС.
+    Атрибуты совпадают с атрибутами модели, но экземпляр модели не создаётся
+    """
+
+    __slots__ = ()
+
+    model: Type[AbstractModel]
+    attnames: Tuple[str, ...]
+    pk_attname: str
+    _values_getter: Callable[[Record], Tuple[Any, ...]]
+
+    if TYPE_CHECKING:
+
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            pass
+
+        def __getattr__(self, name: str) -> Any:
+            pass
+
+        def __setattr__(self, name: str, value: Any) -> None:
+            pass
+
+    @property
+    def pk(self) -> Any:
+        return getattr(self, self.pk_attname)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.model is other.model and self.pk is not None and self.pk == other.pk
+
+    def __hash__(self) -> int:
+        if self.pk is None:
+            raise TypeError("Record instances without primary key value are unhashable")
+        return hash(self.pk)
+
+    def values(self) -> Tuple[Any, ...]:
+        """Значения в порядке полей модели"""
+        return self._values_getter(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(zip(self.attnames, self.values()))
+
+    def to_model(self) -> AbstractModel:
+        # Позиционные аргументы - самый быстрый путь Model.__init__
+        return cast(Callable[..., AbstractModel], self.model)(*self.values())
+
+
+_record_classes: Dict[Type[AbstractModel], Type[Record]] = {}
+
+
+def get_record_class(model: Type[AbstractModel]) -> Type[Record]:
+    try:
+        return _record_classes[model]
+    except KeyError:
+        pass
+
+    if model._meta.pk is None:
+        raise ValueError(f"Model {model._meta.object_name} has no primary key")
+
+    attnames = tuple(f.attname for f in model._meta.fields)
+    fields: List[Tuple[str, type, Any]] = [(name, object, field(default=None)) for name in attnames]
+    record_class: Type[Record] = make_dataclass(
+        f"{model._meta.object_name}Record",
+        fields,
+        bases=(Record,),
+        namespace={
+            "model": model,
+            "attnames": attnames,
+            "pk_attname": model._meta.pk.attname,
+            "_values_getter": attrgetter(*attnames),
+        },
+        eq=False,
+        slots=True,
+    )
+    _record_classes[model] = record_class
+    return record_class
@@ -0,0 +1,159 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import logging
+import multiprocessing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, Set, Union
+
+from django.db import connections
+
+__all__ = ["Task", "TaskGraph", "pool_connections"]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Task:
+    name: str
+    func: Callable[[], Any]
+    deps: Set[str]
+    # Задача выполняется в потоке основного процесса, а не в общем пуле
+    local: bool = False
+    # Готовые задачи пула запускаются в порядке убывания веса (размера данных)
+    weight: int = 0
+    # Оценка памяти процесса, выполняющего задачу, в байтах
+    memory: int = 0
+
+
+@contextmanager
+def pool_connections() -> Iterator[None]:
+    """
+    Соединения с БД задачи пула. Процесс пула сохраняет исправные соединения для следующих задач
+    всех таблиц и версий; в потоке основного процесса соединения закрываются после задачи
+    """
+    persistent = multiprocessing.parent_process() is not None
+    if persistent:
+        for connection in connections.all():
+            if connection.connection is not None and not connection.is_usable():
+                connection.close()
+    try:
+        yield
+    finally:
+        if not persistent:
+            connections.close_all()
+
+
+def _call_local(func: Callable[[], Any]) -> Any:
+    try:
+        return func()
+    finally:
+        # У каждого потока своё соединение с БД
+        connections.close_all()
+
+
+class TaskGraph(object):
+    """
+    Граф задач загрузки: задача запускается, как только выполнены все задачи, от которых она зависит.
+    Разбор файлов выполняется в общем пуле процессов, остальные задачи (индексы, исправление данных) -
+    в потоках основного процесса. Зависимости задачи должны быть добавлены в граф раньше неё,
+    поэтому циклов в графе нет, а порядок добавления - допустимый порядок выполнения
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, Task] = {}
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._tasks
+
+    def __getitem__(self, name: str) -> Task:
+        return self._tasks[name]
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        deps: Iterable[str] = (),
+        local: bool = False,
+        weight: int = 0,
+        memory: int = 0,
+    ) -> str:
+        if name in self._tasks:
+            raise ValueError(f"Task `{name}` is already added")
+        deps_set = set(deps)
+        unknown = deps_set.difference(self._tasks)
+        if unknown:
+            raise ValueError(f"Task `{name}` depends on unknown tasks: {', '.join(sorted(unknown))}")
+        self._tasks[name] = Task(name=name, func=func, deps=deps_set, local=local, weight=weight, memory=memory)
+        return name
+
+    def run(
+        self,
+        executor: Union[Executor, None] = None,
+        local_workers: int = 1,
+        pool_workers: Union[int, None] = None,
+        memory_budget: int = 0,
+    ) -> None:
+        """
+        Выполняет задачи. Без пула и с одним локальным потоком задачи выполняются по очереди
+        в порядке добавления; задачи для пула без пула выполняются в локальных потоках.
+        В пул одновременно передаётся не больше pool_workers задач, начиная с самых тяжёлых.
+        Если задан memory_budget, задача не запускается, пока суммарная оценка памяти запущенных
+        задач с ней превышает бюджет. Более лёгкие задачи при этом тоже ждут, чтобы тяжёлая не простаивала
+        """
+        if executor is None and local_workers <= 1:
+            for task in self._tasks.values():
+                task.func()
+            return
+
+        pending = dict(self._tasks)
+        done: Set[str] = set()
+        running: Dict[Future[Any], Task] = {}
+        pool_running = 0
+        pool_memory = 0
+        with ThreadPoolExecutor(max_workers=max(1, local_workers), thread_name_prefix="fias-local") as local_pool:
+            try:
+                while pending or running:
+                    ready = [task for task in pending.values() if task.deps <= done]
+                    for task in ready:
+                        if task.local or executor is None:
+                            del pending[task.name]
+                            running[local_pool.submit(partial(_call_local, task.func))] = task
+
+                    if executor is not None:
+                        for task in sorted((t for t in ready if not t.local), key=lambda t: -t.weight):
+                            if pool_running and (
+                                (pool_workers and pool_running >= pool_workers)
+                                or (memory_budget and pool_memory + task.memory > memory_budget)
+                            ):
+                                break
+                            del pending[task.name]
+                            running[executor.submit(task.func)] = task
+                            pool_running += 1
+                            pool_memory += task.memory
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        task = running.pop(future)
+                        if not task.local and executor is not None:
+                            pool_running -= 1
+                            pool_memory -= task.memory
+                        future.result()
+                        done.add(task.name)
+                        logger.debug(f"Task `{task.name}` is done.")
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
@@ -0,0 +1,205 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import logging
+from typing import Any, Dict, Iterable, List, Tuple, Type, Union
+
+from django.db import connections, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+
+from fias.config import DATABASE_ALIAS
+from fias.models import AbstractModel, Status
+
+__all__ = [
+    "SHADOW_SCHEMA",
+    "PREVIOUS_SCHEMA",
+    "ShadowSchemaError",
+    "use_schema",
+    "prepare_shadow",
+    "set_logged",
+    "swap_shadow",
+    "drop_previous",
+]
+
+logger = logging.getLogger(__name__)
+
+# Схема, в которой строится новое поколение таблиц
+SHADOW_SCHEMA = "fias_shadow"
+# Схема, в которую после замены переносится предыдущее поколение
+PREVIOUS_SCHEMA = "fias_previous"
+
+
+class ShadowSchemaError(Exception):
+    pass
+
+
+_search_schema: Union[str, None] = None
+
+
+def _set_search_path(sender: Any, connection: BaseDatabaseWrapper, **kwargs: Any) -> None:
+    if _search_schema is not None and connection.alias == DATABASE_ALIAS:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('search_path', %s || ',' || current_setting('search_path'), false)",
+                [connection.ops.quote_name(_search_schema)],
+            )
+
+
+connection_created.connect(_set_search_path, dispatch_uid="fias_shadow_search_path")
+
+
+def use_schema(schema: Union[str, None]) -> None:
+    """
+    Новые соединения с БД ФИАС ищут таблицы сначала в указанной схеме.
+    Действует на все потоки процесса, текущее соединение потока закрывается
+    """
+    global _search_schema
+    if schema != _search_schema:
+        _search_schema = schema
+        connections[DATABASE_ALIAS].close()
+
+
+def _schema_exists(cursor: Any, schema: str) -> bool:
+    cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s", [schema])
+    return cursor.fetchone() is not None
+
+
+def prepare_shadow(models: Iterable[Type[AbstractModel]]) -> str:
+    """
+    Создаёт пустые нежурналируемые таблицы в теневой схеме и переключает на неё соединения.
+    Возвращает схему, в которой находятся рабочие таблицы
+    """
+    connection = connections[DATABASE_ALIAS]
+    if connection.vendor != "postgresql":
+        raise ShadowSchemaError("Shadow schema reload is supported for PostgreSQL only")
+    quote_name = connection.ops.quote_name
+
+    use_schema(None)
+    with connection.cursor() as cursor:
+        if _schema_exists(cursor, PREVIOUS_SCHEMA):
+            raise ShadowSchemaError(
+                f"Schema `{PREVIOUS_SCHEMA}` with the previous generation of tables exists. "
+                "Drop it with --drop-previous before the next reload"
+            )
+        cursor.execute("SELECT current_schema()")
+        live_schema: str = cursor.fetchone()[0]
+        # Остатки прерванной загрузки
+        cursor.execute(f"DROP SCHEMA IF EXISTS {quote_name(SHADOW_SCHEMA)} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {quote_name(SHADOW_SCHEMA)}")
+
+    use_schema(SHADOW_SCHEMA)
+    for model in models:
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote_name(model._meta.db_table)} SET UNLOGGED")
+    return live_schema
+
+
+def set_logged(model: Type[AbstractModel]) -> None:
+    """Включает журналирование загруженной таблицы перед построением индексов"""
+    connection = connections[DATABASE_ALIAS]
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {connection.ops.quote_name(model._meta.db_table)} SET LOGGED")
+
+
+# Привилегии на таблицы, переносимые на теневые таблицы
+TABLE_PRIVILEGES = ("SELECT", "INSERT", "UPDATE", "DELETE", "TRUNCATE", "REFERENCES", "TRIGGER")
+
+
+def _copy_grants(cursor: Any, quote_name: Any, live_schema: str, db_table: str) -> None:
+    """Выдаёт на теневую таблицу те же привилегии, что выданы на рабочую"""
+    cursor.execute(
+        """SELECT grantee, privilege_type, is_grantable FROM information_schema.role_table_grants
+           WHERE table_schema = %s AND table_name = %s AND grantee <> current_user""",
+        [live_schema, db_table],
+    )
+    grants: Dict[Tuple[str, bool], List[str]] = {}
+    for grantee, privilege, grantable in cursor.fetchall():
+        if privilege in TABLE_PRIVILEGES:
+            grants.setdefault((grantee, grantable == "YES"), []).append(privilege)
+    for (grantee, grantable), privileges in grants.items():
+        role = "PUBLIC" if grantee == "PUBLIC" else quote_name(grantee)
+        cursor.execute(
+            f"GRANT {', '.join(privileges)} ON {quote_name(SHADOW_SCHEMA)}.{quote_name(db_table)} TO {role}"
+            + (" WITH GRANT OPTION" if grantable else "")
+        )
+
+
+def swap_shadow(live_schema: str, models: Iterable[Type[AbstractModel]], statuses: List[Status]) -> None:
+    """
+    Одной транзакцией переносит рабочие таблицы в схему предыдущего поколения,
+    а таблицы теневой схемы - на их место. Теневые таблицы получают привилегии рабочих.
+    Статусы загруженных таблиц меняются в той же транзакции
+    """
+    use_schema(None)
+    connection = connections[DATABASE_ALIAS]
+    quote_name = connection.ops.quote_name
+    live = quote_name(live_schema)
+    shadow = quote_name(SHADOW_SCHEMA)
+    previous = quote_name(PREVIOUS_SCHEMA)
+
+    with transaction.atomic(using=DATABASE_ALIAS):
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA {previous}")
+            for model in models:
+                _copy_grants(cursor, quote_name, live_schema, model._meta.db_table)
+                db_table = quote_name(model._meta.db_table)
+                cursor.execute(f"ALTER TABLE {live}.{db_table} SET SCHEMA {previous}")
+                cursor.execute(f"ALTER TABLE {shadow}.{db_table} SET SCHEMA {live}")
+            cursor.execute(f"DROP SCHEMA {shadow}")
+        Status.objects.filter(table__in={st.table for st in statuses}).delete()
+        Status.objects.bulk_create(statuses)
+    logger.info(f"Shadow tables are swapped in, previous generation is kept in schema `{PREVIOUS_SCHEMA}`.")
+
+
+def _previous_dependents(cursor: Any) -> List[str]:
+    """Объекты вне схемы предыдущего поколения, зависящие от её таблиц (представления, внешние ключи)"""
+    cursor.execute(
+        """SELECT DISTINCT deps.dependent, ref.oid::regclass::text FROM (
+               SELECT view.oid::regclass::text AS dependent, dep.refobjid AS ref_oid, view.relnamespace AS nsp
+               FROM pg_depend dep
+               JOIN pg_rewrite rule ON rule.oid = dep.objid
+               JOIN pg_class view ON view.oid = rule.ev_class
+               WHERE dep.classid = 'pg_rewrite'::regclass AND dep.refclassid = 'pg_class'::regclass
+               UNION ALL
+               SELECT con.conname || ' ON ' || con.conrelid::regclass::text, con.confrelid, rel.relnamespace
+               FROM pg_constraint con
+               JOIN pg_class rel ON rel.oid = con.conrelid
+               WHERE con.contype = 'f'
+           ) deps
+           JOIN pg_class ref ON ref.oid = deps.ref_oid
+           JOIN pg_namespace ref_nsp ON ref_nsp.oid = ref.relnamespace
+           WHERE ref_nsp.nspname = %s AND deps.nsp <> ref_nsp.oid
+           ORDER BY 1, 2""",
+        [PREVIOUS_SCHEMA],
+    )
+    return [f"{dependent} -> {tbl}" for dependent, tbl in cursor.fetchall()]
+
+
+def drop_previous() -> bool:
+    """
+    Удаляет предыдущее поколение таблиц, если оно есть. Объекты, зависящие от его таблиц, не удаляются:
+    если они есть, выбрасывается ShadowSchemaError с их списком
+    """
+    connection = connections[DATABASE_ALIAS]
+    if connection.vendor != "postgresql":
+        return False
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=DATABASE_ALIAS), connection.cursor() as cursor:
+        if not _schema_exists(cursor, PREVIOUS_SCHEMA):
+            return False
+        dependents = _previous_dependents(cursor)
+        if dependents:
+            raise ShadowSchemaError(
+                f"Schema `{PREVIOUS_SCHEMA}` is not dropped, objects depend on its tables: {', '.join(dependents)}. "
+                "Recreate them on the current tables or drop them first"
+            )
+        cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s", [PREVIOUS_SCHEMA])
+        tables = [f"{quote_name(PREVIOUS_SCHEMA)}.{quote_name(row[0])}" for row in cursor.fetchall()]
+        if tables:
+            cursor.execute(f"DROP TABLE {', '.join(tables)} RESTRICT")
+        cursor.execute(f"DROP SCHEMA {quote_name(PREVIOUS_SCHEMA)} RESTRICT")
+    logger.info(f"Previous generation of tables in schema `{PREVIOUS_SCHEMA}` is dropped.")
+    return True
@@ -0,0 +1,88 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import os
+from dataclasses import dataclass
+from threading import Lock
+from typing import List, Union
+
+__all__ = ["BatchSizing", "AdaptiveBatchSize", "get_rss"]
+
+
+def get_rss() -> Union[int, None]:
+    """Текущий размер резидентной памяти процесса в байтах, если его можно узнать"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass(frozen=True)
+class BatchSizing:
+    """Границы адаптивного размера пачки"""
+
+    min_size: int = 1000
+    max_size: int = 100000
+    # Желаемое время записи одной пачки, секунд
+    target_latency: float = 2.0
+    # Предельный размер памяти процесса в байтах, 0 - без ограничения
+    max_rss: int = 0
+
+
+class AdaptiveBatchSize(object):
+    """
+    Размер пачки, подбираемый по времени записи предыдущих пачек.
+    Пока пачки пишутся быстрее целевого времени и скорость записи не падает, размер растёт
+    на постоянный шаг; при превышении времени записи или предела памяти размер уменьшается вдвое
+    """
+
+    def __init__(self, initial: int, sizing: BatchSizing):
+        self.sizing = sizing
+        self.size = self._clamp(initial)
+        self.sizes: List[int] = [self.size]
+        self.rows = 0
+        self.seconds = 0.0
+        self._step = max(1, self.size // 4)
+        self._rate = 0.0
+        # Время записи может сообщаться из нескольких потоков записи
+        self._lock = Lock()
+
+    def __call__(self) -> int:
+        return self.size
+
+    def _clamp(self, size: int) -> int:
+        return max(self.sizing.min_size, min(self.sizing.max_size, size))
+
+    def record(self, rows: int, seconds: float, rss: Union[int, None] = None) -> None:
+        with self._lock:
+            self.rows += rows
+            self.seconds += seconds
+            # Короткая пачка (конец файла) не показательна
+            if rows < self.size // 2:
+                return
+
+            rate = rows / max(seconds, 1e-6)
+            if rss is None and self.sizing.max_rss:
+                rss = get_rss()
+
+            size = self.size
+            if (self.sizing.max_rss and rss is not None and rss > self.sizing.max_rss) or (
+                seconds > self.sizing.target_latency * 1.5
+            ):
+                size = size // 2
+            elif seconds < self.sizing.target_latency and rate >= self._rate * 0.9:
+                size = size + self._step
+            self._rate = rate
+
+            size = self._clamp(size)
+            if size != self.size:
+                self.size = size
+                self.sizes.append(size)
+
+    def summary(self) -> str:
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        return (
+            f"final={self.size}, min={min(self.sizes)}, max={max(self.sizes)},"
+            f" changes={len(self.sizes) - 1}, rows/s={rate:.0f}"
+        )
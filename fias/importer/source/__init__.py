@@ -1,8 +1,16 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals
 
-from .archive import LocalArchiveTableList, RemoteArchiveTableList
+from .archive import (
+    LocalArchiveTableList,
+    RemoteArchiveTableList,
+    RemoteZipTableList,
+    is_selective,
+    prefetch_archives,
+)
+from .cache import ArchiveCache
 from .directory import DirectoryTableList
+from .streaming import StreamingArchiveTableList, is_streaming
 from .tablelist import TableList, TableListLoadingError
 
 __all__ = [
@@ -10,5 +18,11 @@ __all__ = [
     "TableListLoadingError",
     "LocalArchiveTableList",
     "RemoteArchiveTableList",
+    "RemoteZipTableList",
     "DirectoryTableList",
+    "ArchiveCache",
+    "StreamingArchiveTableList",
+    "is_selective",
+    "is_streaming",
+    "prefetch_archives",
 ]
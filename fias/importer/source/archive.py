@@ -4,7 +4,10 @@ from __future__ import absolute_import, unicode_literals
 import logging
 import os
 import zipfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Deque, Generator, Iterable, Tuple, Union
 from urllib.error import HTTPError
 from urllib.parse import urlparse
 
@@ -14,9 +17,11 @@ from progress.bar import Bar
 
 from fias.importer.signals import post_download, pre_download
 
+from ... import config
 from ..downloader import Downloader
+from .cache import ArchiveCache
 from .tablelist import TableList, TableListLoadingError
-from .wrapper import RarArchiveWrapper, SourceWrapper
+from .wrapper import RarArchiveWrapper, RemoteZipWrapper, SourceWrapper
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +32,41 @@ else:
 
 rarfile.UNRAR_TOOL = getattr(settings, "FIAS_UNRAR_TOOL", DEFAULT_UNRAR_TOOL)
 
+# Количество параллельных запросов диапазонов при скачивании архива, 1 - одним потоком
+DOWNLOAD_SEGMENTS: int = getattr(settings, "FIAS_DOWNLOAD_SEGMENTS", 1)
+# При ограниченном списке регионов из удалённых zip-архивов скачиваются только нужные файлы
+SELECTIVE_DOWNLOAD: bool = getattr(settings, "FIAS_SELECTIVE_DOWNLOAD", False)
+# Каталог постоянного кеша скачанных архивов, None - архивы не кешируются
+ARCHIVE_CACHE: Union[str, None] = getattr(settings, "FIAS_ARCHIVE_CACHE", None)
+# Предельный суммарный размер архивов в кеше в байтах, 0 - без ограничения
+ARCHIVE_CACHE_SIZE: int = getattr(settings, "FIAS_ARCHIVE_CACHE_SIZE", 0)
+
+
+def get_archive_cache() -> Union[ArchiveCache, None]:
+    if not ARCHIVE_CACHE:
+        return None
+    return ArchiveCache(ARCHIVE_CACHE, max_size=ARCHIVE_CACHE_SIZE)
+
+
+def download(
+    url: str, file_name: Union[Path, None], reporthook: Union[Callable[[int, int, int], None], None] = None
+) -> Path:
+    cache = get_archive_cache()
+    if cache is not None:
+        return cache.get(url, lambda path: _download(url, path, reporthook))
+    return _download(url, file_name, reporthook)
+
+
+def _download(
+    url: str, file_name: Union[Path, None], reporthook: Union[Callable[[int, int, int], None], None] = None
+) -> Path:
+    d = Downloader()
+    if DOWNLOAD_SEGMENTS > 1:
+        path, _ = d.download_segmented(url, file_name=file_name, segments=DOWNLOAD_SEGMENTS, reporthook=reporthook)
+    else:
+        path, _ = d.download(url, file_name=file_name, reporthook=reporthook)
+    return path
+
 
 class BadArchiveError(TableListLoadingError):
     pass
@@ -36,24 +76,63 @@ class RetrieveError(TableListLoadingError):
     pass
 
 
+def open_archive(source_path: Path) -> Union[rarfile.RarFile, zipfile.ZipFile]:
+    try:
+        archive = rarfile.RarFile(source_path)
+    # except (rarfile.NotRarFile, rarfile.BadRarFile) as e:
+    except Exception as e1:
+        try:
+            archive = zipfile.ZipFile(source_path)
+        except Exception as e2:
+            raise BadArchiveError(f"Archive: `{source_path}` corrupted or is not rar,zip-archive; {e1}; {e2}")
+
+    if not archive.namelist():
+        raise BadArchiveError(f"Archive: `{source_path}`, is empty")
+
+    return archive
+
+
+def verify_archive(source_path: Path) -> None:
+    """Проверяет, что архив открывается, а у zip-архива - и контрольные суммы файлов"""
+    archive = open_archive(source_path)
+    with archive:
+        if isinstance(archive, zipfile.ZipFile):
+            try:
+                bad_file = archive.testzip()
+            except Exception as e:
+                raise BadArchiveError(f"Archive: `{source_path}` corrupted; {e}")
+            if bad_file is not None:
+                raise BadArchiveError(f"Archive: `{source_path}` corrupted, bad file `{bad_file}`")
+
+
 class LocalArchiveTableList(TableList):
     wrapper_class = RarArchiveWrapper
 
     def load_data(self, source: str) -> SourceWrapper:
-        source_path = Path(source)
-        try:
-            archive = rarfile.RarFile(source_path)
-        # except (rarfile.NotRarFile, rarfile.BadRarFile) as e:
-        except Exception as e1:
-            try:
-                archive = zipfile.ZipFile(source_path)
-            except Exception as e2:
-                raise BadArchiveError(f"Archive: `{source_path}` corrupted or is not rar,zip-archive; {e1}; {e2}")
+        return self.wrapper_class(source=open_archive(Path(source)))
+
+
+def is_selective(url: str) -> bool:
+    """Архив по адресу можно читать выборочно, не скачивая целиком"""
+    return SELECTIVE_DOWNLOAD and config.REGIONS != config.ALL and urlparse(url).path.lower().endswith(".zip")
+
+
+class RemoteZipTableList(TableList):
+    """Удалённый zip-архив, из которого скачиваются только файлы выбранных таблиц и регионов"""
 
-        if not archive.namelist():
-            raise BadArchiveError(f"Archive: `{source_path}`, is empty")
+    wrapper_class = RemoteZipWrapper
 
-        return self.wrapper_class(source=archive)
+    def load_data(self, source: str) -> SourceWrapper:
+        logger.info(f"Reading archive contents from {source}.")
+        try:
+            wrapper = self.wrapper_class(source=source)
+        except HTTPError as e:
+            raise RetrieveError(f'Can not read data archive at url `{source}`. Error occurred: "{e}"')
+        except zipfile.BadZipFile as e:
+            raise BadArchiveError(f"Archive: `{source}` corrupted or is not zip-archive; {e}")
+        if not wrapper.get_file_list():
+            raise BadArchiveError(f"Archive: `{source}`, is empty")
+        return wrapper
 
 
 class DlProgressBar(Bar):  # type: ignore
@@ -66,6 +145,10 @@ class RemoteArchiveTableList(LocalArchiveTableList):
     download_progress_class = DlProgressBar
     _path: Path
 
+    def _wrapper_key(self) -> Tuple[Any, ...]:
+        # Архивы разных версий могут скачиваться в один и тот же файл
+        return super()._wrapper_key() + (str(getattr(self, "_path", "")),)
+
     def load_data(self, source: str) -> SourceWrapper:
         if not hasattr(self, "_path"):
             self._path = self._download_data(source)
@@ -85,11 +168,75 @@ class RemoteArchiveTableList(LocalArchiveTableList):
         logger.info(f"Downloading from {source}.")
         pre_download.send(sender=self.__class__, url=source)
         try:
-            d = Downloader()
-            path, _ = d.download(source, file_name=tmp_path, reporthook=update_progress)
+            path = download(source, file_name=tmp_path, reporthook=update_progress)
         except HTTPError as e:
             raise RetrieveError(f'Can not download data archive at url `{source}`. Error occurred: "{e}"')
         progress.finish()
         post_download.send(sender=self.__class__, url=source, path=path)
         logger.info(f"Downloaded from {source} into {path}.")
         return path
+
+
+def _prefetch(url: str, index: int, tempdir: Union[Path, None]) -> Path:
+    if tempdir is not None:
+        # Архивы дельт разных версий называются одинаково
+        tmp_path = tempdir / f"{index:04d}_{urlparse(url).path.split('/')[-1]}"
+    else:
+        tmp_path = None
+    logger.info(f"Prefetching from {url}.")
+    pre_download.send(sender=prefetch_archives, url=url)
+    try:
+        path = download(url, file_name=tmp_path)
+    except HTTPError as e:
+        raise RetrieveError(f'Can not download data archive at url `{url}`. Error occurred: "{e}"')
+    try:
+        verify_archive(path)
+    except BadArchiveError:
+        # Испорченный архив удаляется и из кеша: при следующем обращении он будет скачан заново
+        path.unlink(True)
+        raise
+    post_download.send(sender=prefetch_archives, url=url, path=path)
+    logger.info(f"Prefetched from {url} into {path}.")
+    return path
+
+
+def _remove(path: Path) -> None:
+    cache = get_archive_cache()
+    if cache is not None and path in cache:
+        return
+    try:
+        path.unlink(True)
+    except OSError:
+        pass
+
+
+def prefetch_archives(
+    urls: Iterable[str], tempdir: Union[Path, None] = None, lookahead: int = 1
+) -> Generator[Path, None, None]:
+    """
+    Скачивает архивы в фоновом потоке и выдаёт пути к ним строго в порядке адресов.
+    Пока обрабатывается выданный архив, скачиваются не больше lookahead следующих.
+    Выданный архив удаляется, когда запрошен следующий; архивы из кеша остаются в кеше
+    """
+    urls = list(urls)
+    futures: Deque[Future[Path]] = deque()
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="fias-prefetch") as executor:
+        try:
+            for index in range(len(urls)):
+                while submitted < len(urls) and submitted <= index + lookahead:
+                    futures.append(executor.submit(_prefetch, urls[submitted], submitted, tempdir))
+                    submitted += 1
+                path = futures.popleft().result()
+                try:
+                    yield path
+                finally:
+                    _remove(path)
+        finally:
+            # Обработка прервана: скачанные заранее архивы не нужны
+            for future in futures:
+                if not future.cancel():
+                    try:
+                        _remove(future.result())
+                    except Exception:
+                        pass
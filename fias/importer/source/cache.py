@@ -0,0 +1,250 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Event, Thread
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+from urllib.parse import urlparse
+
+from ..downloader import probe_range
+
+__all__ = ["ArchiveCache"]
+
+logger = logging.getLogger(__name__)
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json(path: Path, data: Dict[str, Union[str, int]]) -> None:
+    tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path) -> Union[Dict[str, Union[str, int]], None]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class ArchiveCache(object):
+    """
+    Постоянный кеш скачанных архивов. Архивы хранятся под именем SHA-256 своего содержимого (blobs),
+    а индекс (index) сопоставляет ключу "адрес, размер, ETag/Last-Modified" хеш архива.
+    Перед повторным использованием архив проверяется по размеру и хешу; хеш не пересчитывается,
+    пока файл архива не менялся с последней проверки. Время последнего использования архива - время
+    изменения его файла метаданных; при превышении max_size удаляются давно не использованные архивы.
+    Кеш может лежать на общей файловой системе нескольких хостов: скачивание архива защищено
+    файлом блокировки, а готовые файлы появляются в кеше атомарным переименованием
+    """
+
+    # Блокировка, которую не обновляли дольше этого времени, считается брошенной
+    lock_timeout = 600.0
+    lock_heartbeat = 60.0
+    lock_poll = 1.0
+
+    def __init__(self, directory: Union[Path, str], max_size: int = 0):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.blobs_dir = self.directory / "blobs"
+        self.index_dir = self.directory / "index"
+        self.tmp_dir = self.directory / "tmp"
+        for path in (self.blobs_dir, self.index_dir, self.tmp_dir):
+            path.mkdir(parents=True, exist_ok=True)
+
+    def __contains__(self, path: object) -> bool:
+        return isinstance(path, Path) and path.parent == self.blobs_dir
+
+    @staticmethod
+    def get_key(url: str, timeout: float = 60.0) -> Union[str, None]:
+        """Ключ архива по адресу; None, если сервер не сообщает ни размер, ни версию файла"""
+        size, headers = probe_range(url, timeout=timeout)
+        if size is None and headers.get("content-length", "").isdigit():
+            size = int(headers["content-length"])
+        validator = headers.get("etag") or headers.get("last-modified") or ""
+        if size is None and not validator:
+            return None
+        return hashlib.sha256(f"{url}\n{size}\n{validator}".encode("utf-8")).hexdigest()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / digest
+
+    def _meta_path(self, digest: str) -> Path:
+        return self.blobs_dir / f"{digest}.json"
+
+    def _touch(self, digest: str) -> None:
+        try:
+            os.utime(self._meta_path(digest))
+        except OSError:
+            pass
+
+    def _verify(self, digest: str) -> bool:
+        path = self._blob_path(digest)
+        meta = _read_json(self._meta_path(digest))
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        if meta is None or meta.get("size") != stat.st_size:
+            return False
+        if meta.get("mtime_ns") == stat.st_mtime_ns:
+            return True
+
+        if _file_hash(path) != digest:
+            return False
+        meta["mtime_ns"] = stat.st_mtime_ns
+        _write_json(self._meta_path(digest), meta)
+        return True
+
+    def _remove_blob(self, digest: str) -> None:
+        for path in (self._blob_path(digest), self._meta_path(digest)):
+            try:
+                path.unlink(True)
+            except OSError:
+                pass
+
+    def lookup(self, key: str) -> Union[Path, None]:
+        """Проверенный архив по ключу, если он есть в кеше"""
+        entry = _read_json(self.index_dir / f"{key}.json")
+        if entry is None:
+            return None
+        digest = str(entry.get("sha256", ""))
+        if not self._verify(digest):
+            logger.warning(
+                f"Cached archive for {entry.get('url')} is missing or corrupted, it will be downloaded again."
+            )
+            self._remove_blob(digest)
+            return None
+        self._touch(digest)
+        return self._blob_path(digest)
+
+    def store(self, key: str, url: str, path: Path) -> Path:
+        """Переносит скачанный архив в кеш и возвращает его новый путь"""
+        digest = _file_hash(path)
+        blob_path = self._blob_path(digest)
+        if self._verify(digest):
+            path.unlink()
+        else:
+            os.replace(path, blob_path)
+            _write_json(
+                self._meta_path(digest), {"size": blob_path.stat().st_size, "mtime_ns": blob_path.stat().st_mtime_ns}
+            )
+        _write_json(self.index_dir / f"{key}.json", {"url": url, "sha256": digest})
+        self.evict(keep=digest)
+        return blob_path
+
+    def evict(self, keep: Union[str, None] = None) -> int:
+        """Удаляет давно не использованные архивы, пока кеш больше max_size. Возвращает число удалённых"""
+        if not self.max_size:
+            return 0
+        blobs: List[Tuple[float, int, str]] = []
+        for meta_path in self.blobs_dir.glob("*.json"):
+            digest = meta_path.name[: -len(".json")]
+            try:
+                blobs.append((meta_path.stat().st_mtime, self._blob_path(digest).stat().st_size, digest))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in blobs)
+        removed = 0
+        for _, size, digest in sorted(blobs):
+            if total <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            self._remove_blob(digest)
+            logger.info(f"Archive {digest} is evicted from cache.")
+            total -= size
+            removed += 1
+
+        # Записи индекса удалённых архивов
+        for index_path in self.index_dir.glob("*.json"):
+            entry = _read_json(index_path)
+            if entry is not None and not self._blob_path(str(entry.get("sha256", ""))).exists():
+                index_path.unlink(True)
+        return removed
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        path = self.index_dir / f"{key}.lock"
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                try:
+                    if time.time() - path.stat().st_mtime > self.lock_timeout:
+                        logger.warning(f"Stale cache lock {path} is removed.")
+                        path.unlink(True)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(self.lock_poll)
+                continue
+            os.write(fd, owner.encode("utf-8"))
+            os.close(fd)
+            break
+
+        # Пока архив скачивается, блокировка обновляется, чтобы другие хосты не сочли её брошенной
+        stop = Event()
+
+        def heartbeat() -> None:
+            while not stop.wait(self.lock_heartbeat):
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+        thread = Thread(target=heartbeat, name="fias-cache-lock", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            path.unlink(True)
+
+    def get(self, url: str, fetch: Callable[[Path], Path]) -> Path:
+        """
+        Архив по адресу из кеша. При промахе архив скачивается функцией fetch во временный файл кеша
+        и сохраняется в кеш. Если ключ архива определить нельзя, архив скачивается без кеша
+        """
+        key = self.get_key(url)
+        name = urlparse(url).path.split("/")[-1]
+        if key is None:
+            logger.warning(f"Server does not report size or version of {url}, archive is not cached.")
+            return fetch(self.tmp_dir / f"{socket.gethostname()}.{os.getpid()}.{name}")
+
+        path = self.lookup(key)
+        if path is not None:
+            logger.info(f"Using cached archive {path} for {url}.")
+            return path
+
+        with self._lock(key):
+            # Архив мог скачать другой процесс, пока мы ждали блокировку
+            path = self.lookup(key)
+            if path is not None:
+                logger.info(f"Using cached archive {path} for {url}.")
+                return path
+            tmp_path = fetch(self.tmp_dir / f"{key}.{name}")
+            path = self.store(key, url, tmp_path)
+        logger.info(f"Archive from {url} is cached as {path}.")
+        return path
@@ -0,0 +1,233 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import io
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from threading import Thread
+from typing import Any, Dict, Union
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from fias.importer.signals import post_download, pre_download
+
+from ..downloader import Downloader, RangeReader
+from .archive import BadArchiveError, RetrieveError
+from .tablelist import TableList
+from .wrapper import RarArchiveWrapper, SourceWrapper
+
+logger = logging.getLogger(__name__)
+
+# Файлы удалённых zip-архивов загружаются по мере скачивания архива
+STREAMING_DOWNLOAD: bool = getattr(settings, "FIAS_STREAMING_DOWNLOAD", False)
+
+
+def is_streaming(url: str) -> bool:
+    return STREAMING_DOWNLOAD and urlparse(url).path.lower().endswith(".zip")
+
+
+class _TailReader(RangeReader):
+    """Запоминает самую раннюю позицию, прочитанную при разборе оглавления архива"""
+
+    lowest: Union[int, None] = None
+
+    def readinto(self, buffer: Any) -> int:
+        self.lowest = self.tell() if self.lowest is None else min(self.lowest, self.tell())
+        return super().readinto(buffer)
+
+
+class GrowingFile(io.RawIOBase):
+    """
+    Архив, который ещё скачивается. Оглавление в конце архива читается из заранее скачанного хвоста,
+    чтение остальных данных ждёт, пока скачивание дойдёт до них. Скачивание может идти в другом процессе,
+    поэтому его ход определяется по размеру файла
+    """
+
+    poll_interval = 0.2
+    # Если файл не растёт столько секунд, скачивание считается зависшим
+    stall_timeout = 600.0
+
+    def __init__(self, path: Path, size: int, tail_start: int):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.tail_start = tail_start
+        self._pos = 0
+        self._fd: Union[io.FileIO, None] = None
+
+    @staticmethod
+    def tail_path(path: Path) -> Path:
+        return path.with_name(path.name + ".tail")
+
+    @staticmethod
+    def failed_path(path: Path) -> Path:
+        return path.with_name(path.name + ".failed")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def _downloaded(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _wait(self, end: int) -> int:
+        """Ждёт, пока будет скачан хотя бы один байт до end, и возвращает размер скачанного"""
+        downloaded = self._downloaded()
+        changed = time.monotonic()
+        while downloaded <= self._pos and downloaded < end:
+            failed = self.failed_path(self.path)
+            if failed.exists():
+                raise RetrieveError(f"Download of `{self.path}` failed: {failed.read_text(encoding='utf-8')}")
+            if time.monotonic() - changed > self.stall_timeout:
+                raise RetrieveError(f"Download of `{self.path}` stalled at {downloaded} bytes")
+            time.sleep(self.poll_interval)
+            current = self._downloaded()
+            if current != downloaded:
+                downloaded, changed = current, time.monotonic()
+        return downloaded
+
+    def _read_at(self, path: Path, offset: int, buffer: memoryview) -> int:
+        with path.open("rb", buffering=0) as f:
+            f.seek(offset)
+            return int(f.readinto(buffer) or 0)
+
+    def readinto(self, buffer: Any) -> int:
+        size = min(len(buffer), self.size - self._pos)
+        if size <= 0:
+            return 0
+        view = memoryview(buffer)
+        if self._pos >= self.tail_start and self._downloaded() < self.size:
+            try:
+                read = self._read_at(self.tail_path(self.path), self._pos - self.tail_start, view[:size])
+            except FileNotFoundError:
+                # Хвост удаляется после завершения скачивания
+                read = self._read_at(self.path, self._pos, view[:size])
+        else:
+            end = self.size if self._pos >= self.tail_start else self.tail_start
+            downloaded = self._wait(end)
+            if self._fd is None:
+                self._fd = io.FileIO(self.path, "rb")
+            self._fd.seek(self._pos)
+            read = int(self._fd.readinto(view[: min(size, end - self._pos, downloaded - self._pos)]) or 0)
+        self._pos += read
+        return read
+
+    def close(self) -> None:
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        super().close()
+
+
+class StreamingArchiveTableList(TableList):
+    """
+    Удалённый zip-архив, файлы которого загружаются по мере скачивания архива.
+    Оглавление читается заранее запросами диапазонов, архив скачивается одним потоком в фоне,
+    а чтение файла таблицы ждёт, пока скачивание дойдёт до его данных
+    """
+
+    wrapper_class = RarArchiveWrapper
+    _path: Path
+    _size: int
+    _tail_start: int
+    _thread: Union[Thread, None] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = super().__getstate__()
+        state.pop("_thread", None)
+        return state
+
+    def load_data(self, source: str) -> SourceWrapper:
+        if not hasattr(self, "_path"):
+            self._start_download(source)
+        archive = zipfile.ZipFile(io.BufferedReader(GrowingFile(self._path, self._size, self._tail_start)))
+        if not archive.namelist():
+            raise BadArchiveError(f"Archive: `{source}`, is empty")
+        return self.wrapper_class(source=archive)
+
+    def _start_download(self, source: str) -> None:
+        reader = _TailReader(source)
+        try:
+            zipfile.ZipFile(io.BufferedReader(reader)).close()
+        except zipfile.BadZipFile as e:
+            raise BadArchiveError(f"Archive: `{source}` corrupted or is not zip-archive; {e}")
+        tail_start = reader.lowest or 0
+        reader.seek(tail_start)
+        tail = reader.read() or b""
+        reader.close()
+
+        if self.tempdir is not None:
+            path = self.tempdir / urlparse(source).path.split("/")[-1]
+        else:
+            fd, name = tempfile.mkstemp(suffix=".zip")
+            os.close(fd)
+            path = Path(name)
+        GrowingFile.failed_path(path).unlink(True)
+        GrowingFile.tail_path(path).write_bytes(tail)
+        path.write_bytes(b"")
+
+        self._path = path
+        self._size = reader.size
+        self._tail_start = tail_start
+        self._thread = Thread(target=self._download, args=(source,), name="fias-stream", daemon=True)
+        self._thread.start()
+
+    def _download(self, source: str) -> None:
+        logger.info(f"Downloading from {source}, tables are loaded as their data arrive.")
+        pre_download.send(sender=self.__class__, url=source)
+        try:
+            Downloader().download(source, file_name=self._path, reporthook=None)
+        except BaseException as e:
+            GrowingFile.failed_path(self._path).write_text(str(e) or e.__class__.__name__, encoding="utf-8")
+            logger.error(f"Can not download data archive at url `{source}`. Error occurred: {e}")
+            return
+        GrowingFile.tail_path(self._path).unlink(True)
+        post_download.send(sender=self.__class__, url=source, path=self._path)
+        logger.info(f"Downloaded from {source} into {self._path}.")
+
+    def get_file_offset(self, filename: str) -> int:
+        """Смещение файла в архиве: файлы становятся доступны в порядке смещений"""
+        return int(self.wrapper.source.getinfo(filename).header_offset)
+
+    def wait(self) -> None:
+        """
+        Ждёт окончания скачивания архива после загрузки всех таблиц. Удаляет служебные файлы скачивания
+        и временный архив, если не задан tempdir. RetrieveError - скачивание не удалось
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not hasattr(self, "_path"):
+            return
+        failed = GrowingFile.failed_path(self._path)
+        try:
+            if failed.exists():
+                raise RetrieveError(f"Download of `{self._path}` failed: {failed.read_text(encoding='utf-8')}")
+        finally:
+            failed.unlink(True)
+            GrowingFile.tail_path(self._path).unlink(True)
+            if self.tempdir is None:
+                self._path.unlink(True)
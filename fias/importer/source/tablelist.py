@@ -2,8 +2,10 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+from collections import OrderedDict
 from pathlib import Path
-from typing import IO, Any, Dict, List, Type, Union
+from threading import Lock
+from typing import IO, Any, Dict, List, Tuple, Type, Union
 
 from django.utils.functional import cached_property
 
@@ -20,6 +22,13 @@ class TableListLoadingError(Exception):
     pass
 
 
+# Открытые источники в процессе пула: задачи всех таблиц и версий, пришедшие в процесс,
+# используют уже открытый архив своего источника вместо открытия его при каждой распаковке задачи
+WRAPPER_CACHE_SIZE = 4
+_wrapper_cache: "OrderedDict[Tuple[Any, ...], SourceWrapper]" = OrderedDict()
+_wrapper_cache_lock = Lock()
+
+
 class TableList(AbstractTableList):
     src: Any
     wrapper_class: Type[SourceWrapper] = SourceWrapper
@@ -51,7 +60,20 @@ class TableList(AbstractTableList):
 
     def __setstate__(self, state: Dict[str, Any]) -> None:
         self.__dict__.update(state)
-        self._init_wrapper()
+        key = self._wrapper_key()
+        with _wrapper_cache_lock:
+            wrapper = _wrapper_cache.get(key)
+            if wrapper is not None:
+                _wrapper_cache.move_to_end(key)
+                self.wrapper = wrapper
+                return
+            self._init_wrapper()
+            _wrapper_cache[key] = self.wrapper
+            while len(_wrapper_cache) > WRAPPER_CACHE_SIZE:
+                _wrapper_cache.popitem(last=False)
+
+    def _wrapper_key(self) -> Tuple[Any, ...]:
+        return self.__class__, str(self.src)
 
     def load_data(self, source: Any) -> SourceWrapper:
         return self.wrapper_class(source=source)
@@ -82,6 +104,9 @@ class TableList(AbstractTableList):
 
         return self.date
 
+    def get_file_size(self, filename: str) -> int:
+        return self.wrapper.get_file_size(filename=filename)
+
     def open(self, filename: str) -> IO[bytes]:
         return self.wrapper.open(filename=filename)
 
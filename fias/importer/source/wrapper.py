@@ -2,6 +2,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import io
 import re
 import shutil
 from pathlib import Path
@@ -10,6 +11,8 @@ from zipfile import ZipFile
 
 from rarfile import NoRarEntry, RarFile
 
+from ..downloader import RangeReader
+
 
 class SourceWrapper(object):
     source: Any = None
@@ -38,6 +41,9 @@ class SourceWrapper(object):
     def get_file_list(self) -> List[str]:
         raise NotImplementedError()
 
+    def get_file_size(self, filename: str) -> int:
+        raise NotImplementedError()
+
     def open(self, filename: str) -> IO[bytes]:
         raise NotImplementedError()
 
@@ -60,6 +66,9 @@ class DirectoryWrapper(SourceWrapper):
     def get_file_list(self) -> List[str]:
         return [f.name for f in self.source.iterdir() if (not f.name.startswith(".") and (self.source / f).is_file())]
 
+    def get_file_size(self, filename: str) -> int:
+        return (self.source / filename).stat().st_size
+
     def get_full_path(self, filename: str) -> Path:
         return self.source / filename
 
@@ -84,5 +93,22 @@ class RarArchiveWrapper(SourceWrapper):
     def get_file_list(self) -> List[str]:
         return self.source.namelist()
 
+    def get_file_size(self, filename: str) -> int:
+        return int(self.source.getinfo(filename).file_size)
+
     def open(self, filename: str) -> IO[bytes]:
         return self.source.open(filename)
+
+
+class RemoteZipWrapper(RarArchiveWrapper):
+    """
+    Zip-архив на HTTP-сервере: через запросы диапазонов читаются только оглавление архива
+    и файлы, которые открываются для загрузки
+    """
+
+    # Размер буфера чтения поверх запросов диапазонов
+    buffer_size = 64 * 1024
+
+    def __init__(self, source: str, **kwargs: Any):
+        reader = io.BufferedReader(RangeReader(source), buffer_size=self.buffer_size)
+        super(RemoteZipWrapper, self).__init__(source=ZipFile(reader), **kwargs)
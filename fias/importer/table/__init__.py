@@ -4,7 +4,8 @@ from __future__ import absolute_import, unicode_literals
 import re
 from typing import Any, Union
 
-from .table import BadTableError, Table, UnregisteredTable, get_model
+from .netchange import NetChangeTable
+from .table import BadTableError, Table, UnregisteredTable, get_model, get_table_refs
 from .xml import XMLTable
 
 table_xml_pattern = (
@@ -13,7 +14,7 @@ table_xml_pattern = (
 table_xml_re = re.compile(table_xml_pattern, re.I)
 
 
-__all__ = ["Table", "BadTableError", "TableFactory", "get_model"]
+__all__ = ["Table", "NetChangeTable", "BadTableError", "TableFactory", "get_model", "get_table_refs"]
 
 
 class BadTableNameError(Exception):
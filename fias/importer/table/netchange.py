@@ -0,0 +1,96 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+from ..filters import RawPredicate
+from ..record import Record, get_record_class
+from .table import AbstractTableList, Table, TableIterator
+
+__all__ = ["NetChangeTable", "NetChangeIterator"]
+
+# Части таблицы одного региона в разных дельтах: (список таблиц дельты, таблица) по возрастанию версий
+TablePart = Tuple[AbstractTableList, Table]
+
+
+class NetChangeIterator(TableIterator):
+    """
+    Итоговые изменения таблицы по нескольким дельтам: из всех версий записи остаётся самая свежая
+    по дате обновления, а при равных датах - по версии дельты. Записи частей собираются в память
+    при первом чтении, фильтры и проверки исходных атрибутов применяются итераторами частей
+    """
+
+    # Размер пачки чтения частей
+    read_size = 10000
+
+    def __init__(self, parts: List[TablePart], raw_predicates: Union[Iterable[RawPredicate], None] = None):
+        # Итератор не читает файл сам, поэтому TableIterator.__init__ не вызывается
+        self.model = parts[-1][1].model
+        self.record_class = get_record_class(self.model)
+        self._filters = None
+        self._batch_filters = []
+        self._raw_predicates = list(raw_predicates or [])
+        self.raw_rejected = 0
+        self.filtered = 0
+        # Записи, заменённые более свежими версиями из следующих дельт
+        self.superseded = 0
+        self._parts = parts
+        self._items: Union[Iterator[Record], None] = None
+
+    def _collect(self) -> Iterator[Record]:
+        latest: Dict[Any, Record] = {}
+        for tablelist, table in self._parts:
+            rows = table.rows(tablelist=tablelist, raw_predicates=self._raw_predicates)
+            for batch in rows.batches(self.read_size):
+                for item in batch:
+                    prev = latest.get(item.pk)
+                    if prev is not None:
+                        self.superseded += 1
+                        if (prev.updatedate, prev.ver) > (item.updatedate, item.ver):
+                            continue
+                    latest[item.pk] = item
+            self.raw_rejected += rows.raw_rejected
+            self.filtered += rows.filtered
+        return iter(latest.values())
+
+    def read_item(self) -> Union[Record, None]:
+        if self._items is None:
+            self._items = self._collect()
+        return next(self._items)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return super().get_stats() | {"superseded": self.superseded}
+
+
+class NetChangeTable(Table):
+    """Таблица одного региона, собранная из нескольких дельт для однократного применения итоговых изменений"""
+
+    iterator_class = NetChangeIterator
+
+    def __init__(self, parts: List[TablePart]):
+        if not parts:
+            raise ValueError("Net change table requires at least one part")
+        last = parts[-1][1]
+        super(NetChangeTable, self).__init__(
+            filename=last.filename, name=last.name, ver=last.ver, deleted=last.deleted, region=last.region
+        )
+        self.parts = parts
+
+    @property
+    def label(self) -> str:
+        if len(self.parts) == 1:
+            return self.filename
+        return f"{self.filename} [{len(self.parts)} deltas]"
+
+    def after(self, ver: int) -> "NetChangeTable":
+        """Таблица без частей дельт, уже применённых к версии ver"""
+        parts = [(tablelist, table) for tablelist, table in self.parts if table.ver > ver]
+        return NetChangeTable(parts) if parts and len(parts) != len(self.parts) else self
+
+    def get_size(self, tablelist: AbstractTableList) -> int:
+        return sum(table.get_size(part_tablelist) for part_tablelist, table in self.parts)
+
+    def rows(
+        self, tablelist: AbstractTableList, raw_predicates: Union[Iterable[RawPredicate], None] = None
+    ) -> TableIterator:
+        return NetChangeIterator(self.parts, raw_predicates)
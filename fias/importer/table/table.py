@@ -1,11 +1,21 @@
 # coding: utf-8
 from __future__ import absolute_import, annotations, unicode_literals
 
-from typing import IO, Any, Callable, Dict, Iterable, Type, Union
+from itertools import compress
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Type, Union
 
 from django.db import connections, router
 
 from fias.config import TABLE_ROW_FILTERS, TableName
+from fias.importer.filters import (
+    RAW_FILTERS,
+    BatchFilter,
+    ItemFilter,
+    RawPredicate,
+    as_batch_filter,
+    as_item_filter,
+)
+from fias.importer.record import Record, get_record_class
 from fias.models import (
     AbstractModel,
     AddHouseType,
@@ -19,6 +29,7 @@ from fias.models import (
     MunHierarchy,
     ParamType,
 )
+from fias.models.fields import RefFieldMixin
 
 table_names: Dict[TableName, Type[AbstractModel]] = {
     TableName.HOUSE: House,
@@ -40,6 +51,16 @@ def get_model(table: TableName) -> Type[AbstractModel]:
     return table_names[table]
 
 
+def get_table_refs(table: TableName) -> List[TableName]:
+    """Таблицы, на записи которых ссылаются поля RefField таблицы"""
+    model_tables: Dict[Any, TableName] = {model: name for name, model in table_names.items()}
+    refs: List[TableName] = []
+    for field in get_model(table)._meta.get_fields():
+        if isinstance(field, RefFieldMixin):
+            refs += [model_tables[model] for model, _ in field.to if model_tables[model] not in refs]
+    return refs
+
+
 name_trans: Dict[str, str] = {
     "houses": TableName.HOUSE,
     "house_types": TableName.HOUSE_TYPE,
@@ -70,43 +91,108 @@ class RowConvertor(object):
     def convert(self, row: Dict[str, Any]) -> Dict[str, Any]:
         raise NotImplementedError()
 
-    def clear(self, row: Dict[str, Any]) -> Dict[str, Any]:
-        raise NotImplementedError()
-
 
 class TableIterator:
     _fd: Any
     model: Type[AbstractModel]
+    record_class: Type[Record]
     row_convertor: RowConvertor
-    _filters: Union[Iterable[Callable[[AbstractModel], Union[None, AbstractModel]]], None]
+    _filters: Union[List[ItemFilter], None]
+    _batch_filters: List[BatchFilter]
+    _raw_predicates: List[RawPredicate]
+    raw_rejected: int
+    filtered: int
 
     _reverse_table_names = {v._meta.object_name: k for k, v in table_names.items()}
 
-    def __init__(self, fd: Any, model: Type[AbstractModel], row_convertor: RowConvertor):
+    def __init__(
+        self,
+        fd: Any,
+        model: Type[AbstractModel],
+        row_convertor: RowConvertor,
+        raw_predicates: Union[Iterable[RawPredicate], None] = None,
+    ):
         self._fd = fd
         self.model = model
+        self.record_class = get_record_class(model)
         self.row_convertor = row_convertor
-        self._filters = TABLE_ROW_FILTERS.get(self._reverse_table_names[self.model._meta.object_name], None)
+        filters = TABLE_ROW_FILTERS.get(self._reverse_table_names[self.model._meta.object_name], None)
+        self._filters = None if filters is None else [as_item_filter(f) for f in filters]
+        self._batch_filters = [as_batch_filter(f) for f in filters or []]
+
+        # Встроенные фильтры дополнительно проверяются на исходных атрибутах, до преобразования строки
+        self._raw_predicates = list(raw_predicates or [])
+        for filter_func in filters or []:
+            if filter_func in RAW_FILTERS:
+                self._raw_predicates.append(RAW_FILTERS[filter_func])
+        self.raw_rejected = 0
+        self.filtered = 0
 
     def __iter__(self) -> Union[TableIterator]:
         return self
 
-    def get_next(self) -> Union[AbstractModel, None]:
+    def read_item(self) -> Union[Record, None]:
+        """Следующая запись без применения фильтров, None - если строка отброшена при разборе"""
         raise NotImplementedError()
 
+    def get_next(self) -> Union[Record, None]:
+        item = self.read_item()
+        if item is None:
+            return None
+        return self.filter_item(item)
+
+    def batches(self, size: Union[int, Callable[[], int]]) -> Iterator[List[Record]]:
+        """
+        Пачки записей, прошедших фильтры. Фильтры применяются сразу ко всей пачке,
+        количество отброшенных записей учитывается в filtered.
+        Размер может быть функцией: тогда он запрашивается перед каждой пачкой
+        """
+        finished = False
+        while not finished:
+            batch: List[Record] = []
+            batch_size = size() if callable(size) else size
+            try:
+                while len(batch) < batch_size:
+                    item = self.read_item()
+                    if item is None:
+                        self.filtered += 1
+                    else:
+                        batch.append(item)
+            except StopIteration:
+                finished = True
+
+            for batch_filter in self._batch_filters:
+                if not batch:
+                    break
+                kept = list(compress(batch, batch_filter(batch)))
+                self.filtered += len(batch) - len(kept)
+                batch = kept
+
+            if batch:
+                yield batch
+
     def format_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
         raise NotImplementedError()
 
-    def process_row(self, row: Dict[str, Any]) -> Union[AbstractModel, None]:
+    def get_stats(self) -> Dict[str, Any]:
+        return {"raw_rejected": self.raw_rejected, "filtered": self.filtered}
+
+    def accept_raw(self, row: Any) -> bool:
+        for predicate in self._raw_predicates:
+            if not predicate(row):
+                self.raw_rejected += 1
+                return False
+        return True
+
+    def convert_row(self, row: Dict[str, Any]) -> Union[Record, None]:
         try:
-            row = dict(self.format_row(row))
+            row = self.format_row(row)
         except ParentLookupException:
             return None
 
-        row = self.row_convertor.convert(row)
-        row = self.row_convertor.clear(row)
+        return self.record_class(**self.row_convertor.convert(row))
 
-        item: AbstractModel = self.model(**row)
+    def filter_item(self, item: Record) -> Union[Record, None]:
         if self._filters is not None:
             for filter_func in self._filters:
                 filtered_item = filter_func(item)
@@ -116,7 +202,13 @@ class TableIterator:
 
         return item
 
-    def __next__(self) -> Union[AbstractModel, None]:
+    def process_row(self, row: Dict[str, Any]) -> Union[Record, None]:
+        item = self.convert_row(row)
+        if item is None:
+            return None
+        return self.filter_item(item)
+
+    def __next__(self) -> Union[Record, None]:
         return self.get_next()
 
     next = __next__
@@ -126,6 +218,9 @@ class AbstractTableList:
     def open(self, filename: str) -> IO[bytes]:
         raise NotImplementedError()
 
+    def get_file_size(self, filename: str) -> int:
+        raise NotImplementedError()
+
     def __getstate__(self) -> Dict[str, Any]:
         raise NotImplementedError()
 
@@ -139,6 +234,8 @@ class Table(object):
     deleted: bool
     region: Union[str, None]
     ver: int
+    # Номер части и количество частей, если файл таблицы загружается по частям
+    part: Union[Tuple[int, int], None] = None
     iterator_class: Type[TableIterator] = TableIterator
 
     def __init__(
@@ -172,8 +269,24 @@ class Table(object):
     def truncate(self) -> None:
         self._truncate(self.model)
 
+    @property
+    def label(self) -> str:
+        if self.part is None:
+            return self.filename
+        return f"{self.filename} [{self.part[0] + 1}/{self.part[1]}]"
+
     def open(self, tablelist: AbstractTableList) -> IO[bytes]:
         return tablelist.open(self.filename)
 
-    def rows(self, tablelist: AbstractTableList) -> TableIterator:
+    def get_size(self, tablelist: AbstractTableList) -> int:
+        """Размер распакованного файла таблицы (или её части) в байтах"""
+        return tablelist.get_file_size(self.filename)
+
+    def split(self, tablelist: AbstractTableList, size: int) -> List[Table]:
+        """Делит файл таблицы на части размером около size байт, которые можно загружать параллельно"""
+        return [self]
+
+    def rows(
+        self, tablelist: AbstractTableList, raw_predicates: Union[Iterable[RawPredicate], None] = None
+    ) -> TableIterator:
         raise NotImplementedError()
@@ -2,12 +2,30 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
-from typing import Any, Dict, Set, Type, Union
+import io
+import re
+from copy import copy
+from functools import lru_cache
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 from django.db import models
 from lxml import etree
 
 from ...models import AbstractModel
+from ..filters import RawPredicate
+from ..record import Record
 from .table import AbstractTableList, BadTableError, RowConvertor, Table, TableIterator
 
 _bom_header = b"\xef\xbb\xbf"
@@ -19,9 +37,74 @@ field_map: Dict[str, Dict[str, str]] = {
 }
 
 
+_true_values = frozenset(("1", "y", "yes", "t", "true", "on", "+"))
+
+# (имя атрибута записи, функция преобразования строкового значения или None, если значение не преобразуется)
+Converter = Tuple[str, Union[Callable[[str], Any], None]]
+
+
+def _to_uuid(value: str) -> Union[str, None]:
+    return value or None
+
+
+def _to_related(value: str) -> Union[str, None]:
+    return None if value == "" else value
+
+
+def _to_int(value: str) -> Union[int, None]:
+    return None if value == "" else int(value)
+
+
+def _to_bool(value: str) -> bool:
+    return value in _true_values
+
+
+class DateDecoder(object):
+    """
+    Разбор дат с кэшированием результатов.
+    В выгрузке всего несколько тысяч различных дат (например, 2079-06-06 почти в каждой строке)
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.decode = lru_cache(maxsize=maxsize)(self._decode)
+
+    @staticmethod
+    def _decode(value: str) -> Union[datetime.date, None]:
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            return datetime.datetime.strptime(value, "%d.%m.%y %H:%M:%S").date()
+
+    @property
+    def hits(self) -> int:
+        return self.decode.cache_info().hits
+
+    @property
+    def misses(self) -> int:
+        return self.decode.cache_info().misses
+
+    @property
+    def hit_rate(self) -> float:
+        info = self.decode.cache_info()
+        total = info.hits + info.misses
+        return info.hits / total if total else 0.0
+
+
 class XMLIterator(TableIterator):
-    def __init__(self, fd: Any, model: Type[AbstractModel], row_convertor: RowConvertor):
-        super(XMLIterator, self).__init__(fd=fd, model=model, row_convertor=row_convertor)
+    _converters: Dict[str, Union[Converter, None]]
+
+    def __init__(
+        self,
+        fd: Any,
+        model: Type[AbstractModel],
+        row_convertor: RowConvertor,
+        raw_predicates: Union[Iterable[RawPredicate], None] = None,
+    ):
+        super(XMLIterator, self).__init__(
+            fd=fd, model=model, row_convertor=row_convertor, raw_predicates=raw_predicates
+        )
 
         self.related_fields = dict(
             {
@@ -43,47 +126,70 @@ class XMLIterator(TableIterator):
             {(f.name, f) for f in self.model._meta.get_fields() if isinstance(f, models.BooleanField)}
         )
 
+        self.field_map = row_convertor.field_map if isinstance(row_convertor, XMLRowConvertor) else {}
+        self._attnames = frozenset(self.record_class.attnames)
+        # Один кэш на все поля-даты таблицы
+        self.date_decoder = DateDecoder()
+        # Таблица преобразований заполняется по мере появления новых имён атрибутов XML
+        self._converters = {}
+
         self._context = etree.iterparse(self._fd)
 
+    def compile_converter(self, key: str) -> Union[Converter, None]:
+        name = key.lower()
+        convert: Union[Callable[[str], Any], None]
+        if name in self.uuid_fields:
+            convert = _to_uuid
+        elif name in self.date_fields:
+            convert = self.date_decoder.decode
+        elif name in self.related_fields:
+            convert = _to_related
+            name = f"{name}_id"
+        elif name in self.int_fields:
+            convert = _to_int
+        elif name in self.boolean_fields:
+            convert = _to_bool
+        else:
+            convert = None
+
+        name = self.field_map.get(name, name)
+        # Атрибуты, которых нет в модели, отбрасываются сразу
+        if name not in self._attnames:
+            return None
+        return name, convert
+
     def format_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
         res = {}
+        converters = self._converters
         for key, value in row.items():
-            key = key.lower()
-            if key in self.uuid_fields:
-                res[key] = value or None
-            elif key in self.date_fields:
-                if value == "" or value is None:
-                    res[key] = None
-                else:
-                    try:
-                        _date = datetime.datetime.strptime(value, "%Y-%m-%d").date()
-                    except ValueError:
-                        _date = datetime.datetime.strptime(value, "%d.%m.%y %H:%M:%S").date()
-                    res[key] = _date
-            elif key in self.related_fields:
-                if value == "":
-                    value = None
-                res[f"{key}_id"] = value
-            elif key in self.int_fields:
-                if value == "":
-                    value = None
-                else:
-                    value = int(value)
-                res[key] = value
-            elif key in self.boolean_fields:
-                res[key] = value in ("1", "y", "yes", "t", "true", "on", "+")
-            else:
-                res[key] = value
+            try:
+                converter = converters[key]
+            except KeyError:
+                converter = converters[key] = self.compile_converter(key)
+            if converter is not None:
+                name, convert = converter
+                res[name] = value if convert is None else convert(value)
         return res
 
-    def get_next(self) -> Union[AbstractModel, None]:
-        event, row = next(self._context)
-        item = self.process_row(row)
-        row.clear()
-        while row.getprevious() is not None:
-            del row.getparent()[0]
+    def get_stats(self) -> Dict[str, Any]:
+        return super().get_stats() | {
+            "date_cache_hits": self.date_decoder.hits,
+            "date_cache_misses": self.date_decoder.misses,
+            "date_cache_hit_rate": f"{self.date_decoder.hit_rate:.2%}",
+        }
+
+    def read_item(self) -> Union[Record, None]:
+        # Строки, отброшенные по исходным атрибутам, не преобразуются и не возвращаются вовсе
+        while True:
+            event, row = next(self._context)
+            accepted = self.accept_raw(row)
+            item = self.convert_row(row) if accepted else None
+            row.clear()
+            while row.getprevious() is not None:
+                del row.getparent()[0]
 
-        return item
+            if accepted:
+                return item
 
 
 class XMLRowConvertor(RowConvertor):
@@ -97,22 +203,111 @@ class XMLRowConvertor(RowConvertor):
         self.fields = set(f.name for f in model._meta.get_fields())
         self.values = {}
         if extra is not None:
-            self.values.update(extra)
+            self.values.update((k, v) for k, v in extra.items() if k in self.fields)
 
     def convert(self, row: Dict[str, Any]) -> Dict[str, Any]:
-        for k, v in self.field_map.items():
-            row[v] = row.pop(k)
+        # Переименование полей по field_map и отбрасывание лишних атрибутов
+        # выполняются в XMLIterator.format_row
         return self.values | row
 
-    def clear(self, row: Dict[str, Any]) -> Dict[str, Any]:
-        for k in set(row.keys()) - self.fields:
-            del row[k]
-        return row
+
+_tag_re = re.compile(rb"<([A-Za-z_][\w.:-]*)")
+_split_head_size = 64 * 1024
+_split_chunk_size = 1024 * 1024
+
+# (начало, конец или None - до конца файла, корневой тэг, тэг записи)
+ByteRange = Tuple[int, Union[int, None], bytes, bytes]
+
+
+class XMLRangeReader(io.RawIOBase):
+    """
+    Чтение части XML-файла таблицы.
+    Часть начинается с первой записи, расположенной не раньше start, и заканчивается перед первой записью,
+    расположенной не раньше end. Записи оборачиваются в корневой элемент, поэтому любая часть,
+    в том числе пустая, является корректным XML-документом
+    """
+
+    def __init__(self, fd: IO[bytes], start: int, end: Union[int, None], root_tag: bytes, row_tag: bytes):
+        super(XMLRangeReader, self).__init__()
+        self._fd = fd
+        self.start = start
+        self.end = end
+        self._prefix = b"<" + root_tag + b">"
+        self._suffix = b"</" + root_tag + b">"
+        # Границей считается начало записи или закрывающий корневой тэг
+        self._boundary_re = re.compile(b"<(?:" + re.escape(row_tag) + b"|/" + re.escape(root_tag) + rb")[\s/>]")
+        # Граница может оказаться на стыке двух прочитанных кусков
+        self._overlap = max(len(row_tag), len(root_tag)) + 2
+        self._chunks = self._read_chunks()
+        self._chunk = memoryview(b"")
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        buf = b""
+        buf_pos = 0
+        if self.start > 0:
+            yield self._prefix
+            self._fd.seek(self.start)
+            buf_pos = self.start
+            while True:
+                data = self._fd.read(_split_chunk_size)
+                buf += data
+                m = self._boundary_re.search(buf)
+                if m is not None:
+                    buf_pos += m.start()
+                    buf = buf[m.start() :]
+                    break
+                if not data:
+                    buf = b""
+                    break
+                cut = max(0, len(buf) - self._overlap)
+                buf_pos += cut
+                buf = buf[cut:]
+
+            # Записей в части нет
+            if not buf or buf.startswith(b"</"):
+                yield self._suffix
+                return
+
+        while True:
+            if self.end is not None:
+                m = self._boundary_re.search(buf, max(0, self.end - buf_pos))
+                if m is not None:
+                    yield buf[: m.start()]
+                    yield self._suffix
+                    return
+            data = self._fd.read(_split_chunk_size)
+            if not data:
+                # Закрывающий корневой тэг уже в части
+                yield buf
+                return
+            cut = max(0, len(buf) - self._overlap)
+            yield buf[:cut]
+            buf_pos += cut
+            buf = buf[cut:] + data
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self) -> None:
+        self._fd.close()
+        super(XMLRangeReader, self).close()
 
 
 class XMLTable(Table):
     iterator_class: Type[TableIterator] = XMLIterator
     row_convertor_class: Type[RowConvertor] = XMLRowConvertor
+    byte_range: Union[ByteRange, None] = None
 
     def __init__(
         self,
@@ -125,7 +320,43 @@ class XMLTable(Table):
     ):
         super(XMLTable, self).__init__(filename, name, ver, deleted, region, **kwargs)
 
-    def rows(self, tablelist: AbstractTableList) -> TableIterator:
+    def open(self, tablelist: AbstractTableList) -> IO[bytes]:
+        fd = super(XMLTable, self).open(tablelist=tablelist)
+        if self.byte_range is None:
+            return fd
+        return io.BufferedReader(XMLRangeReader(fd, *self.byte_range))
+
+    def get_size(self, tablelist: AbstractTableList) -> int:
+        size = super(XMLTable, self).get_size(tablelist=tablelist)
+        if self.byte_range is None:
+            return size
+        start, end = self.byte_range[:2]
+        return (size if end is None else min(end, size)) - start
+
+    def split(self, tablelist: AbstractTableList, size: int) -> List[Table]:
+        count = -(-tablelist.get_file_size(self.filename) // size)
+        if self.deleted or self.byte_range is not None or count < 2:
+            return [self]
+
+        with super(XMLTable, self).open(tablelist=tablelist) as fd:
+            head = fd.read(_split_head_size)
+        tags = _tag_re.findall(head, 0)[:2]
+        # Записей нет либо первая запись не поместилась в начало файла
+        if len(tags) < 2:
+            return [self]
+        root_tag, row_tag = tags
+
+        parts: List[Table] = []
+        for i in range(count):
+            part = copy(self)
+            part.part = (i, count)
+            part.byte_range = (i * size, (i + 1) * size if i < count - 1 else None, root_tag, row_tag)
+            parts.append(part)
+        return parts
+
+    def rows(
+        self, tablelist: AbstractTableList, raw_predicates: Union[Iterable[RawPredicate], None] = None
+    ) -> TableIterator:
         if self.deleted:
             raise StopIteration
 
@@ -143,6 +374,6 @@ class XMLTable(Table):
             row_convertor = self.row_convertor_class(
                 self.model, self.name, {"ver": self.ver, "tree_ver": self.ver, "region": self.region}
             )
-            return self.iterator_class(xml, self.model, row_convertor)
+            return self.iterator_class(xml, self.model, row_convertor, raw_predicates)
         except etree.XMLSyntaxError as e:
             raise BadTableError("Error occured during opening table `{0}`: {1}".format(self.name, str(e)))
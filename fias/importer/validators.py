@@ -2,31 +2,46 @@
 from __future__ import absolute_import, unicode_literals
 
 from datetime import date
-from typing import Callable, List, Tuple
+from itertools import compress
+from operator import attrgetter
+from typing import Callable, Dict, List, Sequence, Tuple, Union
 
 from fias.config import STORE_INACTIVE_TABLES, TableName
+from fias.importer.filters import RawPredicate, RawRow, raw_is_active, raw_is_actual
+from fias.importer.record import Record
 from fias.importer.table import get_model
-from fias.models import AbstractModel
 from fias.models.common import AbstractIsActiveModel, AbstractObj
 
-__all__ = ["get_common_validator", "get_create_validator", "get_update_validator"]
+__all__ = [
+    "get_common_validator",
+    "get_create_validator",
+    "get_update_validator",
+    "get_common_batch_validator",
+    "get_create_batch_validator",
+    "get_update_batch_validator",
+    "get_raw_create_predicates",
+]
 
 
-def new_common_validator(item: AbstractModel, today: date) -> bool:
-    return item.startdate <= today < item.enddate
+def new_common_validator(item: Record, today: date) -> bool:
+    return bool(item.startdate <= today < item.enddate)
 
 
-def new_obj_validator(item: AbstractModel, today: date) -> bool:
-    assert isinstance(item, AbstractObj)
-    return item.isactual
+def new_obj_validator(item: Record, today: date) -> bool:
+    assert isinstance(item, AbstractObj) or isinstance(item, Record) and issubclass(item.model, AbstractObj)
+    return bool(item.isactual)
 
 
-def new_isactive_validator(item: AbstractModel, today: date) -> bool:
-    assert isinstance(item, AbstractIsActiveModel)
-    return item.isactive
+def new_isactive_validator(item: Record, today: date) -> bool:
+    assert (
+        isinstance(item, AbstractIsActiveModel)
+        or isinstance(item, Record)
+        and issubclass(item.model, AbstractIsActiveModel)
+    )
+    return bool(item.isactive)
 
 
-ValidatorType = Callable[[AbstractModel, date], bool]
+ValidatorType = Callable[[Record, date], bool]
 
 _ValidatorMapType = List[Tuple[List[TableName], ValidatorType]]
 
@@ -54,7 +69,7 @@ _validators_create: _ValidatorMapType = [
 _validators_update: _ValidatorMapType = []
 
 
-def common_validator(item: AbstractModel, today: date) -> bool:
+def common_validator(item: Record, today: date) -> bool:
     return item.pk is not None
 
 
@@ -65,7 +80,7 @@ def get_common_validator(name: TableName) -> ValidatorType:
 def _get_validators(name: TableName, validator_map: _ValidatorMapType) -> ValidatorType:
     validators = [v for names, v in validator_map if name in names]
 
-    def validate(item: AbstractModel, today: date) -> bool:
+    def validate(item: Record, today: date) -> bool:
         for validator in validators:
             if not validator(item, today):
                 return False
@@ -80,3 +95,116 @@ def get_create_validator(name: TableName) -> ValidatorType:
 
 def get_update_validator(name: TableName) -> ValidatorType:
     return _get_validators(name, _validators_update)
+
+
+"""
+Проверки пачек записей.
+Валидатор получает пачку записей и возвращает маску: True - запись прошла проверку
+"""
+
+BatchValidatorType = Callable[[Sequence[Record], date], List[bool]]
+
+_get_startdate = attrgetter("startdate")
+_get_enddate = attrgetter("enddate")
+_get_isactual = attrgetter("isactual")
+_get_isactive = attrgetter("isactive")
+
+
+def batch_common_validator(items: Sequence[Record], today: date) -> List[bool]:
+    return [s <= today < e for s, e in zip(map(_get_startdate, items), map(_get_enddate, items))]
+
+
+def batch_obj_validator(items: Sequence[Record], today: date) -> List[bool]:
+    return list(map(bool, map(_get_isactual, items)))
+
+
+def batch_isactive_validator(items: Sequence[Record], today: date) -> List[bool]:
+    return list(map(bool, map(_get_isactive, items)))
+
+
+def batch_pk_validator(items: Sequence[Record], today: date) -> List[bool]:
+    return [item.pk is not None for item in items]
+
+
+_batch_validators: Dict[ValidatorType, BatchValidatorType] = {
+    new_common_validator: batch_common_validator,
+    new_obj_validator: batch_obj_validator,
+    new_isactive_validator: batch_isactive_validator,
+    common_validator: batch_pk_validator,
+}
+
+
+def as_batch_validator(validator: ValidatorType) -> BatchValidatorType:
+    try:
+        return _batch_validators[validator]
+    except KeyError:
+        pass
+
+    def validate(items: Sequence[Record], today: date) -> List[bool]:
+        return [validator(item, today) for item in items]
+
+    return validate
+
+
+def _get_batch_validators(name: TableName, validator_map: _ValidatorMapType) -> BatchValidatorType:
+    validators = [as_batch_validator(v) for names, v in validator_map if name in names]
+
+    # Как и при проверке одной записи, следующий валидатор проверяет только прошедшие предыдущие записи
+    def validate(items: Sequence[Record], today: date) -> List[bool]:
+        passed = list(range(len(items)))
+        for validator in validators:
+            if not passed:
+                break
+            passed = list(compress(passed, validator([items[i] for i in passed], today)))
+        mask = [False] * len(items)
+        for i in passed:
+            mask[i] = True
+        return mask
+
+    return validate
+
+
+def get_common_batch_validator(name: TableName) -> BatchValidatorType:
+    return as_batch_validator(get_common_validator(name))
+
+
+def get_create_batch_validator(name: TableName) -> BatchValidatorType:
+    return _get_batch_validators(name, _validators_create)
+
+
+def get_update_batch_validator(name: TableName) -> BatchValidatorType:
+    return _get_batch_validators(name, _validators_update)
+
+
+def _is_iso_date(value: Union[str, None]) -> bool:
+    return value is not None and len(value) == 10 and value[4] == "-" and value[7] == "-"
+
+
+def new_raw_common_validator(today: date) -> RawPredicate:
+    today_s = today.isoformat()
+
+    # Даты в формате ISO можно сравнивать как строки
+    def validate(row: RawRow) -> bool:
+        startdate = row.get("STARTDATE")
+        enddate = row.get("ENDDATE")
+        if not (_is_iso_date(startdate) and _is_iso_date(enddate)):
+            return True
+        assert startdate is not None and enddate is not None
+        return startdate <= today_s < enddate
+
+    return validate
+
+
+_raw_validators: Dict[ValidatorType, Callable[[date], RawPredicate]] = {
+    new_common_validator: new_raw_common_validator,
+    new_obj_validator: lambda today: raw_is_actual,
+    new_isactive_validator: lambda today: raw_is_active,
+}
+
+
+def get_raw_create_predicates(name: TableName, today: date) -> List[RawPredicate]:
+    """
+    Проверки при создании записей, которые можно выполнить на исходных атрибутах XML.
+    Сами валидаторы после преобразования строки всё равно выполняются
+    """
+    return [_raw_validators[v](today) for names, v in _validators_create if name in names and v in _raw_validators]
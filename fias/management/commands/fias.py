@@ -3,6 +3,8 @@ from __future__ import absolute_import, unicode_literals
 
 import os
 import sys
+from argparse import ArgumentTypeError
+from datetime import datetime
 from pathlib import Path
 from typing import Any, List, Tuple, Union
 
@@ -16,22 +18,50 @@ from fias.importer.commands import (
     manual_update_data,
     validate_house_params,
 )
+from fias.importer.loader import Writer
+from fias.importer.maintenance import FixChunking
+from fias.importer.shadow import ShadowSchemaError
+from fias.importer.shadow import drop_previous as drop_previous_generation
+from fias.importer.sizing import BatchSizing
 from fias.importer.source import TableListLoadingError
 from fias.importer.version import fetch_version_info
 from fias.models import Status
 from gar_loader.compat import BaseCommandCompatible
 
+_size_units = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_size(value: str) -> int:
+    """Размер в байтах, допускаются суффиксы K, M, G"""
+    value = value.strip().upper()
+    unit = value[-1:] if value[-1:] in _size_units else ""
+    try:
+        size = int(value[: len(value) - len(unit)]) * _size_units[unit]
+    except ValueError:
+        raise ArgumentTypeError(f"invalid size value: `{value}`")
+    if size < 0:
+        raise ArgumentTypeError(f"invalid size value: `{value}`")
+    return size
+
 
 class Command(BaseCommandCompatible):
     help = "Fill or update FIAS database"
     usage_str = (
-        "Usage: ./manage.py fias [--src <path|filename|url|AUTO> [--truncate]"
+        "Usage: ./manage.py fias [--src <path|filename|url|AUTO> [--truncate | --shadow]"
         " [--i-know-what-i-do]]"
-        " [--update [--skip]]"
+        " [--drop-previous]"
+        " [--update [--skip] [--prefetch <N>] [--consolidate <N>]]"
         " [--format <xml>] [--limit=<N>] [--tables=<{0}>]"
+        " [--adaptive-limit [--limit-min <N>] [--limit-max <N>] [--write-latency <sec>] [--max-rss <size>]]"
         " [--update-version-info <yes|no>]"
         " [--keep-indexes <yes|pk|no>]"
         " [--tempdir <path>]"
+        " [--writer <orm|copy>]"
+        " [--split-size <size>] [--coalesce-size <size>] [--memory-budget <size>]"
+        " [--parse-workers <N>] [--write-workers <N>] [--write-queue <N>]"
+        " [--fix-chunk-rows <N> [--fix-workers <N>]]"
+        " [--index-workers <N>]"
+        " [--quarantine <path>]"
         "".format(",".join(TABLES))
     )
 
@@ -48,6 +78,19 @@ class Command(BaseCommandCompatible):
             "default": False,
             "help": "Truncate tables before loading data",
         },
+        "--shadow": {
+            "action": "store_true",
+            "dest": "shadow",
+            "default": False,
+            "help": "Build tables in a shadow schema and swap them with the live tables after loading "
+            "(PostgreSQL only). The previous tables are kept until --drop-previous",
+        },
+        "--drop-previous": {
+            "action": "store_true",
+            "dest": "drop_previous",
+            "default": False,
+            "help": "Drop the previous generation of tables kept by --shadow",
+        },
         "--i-know-what-i-do": {
             "action": "store_true",
             "dest": "doit",
@@ -82,6 +125,41 @@ class Command(BaseCommandCompatible):
             "default": 10000,
             "help": "Limit rows for bulk operations. Default value: 10000",
         },
+        "--adaptive-limit": {
+            "action": "store_true",
+            "dest": "adaptive_limit",
+            "default": False,
+            "help": "Start from --limit and adjust batch size per table by measured write time and process memory",
+        },
+        "--limit-min": {
+            "action": "store",
+            "dest": "limit_min",
+            "type": int,
+            "default": 1000,
+            "help": "Min batch size for --adaptive-limit. Default value: 1000",
+        },
+        "--limit-max": {
+            "action": "store",
+            "dest": "limit_max",
+            "type": int,
+            "default": 100000,
+            "help": "Max batch size for --adaptive-limit. Default value: 100000",
+        },
+        "--write-latency": {
+            "action": "store",
+            "dest": "write_latency",
+            "type": float,
+            "default": 2.0,
+            "help": "Target batch write time in seconds for --adaptive-limit. Default value: 2.0",
+        },
+        "--max-rss": {
+            "action": "store",
+            "dest": "max_rss",
+            "type": parse_size,
+            "default": 0,
+            "help": "Shrink batches when process memory exceeds the given size (bytes, K, M or G suffix allowed) "
+            "with --adaptive-limit. Default value: 0 (no limit)",
+        },
         "--tables": {
             "action": "store",
             "dest": "tables",
@@ -123,12 +201,113 @@ class Command(BaseCommandCompatible):
             "type": str,
             "help": "Region to scan space separated",
         },
+        "--parse-workers": {
+            "action": "store",
+            "dest": "threads",
+            "type": int,
+            "default": None,
+            "help": "Number of processes parsing table files in parallel (using CPU count if value is empty)",
+        },
         "--threads": {
             "action": "store",
             "dest": "threads",
             "type": int,
             "default": None,
-            "help": "Running in parallel (using CPU count if value is empty)",
+            "help": "Alias for --parse-workers",
+        },
+        "--write-workers": {
+            "action": "store",
+            "dest": "write_workers",
+            "type": int,
+            "default": 0,
+            "help": "Number of threads writing batches to DB in each parse process. "
+            "Default value: 0 (parse process writes batches itself)",
+        },
+        "--write-queue": {
+            "action": "store",
+            "dest": "write_queue",
+            "type": int,
+            "default": 2,
+            "help": "Max batches waiting for write in each parse process. Default value: 2",
+        },
+        "--writer": {
+            "action": "store",
+            "dest": "writer",
+            "type": str,
+            "choices": list(Writer),
+            "default": Writer.ORM,
+            "help": "Bulk insert method: Django ORM or PostgreSQL COPY. Default value: orm",
+        },
+        "--split-size": {
+            "action": "store",
+            "dest": "split_size",
+            "type": parse_size,
+            "default": 0,
+            "help": "Split table files larger than the given size (bytes, K, M or G suffix allowed) into parts "
+            "and load them in parallel. Default value: 0 (do not split)",
+        },
+        "--coalesce-size": {
+            "action": "store",
+            "dest": "coalesce_size",
+            "type": parse_size,
+            "default": 1024 * 1024,
+            "help": "Load table files smaller than the given size (bytes, K, M or G suffix allowed) in groups "
+            "of up to this total size by one worker. Default value: 1M (0 - every file is loaded separately)",
+        },
+        "--memory-budget": {
+            "action": "store",
+            "dest": "memory_budget",
+            "type": parse_size,
+            "default": 0,
+            "help": "Do not run workers concurrently if their estimated memory exceeds the given size "
+            "(bytes, K, M or G suffix allowed). Default value: 0 (no limit)",
+        },
+        "--prefetch": {
+            "action": "store",
+            "dest": "prefetch",
+            "type": int,
+            "default": 1,
+            "help": "Number of next delta archives downloaded in background while the current one is applied "
+            "by automatic update. Default value: 1 (0 - download each archive before applying it)",
+        },
+        "--consolidate": {
+            "action": "store",
+            "dest": "consolidate",
+            "type": int,
+            "default": 0,
+            "help": "Apply up to N consecutive deltas at once: only the latest version of every record is written "
+            "and table status is moved to the last of them. Default value: 0 (every delta is applied separately)",
+        },
+        "--fix-chunk-rows": {
+            "action": "store",
+            "dest": "fix_chunk_rows",
+            "type": parse_size,
+            "default": 0,
+            "help": "Update tree version and remove orphans of whole tables by ranges of about N rows "
+            "(K, M or G suffix allowed) in separate transactions. Default value: 0 (one statement per table)",
+        },
+        "--fix-workers": {
+            "action": "store",
+            "dest": "fix_workers",
+            "type": int,
+            "default": 2,
+            "help": "Number of DB connections processing ranges of --fix-chunk-rows concurrently. Default value: 2",
+        },
+        "--index-workers": {
+            "action": "store",
+            "dest": "index_workers",
+            "type": int,
+            "default": 1,
+            "help": "Number of DB connections building dropped indexes of a table concurrently after full load. "
+            "Default value: 1",
+        },
+        "--quarantine": {
+            "action": "store",
+            "dest": "quarantine",
+            "type": str,
+            "default": None,
+            "help": "JSONL file for rows rejected by DB. "
+            "Default value: fias_quarantine_<date>_<time>.jsonl in tempdir or current directory",
         },
     }
 
@@ -148,6 +327,25 @@ class Command(BaseCommandCompatible):
         house_param_report: Path | None,
         house_param_regions: List[str] | None,
         threads: Union[int, None],
+        writer: str,
+        split_size: int,
+        coalesce_size: int,
+        memory_budget: int,
+        prefetch: int,
+        consolidate: int,
+        fix_chunk_rows: int,
+        fix_workers: int,
+        index_workers: int,
+        write_workers: int,
+        write_queue: int,
+        quarantine: Union[str, None],
+        adaptive_limit: bool,
+        limit_min: int,
+        limit_max: int,
+        write_latency: float,
+        max_rss: int,
+        shadow: bool,
+        drop_previous: bool,
         **options: Any,
     ) -> None:
         remote = False
@@ -158,6 +356,15 @@ class Command(BaseCommandCompatible):
         else:
             src_path = src
 
+        if drop_previous:
+            try:
+                if not drop_previous_generation():
+                    print("There is no previous generation of tables.")
+            except ShadowSchemaError as e:
+                self.error(str(e))
+            if not any([src_path, remote, update]):
+                return
+
         if not any([src_path, remote, update]):
             self.error(self.usage_str)
 
@@ -174,6 +381,26 @@ class Command(BaseCommandCompatible):
         else:
             tempdir_path = None
 
+        sizing: Union[BatchSizing, None] = None
+        if adaptive_limit:
+            if not 0 < limit_min <= limit_max:
+                self.error("Batch size bounds must satisfy 0 < --limit-min <= --limit-max")
+            sizing = BatchSizing(min_size=limit_min, max_size=limit_max, target_latency=write_latency, max_rss=max_rss)
+
+        fix_chunking: Union[FixChunking, None] = None
+        if fix_chunk_rows:
+            if fix_workers < 1:
+                self.error("--fix-workers must be positive")
+            fix_chunking = FixChunking(rows=fix_chunk_rows, workers=fix_workers)
+        if index_workers < 1:
+            self.error("--index-workers must be positive")
+
+        # Отклонённые БД строки всех процессов собираются в один файл на запуск
+        if quarantine:
+            quarantine_path = Path(quarantine)
+        else:
+            quarantine_path = (tempdir_path or Path.cwd()) / f"fias_quarantine_{datetime.now():%Y%m%d_%H%M%S}.jsonl"
+
         # TODO: какая-то нелогичная логика получилась. Надо бы поправить.
         if (src_path or remote) and Status.objects.count() > 0 and not doit and not update:
             self.error(
@@ -212,8 +439,19 @@ class Command(BaseCommandCompatible):
                     keep_pk=keep_pk_indexes,
                     tempdir=tempdir_path,
                     threads=threads,
+                    writer=Writer(writer),
+                    split_size=split_size,
+                    write_workers=write_workers,
+                    write_queue=write_queue,
+                    quarantine=quarantine_path,
+                    sizing=sizing,
+                    shadow=shadow,
+                    coalesce_size=coalesce_size,
+                    memory_budget=memory_budget,
+                    fix_chunking=fix_chunking,
+                    index_workers=index_workers,
                 )
-            except TableListLoadingError as e:
+            except (TableListLoadingError, ShadowSchemaError) as e:
                 self.error(str(e))
 
         if update:
@@ -227,6 +465,15 @@ class Command(BaseCommandCompatible):
                         tables=tables_tuple,
                         tempdir=tempdir_path,
                         threads=threads,
+                        writer=Writer(writer),
+                        write_workers=write_workers,
+                        write_queue=write_queue,
+                        quarantine=quarantine_path,
+                        sizing=sizing,
+                        coalesce_size=coalesce_size,
+                        memory_budget=memory_budget,
+                        consolidate=consolidate,
+                        fix_chunking=fix_chunking,
                     )
                 else:
                     least_new_version = auto_update_data(
@@ -236,6 +483,16 @@ class Command(BaseCommandCompatible):
                         tables=tables_tuple,
                         tempdir=tempdir_path,
                         threads=threads,
+                        writer=Writer(writer),
+                        write_workers=write_workers,
+                        write_queue=write_queue,
+                        quarantine=quarantine_path,
+                        sizing=sizing,
+                        coalesce_size=coalesce_size,
+                        memory_budget=memory_budget,
+                        prefetch=prefetch,
+                        consolidate=consolidate,
+                        fix_chunking=fix_chunking,
                     )
             except TableListLoadingError as e:
                 self.error(str(e))
@@ -34,7 +34,7 @@ class Command(BaseCommandCompatible):
             for item in tbl.rows(tablelist=tablelist):
                 if item is not None and item.pk == key:
                     print(item)
-                    print(item.__dict__)
+                    print(item.as_dict())
 
     def error(self, message: str, code: int = 1) -> None:
         print(message)
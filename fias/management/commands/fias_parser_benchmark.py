@@ -0,0 +1,63 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from datetime import date
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import monotonic
+from typing import Any, List
+
+from fias.config import TableName
+from fias.importer.source import LocalArchiveTableList
+from fias.models import Version
+from fias.tests.fixture import Fixture
+from gar_loader.compat import BaseCommandCompatible
+
+
+class Command(BaseCommandCompatible):
+    help = "Test XML parser speed on generated houses file."
+    usage_str = "Usage: ./manage.py fias_parser_benchmark [--rows <N>] [--repeat <N>]"
+
+    arguments_dictionary = {
+        "--rows": {
+            "action": "store",
+            "dest": "rows",
+            "type": int,
+            "default": 200000,
+            "help": "Houses count in the generated file. Default value: 200000",
+        },
+        "--repeat": {
+            "action": "store",
+            "dest": "repeat",
+            "type": int,
+            "default": 3,
+            "help": "Parse the file several times and report the best result. Default value: 3",
+        },
+    }
+
+    def handle(self, rows: int, repeat: int, **options: Any) -> None:
+        ver = 20221129
+        # Версия не сохраняется в БД: для разбора файла она не нужна
+        version = Version(ver=ver, dumpdate=date(2022, 11, 29))
+
+        with TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / Path("houses.zip")
+            Fixture.create(path, ver, houses_per_region=rows, regions=[1])
+
+            tablelist = LocalArchiveTableList(src=str(path), version=version)
+            table = tablelist.tables[TableName.HOUSE][0]
+
+            results: List[float] = []
+            for _ in range(repeat):
+                count = 0
+                start = monotonic()
+                for item in table.rows(tablelist=tablelist):
+                    if item is not None:
+                        count += 1
+                stop = monotonic()
+                if count != rows:
+                    raise ValueError(f"Something wrong: house count = {count}")
+                results.append(stop - start)
+
+        best = min(results)
+        print(f"rows: {rows}, best of {repeat}: {best:.3f} s, {rows / best:.0f} rows/s")
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("fias", "0002_alter_admhierarchy_parentobjid_alter_house_housetype_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="status",
+            name="fixed_ver",
+            field=models.IntegerField(blank=True, null=True, verbose_name="версия исправления данных"),
+        ),
+    ]
@@ -1,9 +1,9 @@
 # coding: utf-8
 from __future__ import absolute_import, annotations, unicode_literals
 
-from typing import List, TypeVar
+from typing import Any, Dict, List, Sequence, Tuple, TypeVar, Union
 
-from django.db import connections, models
+from django.db import connections, models, transaction
 
 from fias.models.fields import RefFieldMixin
 
@@ -13,48 +13,137 @@ _M = TypeVar("_M", bound="AbstractModel", covariant=True)
 
 
 class Manager(models.Manager[_M]):
-    def delete_orphans(self) -> None:
-        table = self.model._meta.db_table
-        where_ls: List[str] = []
-        from_ls: List[str] = []
+    def get_ref_field(self) -> Union[RefFieldMixin, None]:
         for field in self.model._meta.get_fields():
             if isinstance(field, RefFieldMixin):
-                for model, pk_field_name in field.to:
-                    dst_table = model._meta.db_table
-                    from_ls.append(f"LEFT JOIN {dst_table} ON {dst_table}.{pk_field_name} = {table}.{pk_field_name}")
-                    where_ls.append(f"{dst_table}.{pk_field_name} IS NULL")
-        if len(from_ls) > 0:
-            if self.model._meta.pk is None:
-                raise ValueError
-            pk_field_name = self.model._meta.pk.column
-            raw_sql = f"""
-                DELETE
-                FROM {table}
-                WHERE {pk_field_name} IN (
-                SELECT {table}.{pk_field_name}
-                FROM {table}
-                {' '.join(from_ls)}
-                WHERE {' AND '.join(where_ls)}
-                )"""
+                return field
+        return None
+
+    def _get_range(self, attname: str) -> Union[Tuple[int, int], None]:
+        result = self.get_queryset().aggregate(low=models.Min(attname), high=models.Max(attname))
+        if result["low"] is None:
+            return None
+        return int(result["low"]), int(result["high"])
+
+    def get_ref_range(self) -> Union[Tuple[int, int], None]:
+        """Наименьшее и наибольшее значения ссылочного поля; None - записей или ссылочного поля нет"""
+        field = self.get_ref_field()
+        if field is None:
+            return None
+        return self._get_range(field.attname)
+
+    def get_pk_range(self) -> Union[Tuple[int, int], None]:
+        """Наименьшее и наибольшее значения первичного ключа; None - записей нет"""
+        return self._get_range("pk")
+
+    def _key_filter(
+        self, table: str, column: str, keys: Union[Sequence[int], None], bounds: Union[Tuple[int, int], None]
+    ) -> Tuple[List[str], List[Any]]:
+        """Условия отбора записей по значениям столбца (keys) и по полуинтервалу его значений (bounds)"""
+        where_ls: List[str] = []
+        params: List[Any] = []
+        if keys is not None:
+            if connections[self.db].vendor == "postgresql":
+                where_ls.append(f"{table}.{column} = ANY(%s)")
+                params.append(list(keys))
+            elif keys:
+                where_ls.append(f"{table}.{column} IN ({', '.join(['%s'] * len(keys))})")
+                params.extend(keys)
+            else:
+                where_ls.append("1 = 0")
+        if bounds is not None:
+            where_ls.append(f"{table}.{column} >= %s AND {table}.{column} < %s")
+            params.extend(bounds)
+        return where_ls, params
+
+    def delete_not_active(
+        self, keys: Union[Sequence[int], None] = None, bounds: Union[Tuple[int, int], None] = None
+    ) -> Dict[Union[str, None], int]:
+        """
+        Удаляет неактивные записи запросом на стороне БД, без загрузки записей и сигналов Django:
+        у моделей ФИАС нет каскадных связей. Возвращает количество удалённых записей по регионам.
+        keys - ключи записей, среди которых удаляются неактивные;
+        bounds - полуинтервал значений первичного ключа; None - вся таблица
+        """
+        if self.model._meta.pk is None:
+            raise ValueError
+        table = self.model._meta.db_table
+        pk = self.model._meta.pk.column
+        has_region = any(f.attname == "region" for f in self.model._meta.fields)
+        connection = connections[self.db]
+
+        filter_ls, filter_params = self._key_filter(table, pk, keys, bounds)
+        where = " AND ".join([f"{table}.isactive = %s"] + filter_ls)
+        params: List[Any] = [False] + filter_params
+        region = "region" if has_region else "NULL"
+
+        if connection.vendor != "postgresql":
+            with transaction.atomic(using=self.db), connection.cursor() as cursor:
+                group_by = " GROUP BY region" if has_region else ""
+                cursor.execute(f"SELECT {region}, count(*) FROM {table} WHERE {where}{group_by}", params)
+                counts = {row[0]: int(row[1]) for row in cursor.fetchall() if row[1]}
+                cursor.execute(f"DELETE FROM {table} WHERE {where}", params)
+            return counts
+
+        raw_sql = f"""WITH deleted AS (DELETE FROM {table} WHERE {where} RETURNING {region}::text AS region)
+                   SELECT region, count(*) FROM deleted GROUP BY region"""
+        with connection.cursor() as cursor:
+            cursor.execute(raw_sql, params)
+            return {row[0]: int(row[1]) for row in cursor.fetchall()}
+
+    def delete_orphans(
+        self, keys: Union[Sequence[int], None] = None, bounds: Union[Tuple[int, int], None] = None
+    ) -> int:
+        """
+        Удаляет записи, ссылающиеся на отсутствующие объекты. Возвращает количество удалённых записей.
+        keys - значения ссылочного поля, среди которых ищутся такие записи;
+        bounds - полуинтервал значений ссылочного поля; None - вся таблица
+        """
+        table = self.model._meta.db_table
+        field = self.get_ref_field()
+        if field is None:
+            return 0
+        where_ls = [
+            f"NOT EXISTS (SELECT 1 FROM {model._meta.db_table}"
+            f" WHERE {model._meta.db_table}.{pk_field_name} = {table}.{field.column})"
+            for model, pk_field_name in field.to
+        ]
+        filter_ls, params = self._key_filter(table, field.column, keys, bounds)
+        raw_sql = f"DELETE FROM {table} WHERE {' AND '.join(where_ls + filter_ls)}"
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(raw_sql, params)
+            return int(cursor.rowcount)
+
+    def update_tree_ver(
+        self, min_ver: int, keys: Union[Sequence[int], None] = None, bounds: Union[Tuple[int, int], None] = None
+    ) -> int:
+        """
+        Переносит версию записей в объекты, на которые они ссылаются. Возвращает количество изменённых объектов.
+        keys - значения ссылочного поля изменённых записей;
+        bounds - полуинтервал значений ссылочного поля; None - вся таблица
+        """
+        src_table = self.model._meta.db_table
+        field = self.get_ref_field()
+        if field is None:
+            return 0
+        filter_ls, params = self._key_filter(src_table, field.column, keys, bounds)
+        count = 0
+        for model, pk_field_name in field.to:
+            dst_table = model._meta.db_table
+            raw_sql = f"""UPDATE {dst_table}
+                       SET tree_ver = {src_table}.ver
+                       FROM {src_table}
+                       WHERE {dst_table}.{pk_field_name} = {src_table}.{field.column}
+                       AND {src_table}.ver >= {min_ver}
+                       AND {src_table}.ver > tree_ver"""
+            for where in filter_ls:
+                raw_sql += f" AND {where}"
             connection = connections[self.db]
             with connection.cursor() as cursor:
-                cursor.execute(raw_sql)
-
-    def update_tree_ver(self, min_ver: int) -> None:
-        src_table = self.model._meta.db_table
-        for field in self.model._meta.get_fields():
-            if isinstance(field, RefFieldMixin):
-                for model, pk_field_name in field.to:
-                    dst_table = model._meta.db_table
-                    raw_sql = f"""UPDATE {dst_table}
-                               SET tree_ver = {src_table}.ver
-                               FROM {src_table}
-                               WHERE {dst_table}.{pk_field_name} = {src_table}.{pk_field_name}
-                               AND {src_table}.ver >= {min_ver}
-                               AND {src_table}.ver > tree_ver"""
-                    connection = connections[self.db]
-                    with connection.cursor() as cursor:
-                        cursor.execute(raw_sql)
+                cursor.execute(raw_sql, params)
+                count += int(cursor.rowcount)
+        return count
 
 
 class AbstractModel(models.Model):
@@ -39,6 +39,9 @@ class Status(models.Model):
     region = models.CharField(verbose_name="регион", max_length=2, null=True, blank=True)
     table = models.CharField(verbose_name="таблица", max_length=15)
     ver = models.ForeignKey(Version, verbose_name="версия", on_delete=models.CASCADE)
+    # Версия, по которую исправлены данные таблицы (версия дерева, неактивные записи и записи без объектов);
+    # None - неизвестно, при следующем обновлении таблица исправляется целиком
+    fixed_ver = models.IntegerField(verbose_name="версия исправления данных", null=True, blank=True)
 
     class Meta:
         app_label = "fias"
@@ -1,6 +1,6 @@
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Tuple
 from uuid import UUID, uuid4
 from zipfile import ZipFile
 
@@ -85,7 +85,9 @@ class Fixture:
         }
 
     @classmethod
-    def create(cls, path: Path, version: int, houses_per_region: int = 1000) -> None:
+    def create(
+        cls, path: Path, version: int, houses_per_region: int = 1000, regions: Iterable[int] = range(1, 100)
+    ) -> None:
         if path.is_dir():
             raise ValueError("path must be file")
 
@@ -113,7 +115,7 @@ class Fixture:
                 file_name = cls._create_file_name(table_name, version_str)
                 myzip.writestr(f"{file_name}", ET.tostring(root))
 
-            for r in range(1, 100):
+            for r in regions:
                 region_name = f"{r:02}"
                 myzip.mkdir(region_name)
                 for table_name, item_name, fn, kwargs, count in data_table_map:
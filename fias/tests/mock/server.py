@@ -0,0 +1,96 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Dict, List, Tuple, Type, Union
+
+
+class FileServer(object):
+    """
+    HTTP-сервер файлов каталога для тестов скачивания: поддерживает запросы диапазонов,
+    запоминает запросы и может оборвать ответ после заданного количества байт
+    """
+
+    def __init__(self, directory: Path, ranges: bool = True):
+        self.directory = directory
+        self.ranges = ranges
+        self.requests: List[Tuple[str, Union[str, None]]] = []
+        # Имя файла: сколько байт отдать до обрыва соединения (один раз)
+        self.break_after: Dict[str, int] = {}
+        # Отдано байт тел ответов
+        self.sent = 0
+        # Задержка после каждых 64 КБ ответа, секунд: медленное скачивание
+        self.chunk_delay = 0.0
+        self.lock = Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FileServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/{name}"
+
+    def _handler(self) -> Type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.0"
+
+            def do_GET(self) -> None:
+                name = self.path.lstrip("/")
+                range_header = self.headers.get("Range")
+                with server.lock:
+                    server.requests.append((name, range_header))
+                path = server.directory / name
+                if not path.is_file():
+                    self.send_error(404)
+                    return
+                data = path.read_bytes()
+                size = len(data)
+
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+                if server.ranges and match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)) + 1 if match.group(2) else size, size)
+                    if start >= size:
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+                else:
+                    start, end = 0, size
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start))
+                self.send_header("ETag", f'"{size}"')
+                self.end_headers()
+
+                body = data[start:end]
+                with server.lock:
+                    if len(body) > server.break_after.get(name, len(body)):
+                        body = body[: server.break_after.pop(name)]
+                chunk = 64 * 1024 if server.chunk_delay else len(body) or 1
+                for i in range(0, len(body), chunk):
+                    try:
+                        self.wfile.write(body[i : i + chunk])
+                    except ConnectionError:
+                        # Клиент прочитал только заголовки
+                        return
+                    with server.lock:
+                        server.sent += len(body[i : i + chunk])
+                    if server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
@@ -0,0 +1,142 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from fias.importer.downloader import Downloader
+from fias.importer.source import prefetch_archives
+from fias.importer.source.cache import ArchiveCache
+
+from .mock.server import FileServer
+
+BASE_DIR = Path(__file__).resolve().parent
+DELTAS = ["gar_delta_99_20221128.rar", "gar_delta_99_20221202.rar"]
+
+
+def fetch(url: str, path: Path) -> Path:
+    result, _ = Downloader().download(url, file_name=path)
+    return result
+
+
+class TestArchiveCache(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.serve_dir = Path(temp_dir.name) / "serve"
+        self.serve_dir.mkdir()
+        self.cache_dir = Path(temp_dir.name) / "cache"
+        self.data = os.urandom(100 * 1000)
+        (self.serve_dir / "gar_xml.zip").write_bytes(self.data)
+
+    def full_requests(self, server: FileServer) -> int:
+        return len([r for r in server.requests if r[1] != "bytes=0-0"])
+
+    def test_hit(self) -> None:
+        cache = ArchiveCache(self.cache_dir)
+        with FileServer(self.serve_dir) as server:
+            url = server.url("gar_xml.zip")
+            first = cache.get(url, lambda path: fetch(url, path))
+            second = ArchiveCache(self.cache_dir).get(url, lambda path: fetch(url, path))
+        self.assertEqual(first, second)
+        self.assertIn(first, cache)
+        self.assertEqual(self.data, second.read_bytes())
+        # Повторно архив не скачивается, только проверяется его размер и версия
+        self.assertEqual(1, self.full_requests(server))
+        self.assertEqual([], list(cache.tmp_dir.iterdir()))
+
+    def test_changed(self) -> None:
+        cache = ArchiveCache(self.cache_dir)
+        with FileServer(self.serve_dir) as server:
+            url = server.url("gar_xml.zip")
+            first = cache.get(url, lambda path: fetch(url, path))
+            data = os.urandom(50 * 1000)
+            (self.serve_dir / "gar_xml.zip").write_bytes(data)
+            second = cache.get(url, lambda path: fetch(url, path))
+        self.assertNotEqual(first, second)
+        self.assertEqual(data, second.read_bytes())
+        self.assertEqual(2, self.full_requests(server))
+
+    def test_corrupted(self) -> None:
+        cache = ArchiveCache(self.cache_dir)
+        with FileServer(self.serve_dir) as server:
+            url = server.url("gar_xml.zip")
+            path = cache.get(url, lambda path: fetch(url, path))
+            data = bytearray(path.read_bytes())
+            data[100] ^= 0xFF
+            path.write_bytes(bytes(data))
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+            path = cache.get(url, lambda path: fetch(url, path))
+        self.assertEqual(self.data, path.read_bytes())
+        self.assertEqual(2, self.full_requests(server))
+
+    def test_eviction(self) -> None:
+        cache = ArchiveCache(self.cache_dir, max_size=250 * 1000)
+        paths = []
+        with FileServer(self.serve_dir) as server:
+            for i in range(3):
+                (self.serve_dir / f"{i}.zip").write_bytes(os.urandom(100 * 1000 + i))
+                url = server.url(f"{i}.zip")
+                paths.append(cache.get(url, lambda path: fetch(url, path)))
+                # Время использования различается
+                os.utime(cache._meta_path(paths[-1].name), (i, i))
+            url = server.url("1.zip")
+            # Использованный архив становится самым свежим
+            self.assertEqual(paths[1], cache.get(url, lambda path: fetch(url, path)))
+            os.utime(cache._meta_path(paths[1].name), (10, 10))
+            (self.serve_dir / "3.zip").write_bytes(os.urandom(100 * 1000 + 3))
+            url = server.url("3.zip")
+            paths.append(cache.get(url, lambda path: fetch(url, path)))
+
+        self.assertEqual([False, True, False, True], [p.exists() for p in paths])
+        self.assertEqual(2, len(list(cache.index_dir.glob("*.json"))))
+
+    def test_shared(self) -> None:
+        def get(_: int) -> Path:
+            # Разные экземпляры кеша в одном каталоге, как на разных хостах
+            cache = ArchiveCache(self.cache_dir)
+            cache.lock_poll = 0.01
+            return cache.get(url, lambda path: fetch(url, path))
+
+        with FileServer(self.serve_dir) as server:
+            server.chunk_delay = 0.05
+            url = server.url("gar_xml.zip")
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                paths = list(executor.map(get, range(3)))
+        self.assertEqual(1, len(set(paths)))
+        self.assertEqual(1, self.full_requests(server))
+        self.assertEqual([], list((self.cache_dir / "index").glob("*.lock")))
+
+    def test_stale_lock(self) -> None:
+        cache = ArchiveCache(self.cache_dir)
+        cache.lock_timeout = 1.0
+        with FileServer(self.serve_dir) as server:
+            url = server.url("gar_xml.zip")
+            key = cache.get_key(url)
+            lock_path = cache.index_dir / f"{key}.lock"
+            lock_path.write_text("host:1")
+            os.utime(lock_path, (time.time() - 10, time.time() - 10))
+            path = cache.get(url, lambda path: fetch(url, path))
+        self.assertEqual(self.data, path.read_bytes())
+        self.assertFalse(lock_path.exists())
+
+    def test_prefetch(self) -> None:
+        for name in DELTAS:
+            shutil.copy(BASE_DIR / "data/fake/deltas" / name, self.serve_dir)
+        with FileServer(self.serve_dir) as server, mock.patch(
+            "fias.importer.source.archive.ARCHIVE_CACHE", str(self.cache_dir)
+        ):
+            urls = [server.url(n) for n in DELTAS]
+            paths = list(prefetch_archives(urls))
+            self.assertEqual(paths, list(prefetch_archives(urls)))
+        # Обработанные архивы остаются в кеше
+        self.assertTrue(all(p.exists() for p in paths))
+        self.assertEqual(2, self.full_requests(server))
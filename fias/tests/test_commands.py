@@ -1,4 +1,5 @@
 import shutil
+import zipfile
 from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from http.client import HTTPMessage
@@ -10,10 +11,13 @@ from unittest import mock
 from uuid import UUID
 
 from django.core.management import call_command
+from django.db import connections
 from django.test import TestCase, TransactionTestCase
 
 from fias.config import TableName
 from fias.importer.commands import validate_house_params
+from fias.importer.shadow import PREVIOUS_SCHEMA, ShadowSchemaError, drop_previous
+from fias.importer.source import LocalArchiveTableList
 from fias.models import (
     AddHouseType,
     AddrObj,
@@ -28,6 +32,7 @@ from fias.models import (
     Status,
     Version,
 )
+from fias.tests.mock.server import FileServer
 
 BASE_DIR = Path(__file__).resolve().parent
 TEMPDIR = BASE_DIR
@@ -47,7 +52,7 @@ class MockProcessPoolExecutor(ThreadPoolExecutor):
         initializer: Union[Callable[[None], None], None] = None,
         initargs: Tuple[Any, ...] = (),
         *,
-        max_tasks_per_child: Union[int, None] = None
+        max_tasks_per_child: Union[int, None] = None,
     ):
         super().__init__(max_workers=max_workers, thread_name_prefix="", initializer=initializer, initargs=initargs)
 
@@ -73,8 +78,98 @@ class CommandCreateTestCase(ReportTestMixin, TransactionTestCase):
     reference_report_path: Path = BASE_DIR / Path("data/test_fias_create.csv")
 
     def test_fias_create(self) -> None:
+        self.create()
+        self.validate()
+
+    def test_fias_create_copy(self) -> None:
+        self.create(writer="copy")
+        self.validate()
+
+    def test_fias_create_write_workers(self) -> None:
+        self.create(limit=2, write_workers=2, write_queue=1)
+        self.validate()
+
+    def test_fias_create_adaptive_limit(self) -> None:
+        self.create(limit=2, adaptive_limit=True, limit_min=1, limit_max=4, write_workers=1)
+        self.validate()
+
+    def test_fias_create_split(self) -> None:
+        self.create(split_size=1024)
+        self.validate()
+        self.assertEqual(1, Status.objects.filter(table=TableName.ADDR_OBJ_PARAM, region="99").count())
+
+    def test_fias_create_memory_budget(self) -> None:
+        self.create(coalesce_size=0, memory_budget=1)
+        self.validate()
+
+    def test_fias_create_fix_chunks(self) -> None:
+        with self.assertLogs("fias.importer.maintenance", "INFO") as logs:
+            self.create(fix_chunk_rows=2, fix_workers=3)
+        self.validate()
+        self.assertTrue(any("chunk 2/" in line for line in logs.output))
+
+    def test_fias_create_streaming(self) -> None:
+        src = LocalArchiveTableList(src=BASE_DIR / Path("data/fake/gar_99.rar"), version=Version(ver=0))
+        with TemporaryDirectory() as serve_dir:
+            with zipfile.ZipFile(Path(serve_dir) / "gar_xml.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for name in src.get_table_list():
+                    if name.endswith("/"):
+                        continue
+                    with src.open(name) as f:
+                        archive.writestr(name, f.read())
+
+            with FileServer(Path(serve_dir)) as server, TemporaryDirectory() as temp_dir:
+                with mock.patch("fias.importer.source.streaming.STREAMING_DOWNLOAD", True):
+                    self.create(src=server.url("gar_xml.zip"), tempdir=temp_dir)
+                # Команда завершается после окончания скачивания
+                archive_path = Path(temp_dir) / "gar_xml.zip"
+                self.assertEqual((Path(serve_dir) / "gar_xml.zip").stat().st_size, archive_path.stat().st_size)
+                self.assertFalse(archive_path.with_name("gar_xml.zip.tail").exists())
+        self.validate()
+
+    def _execute(self, *queries: str) -> None:
+        with connections["gar"].cursor() as cursor:
+            for query in queries:
+                cursor.execute(query)
+
+    def test_fias_create_shadow(self) -> None:
+        db_table = HouseType._meta.db_table
+        self.addCleanup(drop_previous)
+        self.create()
+        HouseType.objects.filter(id=7).update(name="old")
+        # Права приложения и пользовательское представление на рабочей таблице
+        self._execute("CREATE ROLE fias_test_reader", f"GRANT SELECT ON {db_table} TO fias_test_reader")
+        self.addCleanup(self._execute, "DROP OWNED BY fias_test_reader", "DROP ROLE fias_test_reader")
+        self._execute(f"CREATE VIEW fias_test_house_types AS SELECT id, name FROM {db_table}")
+        self.addCleanup(self._execute, "DROP VIEW IF EXISTS fias_test_house_types")
+
+        self.call_fias(shadow=True, doit=True)
+        self.validate()
+        with connections["gar"].cursor() as cursor:
+            cursor.execute(f"SELECT name FROM {PREVIOUS_SCHEMA}.{db_table} WHERE id = 7")
+            self.assertEqual(("old",), cursor.fetchone())
+            # Загруженная таблица снова журналируется
+            cursor.execute("SELECT relpersistence FROM pg_class WHERE oid = %s::regclass", [db_table])
+            self.assertEqual(("p",), cursor.fetchone())
+            # Новая таблица получила права старой
+            cursor.execute("SELECT has_table_privilege('fias_test_reader', %s::regclass, 'SELECT')", [db_table])
+            self.assertEqual((True,), cursor.fetchone())
+        self.assertRaises(SystemExit, self.call_fias, shadow=True, doit=True)
+
+        # Представление перенесено вместе со старой таблицей и не удаляется молча
+        with self.assertRaisesRegex(ShadowSchemaError, "fias_test_house_types"):
+            drop_previous()
+        self.assertRaises(SystemExit, self.call_fias, drop_previous=True)
+        self._execute("DROP VIEW fias_test_house_types")
+
+        self.assertTrue(drop_previous())
+        self.assertFalse(drop_previous())
+
+    def create(self, **extra_opts: Any) -> None:
         Version.objects.create(ver=20221125, dumpdate=date(2022, 11, 25), complete_xml_url="complete_xml_url")
+        self.call_fias(**extra_opts)
 
+    def call_fias(self, **extra_opts: Any) -> None:
         src = BASE_DIR / Path("data/fake/gar_99.rar")
         args: List[Any] = []
         opts: Dict[str, Any] = {
@@ -88,8 +183,9 @@ class CommandCreateTestCase(ReportTestMixin, TransactionTestCase):
 
         # Can not run ProcessPoolExecutor inside tests=(
         with mock.patch("fias.importer.commands.ProcessPoolExecutor", MockProcessPoolExecutor):
-            call_command("fias", *args, **opts)
+            call_command("fias", *args, **opts | extra_opts)
 
+    def validate(self) -> None:
         self.assertEqual(14, HouseType.objects.count())
         ht = HouseType.objects.get(id=7)
         self.assertEqual("Строение", ht.name)
@@ -230,6 +326,7 @@ class CommandCreateTestCase(ReportTestMixin, TransactionTestCase):
         h_s = Status.objects.get(table=TableName.HOUSE)
         self.assertEqual("99", h_s.region)
         self.assertEqual(ver, h_s.ver)
+        self.assertEqual(ver.ver, h_s.fixed_ver)
 
         self.validate_report()
 
@@ -298,6 +395,27 @@ class CommandUpdateTestCase(ReportTestMixin, TransactionTestCase):
 
         self.validate()
 
+    def test_fias_local_update_consolidate(self) -> None:
+        src = BASE_DIR / Path("data/fake/deltas")
+        args: List[Any] = []
+        opts: Dict[str, Any] = {
+            "src": str(src),
+            "tempdir": str(TEMPDIR),
+            "update": True,
+            "consolidate": 2,
+            "update_version_info": False,
+            "house_param_regions": ["99"],
+            "house_param_report": self.report_path,
+        }
+
+        with mock.patch("fias.importer.commands.update_data") as update_data:
+            with mock.patch("fias.importer.commands.ProcessPoolExecutor", MockProcessPoolExecutor):
+                call_command("fias", *args, **opts)
+        # Обе дельты применены одним проходом
+        update_data.assert_not_called()
+
+        self.validate()
+
     def validate(self) -> None:
         self.assertEqual(14, HouseType.objects.count())
         ht = HouseType.objects.get(id=7)
@@ -456,6 +574,7 @@ class CommandUpdateTestCase(ReportTestMixin, TransactionTestCase):
         h_s = Status.objects.get(table=TableName.HOUSE)
         self.assertEqual("99", h_s.region)
         self.assertEqual(ver, h_s.ver)
+        self.assertEqual(ver.ver, h_s.fixed_ver)
 
         self.validate_report()
 
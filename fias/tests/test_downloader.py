@@ -0,0 +1,93 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import json
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from django.test import SimpleTestCase
+
+from fias.importer.downloader import Downloader
+
+from .mock.server import FileServer
+
+
+class TestSegmentedDownload(SimpleTestCase):
+    size = 1000 * 1000 + 7
+
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.serve_dir = Path(temp_dir.name) / "serve"
+        self.serve_dir.mkdir()
+        self.data = os.urandom(self.size)
+        (self.serve_dir / "gar_xml.zip").write_bytes(self.data)
+        self.target = Path(temp_dir.name) / "gar_xml.zip"
+
+        self.downloader = Downloader()
+        self.downloader.min_segment_size = 100 * 1000
+        self.downloader.min_buffer_size = 4096
+        self.downloader.progress_interval = 0.01
+
+    def test_segments(self) -> None:
+        progress: List[int] = []
+        with FileServer(self.serve_dir) as server:
+            path, _ = self.downloader.download_segmented(
+                server.url("gar_xml.zip"),
+                file_name=self.target,
+                segments=4,
+                reporthook=lambda count, bs, total: progress.append(count * bs),
+            )
+        self.assertEqual(self.data, path.read_bytes())
+        # Пробный запрос и по запросу на сегмент
+        self.assertEqual(5, len(server.requests))
+        self.assertEqual(self.size, progress[-1])
+        self.assertFalse(Path(f"{self.target}.segments").exists())
+
+    def test_retry(self) -> None:
+        with FileServer(self.serve_dir) as server:
+            server.break_after["gar_xml.zip"] = 10000
+            self.downloader.download_segmented(server.url("gar_xml.zip"), file_name=self.target, segments=2)
+        self.assertEqual(self.data, self.target.read_bytes())
+        # Оборванный сегмент дозапрашивается с места обрыва
+        self.assertEqual(4, len(server.requests))
+        half = self.size // 2
+        resumed = {f"bytes=10000-{half - 1}", f"bytes={half + 10000}-{self.size - 1}"}
+        self.assertEqual(1, len(resumed.intersection(r for _, r in server.requests)))
+
+    def test_resume(self) -> None:
+        half = self.size // 2
+        self.target.write_bytes(self.data[:1000] + bytes(self.size - 1000))
+        segments = [[0, half, 1000], [half, self.size, self.size - half]]
+        Path(f"{self.target}.segments").write_text(
+            json.dumps({"url": "", "size": self.size, "validator": f'"{self.size}"', "segments": segments})
+        )
+        with FileServer(self.serve_dir) as server:
+            url = server.url("gar_xml.zip")
+            state = json.loads(Path(f"{self.target}.segments").read_text())
+            state["url"] = url
+            Path(f"{self.target}.segments").write_text(json.dumps(state))
+            # Второй сегмент уже скачан, первый продолжается с места остановки
+            self.target.write_bytes(self.data[:1000] + bytes(half - 1000) + self.data[half:])
+            self.downloader.download_segmented(url, file_name=self.target, segments=2)
+
+        self.assertEqual(self.data, self.target.read_bytes())
+        self.assertEqual([("gar_xml.zip", "bytes=0-0"), ("gar_xml.zip", f"bytes=1000-{half - 1}")], server.requests)
+
+    def test_changed_file_is_restarted(self) -> None:
+        self.target.write_bytes(bytes(self.size))
+        Path(f"{self.target}.segments").write_text(
+            json.dumps({"url": "", "size": self.size, "validator": "old", "segments": [[0, self.size, self.size]]})
+        )
+        with FileServer(self.serve_dir) as server:
+            self.downloader.download_segmented(server.url("gar_xml.zip"), file_name=self.target, segments=2)
+        self.assertEqual(self.data, self.target.read_bytes())
+
+    def test_no_ranges(self) -> None:
+        with FileServer(self.serve_dir, ranges=False) as server:
+            self.downloader.download_segmented(server.url("gar_xml.zip"), file_name=self.target, segments=4)
+        self.assertEqual(self.data, self.target.read_bytes())
+        self.assertEqual(2, len(server.requests))
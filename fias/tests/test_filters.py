@@ -0,0 +1,79 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from typing import List, Tuple, Union
+
+from django.test import SimpleTestCase
+
+from fias.importer.filters import (
+    BATCH_FILTERS,
+    ItemFilter,
+    as_batch_filter,
+    as_item_filter,
+    batch_filter,
+    filter_addr_obj_param,
+    filter_house_param,
+    filter_house_type,
+    filter_is_active,
+    filter_is_actual,
+    replace_quotes_in_names,
+)
+from fias.importer.record import Record, get_record_class
+from fias.models import AddrObj, AddrObjParam, House, HouseParam
+
+AddrObjRecord = get_record_class(AddrObj)
+AddrObjParamRecord = get_record_class(AddrObjParam)
+HouseRecord = get_record_class(House)
+HouseParamRecord = get_record_class(HouseParam)
+
+
+class TestBatchFilters(SimpleTestCase):
+    def records(self) -> List[Record]:
+        return [
+            AddrObjRecord(objectid=1, name="&quot;Мир&quot;", isactive=True, isactual=True),
+            AddrObjRecord(objectid=2, name="Мира", isactive=False, isactual=True),
+            AddrObjRecord(objectid=3, name="Мира", isactive=True, isactual=False),
+            AddrObjRecord(objectid=4, name="Мира", isactive=None, isactual=None),
+        ]
+
+    def test_builtin(self) -> None:
+        houses = [HouseRecord(objectid=i, housetype=i) for i in range(0, 15)] + [HouseRecord(objectid=15)]
+        house_params = [HouseParamRecord(id=i, typeid=i) for i in range(1, 20)]
+        addr_obj_params = [AddrObjParamRecord(id=i, typeid=i) for i in range(1, 20)]
+        cases: List[Tuple[ItemFilter, List[Record]]] = [
+            (filter_is_actual, self.records()),
+            (filter_is_active, self.records()),
+            (replace_quotes_in_names, self.records()),
+            (filter_house_type, houses),
+            (filter_house_param, house_params),
+            (filter_addr_obj_param, addr_obj_params),
+        ]
+        self.assertEqual(set(BATCH_FILTERS), {item_filter for item_filter, _ in cases})
+        for item_filter, items in cases:
+            with self.subTest(item_filter=item_filter.__name__):
+                expected = [item_filter(item) is not None for item in items]
+                self.assertEqual(expected, BATCH_FILTERS[item_filter](items))
+
+    def test_replace_quotes(self) -> None:
+        items = self.records()
+        as_batch_filter(replace_quotes_in_names)(items)
+        self.assertEqual('"Мир"', items[0].name)
+
+    def test_item_filter_shim(self) -> None:
+        def rename(item: Record) -> Union[Record, None]:
+            if item.objectid == 2:
+                return None
+            return AddrObjRecord(objectid=item.objectid, name="new")
+
+        items = self.records()
+        self.assertEqual([True, False, True, True], as_batch_filter(rename)(items))
+        self.assertEqual("new", items[0].name)
+
+    def test_batch_filter_shim(self) -> None:
+        @batch_filter
+        def odd(items: List[Record]) -> List[bool]:
+            return [item.objectid % 2 == 1 for item in items]
+
+        self.assertIs(odd, as_batch_filter(odd))
+        item_filter = as_item_filter(odd)
+        self.assertEqual([1, 3], [item.objectid for item in self.records() if item_filter(item) is not None])
@@ -0,0 +1,104 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from datetime import date
+from functools import partial
+from unittest import mock
+
+from django.test import TestCase
+
+from fias.config import TableName
+from fias.importer.commands import fix_data
+from fias.importer.fixscope import FixScope
+from fias.models import AdmHierarchy, House, HouseParam, Status
+
+FIXED_VER = 20221125
+# Версия прерванного запуска: статусы перенесены, данные не исправлены
+FAILED_VER = 20221129
+NEW_VER = 20221202
+TABLES = [TableName.HOUSE, TableName.HOUSE_PARAM, TableName.ADM_HIERARCHY]
+
+
+class TestFixScope(TestCase):
+    databases = {"default", "gar"}
+    fixtures = ["fias/tests/data/fixtures/gar_99.json"]
+
+    def setUp(self) -> None:
+        super().setUp()
+        Status.objects.update(fixed_ver=FIXED_VER)
+        Status.objects.filter(table__in=TABLES).update(ver=NEW_VER)
+        # Дом деактивирован текущим обновлением
+        House.objects.filter(objectid=19273112).update(isactive=False, ver=NEW_VER)
+        # Параметр, потерявший объект в прерванном запуске
+        self.stale = HouseParam.objects.create(
+            id=1,
+            objectid=1,
+            region="99",
+            typeid=6,
+            value="1",
+            ver=FAILED_VER,
+            updatedate=date(2022, 11, 29),
+            startdate=date(2022, 11, 29),
+            enddate=date(2079, 6, 6),
+        )
+        # Новая запись иерархии, ссылающаяся на несуществующий объект
+        self.new = AdmHierarchy.objects.create(
+            id=2,
+            objectid=2,
+            region="99",
+            isactive=True,
+            ver=NEW_VER,
+            updatedate=date(2022, 12, 2),
+            startdate=date(2022, 12, 2),
+            enddate=date(2079, 6, 6),
+        )
+
+    def assertFixed(self) -> None:
+        self.assertFalse(House.objects.filter(objectid=19273112).exists())
+        self.assertFalse(HouseParam.objects.filter(objectid=19273112).exists())
+        self.assertFalse(AdmHierarchy.objects.filter(pk=self.new.pk).exists())
+        self.assertFalse(HouseParam.objects.filter(pk=self.stale.pk).exists())
+        self.assertFalse(Status.objects.filter(table__in=TABLES).exclude(fixed_ver=NEW_VER).exists())
+
+    def test_scoped(self) -> None:
+        # Записи, оставшиеся после прерванного запуска, исправляются вместе с текущими
+        self.assertIn(1, FixScope().ref_keys(TableName.HOUSE_PARAM) or [])
+        fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFixed()
+
+    def test_unknown_fixed_ver(self) -> None:
+        # Версия исправления неизвестна - таблица исправляется целиком
+        Status.objects.filter(table=TableName.HOUSE_PARAM).update(fixed_ver=None)
+        HouseParam.objects.filter(pk=self.stale.pk).update(ver=FIXED_VER)
+        self.assertIsNone(FixScope().ref_keys(TableName.HOUSE_PARAM))
+        fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFixed()
+
+    def test_limit(self) -> None:
+        # Затронутых ключей больше предела - исправляется вся таблица
+        with mock.patch("fias.importer.commands.FixScope", partial(FixScope, limit=0)):
+            fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFixed()
+
+    def test_restart(self) -> None:
+        # Запуск прерван после удаления неактивных записей
+        interrupted = mock.patch("fias.importer.commands.remove_orphans", side_effect=RuntimeError("interrupted"))
+        with interrupted, self.assertRaisesRegex(RuntimeError, "interrupted"):
+            fix_data(TABLES, NEW_VER, threads=1)
+        # Параметры удалены вместе с домом
+        self.assertFalse(House.objects.filter(objectid=19273112).exists())
+        self.assertFalse(HouseParam.objects.filter(objectid=19273112).exists())
+        fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFixed()
+
+    def test_restart_whole_table(self) -> None:
+        # Неактивные дома удалены по всей таблице, ключи удалённых домов не сохранились
+        interrupted = mock.patch("fias.importer.commands.remove_orphans", side_effect=RuntimeError("interrupted"))
+        with interrupted, mock.patch("fias.importer.commands.FixScope", partial(FixScope, limit=0)):
+            with self.assertRaisesRegex(RuntimeError, "interrupted"):
+                fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFalse(House.objects.filter(objectid=19273112).exists())
+        self.assertTrue(HouseParam.objects.filter(objectid=19273112).exists())
+        self.assertIsNone(FixScope().fixed_ver(TableName.HOUSE_PARAM))
+        fix_data(TABLES, NEW_VER, threads=1)
+        self.assertFixed()
@@ -6,13 +6,20 @@ import datetime
 from django.test import TestCase
 
 from fias.config import TableName
+from fias.importer.record import get_record_class
 from fias.importer.validators import (
+    as_batch_validator,
+    get_common_batch_validator,
     get_common_validator,
+    get_create_batch_validator,
     get_create_validator,
+    get_raw_create_predicates,
+    get_update_batch_validator,
     get_update_validator,
 )
 from fias.models import AddrObj
 
+AddrObjRecord = get_record_class(AddrObj)
 today = datetime.date.today()
 diff = datetime.timedelta(1)
 yesterday = today - diff
@@ -25,11 +32,11 @@ class TestCommonValidator(TestCase):
         self.common_validator = get_common_validator(TableName.ADDR_OBJ)
 
     def test_no_pk_model(self) -> None:
-        m = AddrObj(startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
+        m = AddrObjRecord(startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
         self.assertFalse(self.common_validator(m, today))
 
     def test_valid_model(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
         self.assertTrue(self.common_validator(m, today))
 
 
@@ -39,27 +46,27 @@ class TestCreateValidator(TestCase):
         self.create_validator = get_create_validator(TableName.ADDR_OBJ)
 
     def test_startdate_tomorrow(self) -> None:
-        m = AddrObj(pk=1, startdate=tomorrow, enddate=tomorrow, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=tomorrow, enddate=tomorrow, isactive=True, isactual=True)
         self.assertFalse(self.create_validator(m, today))
 
     def test_enddate_yesterday(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=yesterday, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=yesterday, isactive=True, isactual=True)
         self.assertFalse(self.create_validator(m, today))
 
     def test_both_today(self) -> None:
-        m = AddrObj(pk=1, startdate=today, enddate=today, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=today, enddate=today, isactive=True, isactual=True)
         self.assertFalse(self.create_validator(m, today))
 
     def test_not_active(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=tomorrow, isactive=False, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=False, isactual=True)
         self.assertFalse(self.create_validator(m, today))
 
     def test_not_actual(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=False)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=False)
         self.assertFalse(self.create_validator(m, today))
 
     def test_valid_model(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
         self.assertTrue(self.create_validator(m, today))
 
 
@@ -69,5 +76,68 @@ class TestUpdateValidator(TestCase):
         self.update_validator = get_update_validator(TableName.ADDR_OBJ)
 
     def test_valid_model(self) -> None:
-        m = AddrObj(pk=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
+        m = AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True)
         self.assertTrue(self.update_validator(m, today))
+
+
+class TestBatchValidators(TestCase):
+    items = [
+        AddrObjRecord(objectid=1, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=True),
+        AddrObjRecord(objectid=2, startdate=tomorrow, enddate=tomorrow, isactive=True, isactual=True),
+        AddrObjRecord(objectid=3, startdate=yesterday, enddate=tomorrow, isactive=False, isactual=True),
+        AddrObjRecord(objectid=4, startdate=yesterday, enddate=tomorrow, isactive=True, isactual=False),
+        AddrObjRecord(objectid=5, startdate=today, enddate=today, isactive=True, isactual=True),
+        # Без первичного ключа и дат: проверка дат не должна выполняться
+        AddrObjRecord(),
+    ]
+
+    def test_common(self) -> None:
+        self.assertEqual([True] * 5 + [False], get_common_batch_validator(TableName.ADDR_OBJ)(self.items, today))
+
+    def test_create(self) -> None:
+        create_validator = get_create_validator(TableName.ADDR_OBJ)
+        items = self.items[:-1]
+        self.assertEqual(
+            [create_validator(item, today) for item in items],
+            get_create_batch_validator(TableName.ADDR_OBJ)(items, today),
+        )
+
+    def test_update(self) -> None:
+        self.assertEqual([True] * 6, get_update_batch_validator(TableName.ADDR_OBJ)(self.items, today))
+
+    def test_item_validator(self) -> None:
+        batch_validator = as_batch_validator(lambda item, today: bool(item.objectid % 2 == 0))
+        self.assertEqual([False, True, False, True, False], batch_validator(self.items[:-1], today))
+
+
+class TestRawCreatePredicates(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.predicates = get_raw_create_predicates(TableName.ADDR_OBJ, today)
+
+    def check(self, **attrs: str) -> bool:
+        row = {"STARTDATE": yesterday.isoformat(), "ENDDATE": tomorrow.isoformat(), "ISACTIVE": "1", "ISACTUAL": "1"}
+        row.update(attrs)
+        return all(predicate(row) for predicate in self.predicates)
+
+    def test_valid_row(self) -> None:
+        self.assertTrue(self.check())
+
+    def test_startdate_tomorrow(self) -> None:
+        self.assertFalse(self.check(STARTDATE=tomorrow.isoformat()))
+
+    def test_enddate_today(self) -> None:
+        self.assertFalse(self.check(ENDDATE=today.isoformat()))
+
+    def test_not_active(self) -> None:
+        self.assertFalse(self.check(ISACTIVE="0"))
+
+    def test_not_actual(self) -> None:
+        self.assertFalse(self.check(ISACTUAL="false"))
+
+    def test_unknown_date_format(self) -> None:
+        # Строка не отбрасывается, решение принимает валидатор после преобразования
+        self.assertTrue(self.check(STARTDATE=tomorrow.strftime("%d.%m.%y %H:%M:%S")))
+
+    def test_update_table(self) -> None:
+        self.assertEqual([], get_raw_create_predicates(TableName.HOUSE_TYPE, today))
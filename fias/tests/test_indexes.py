@@ -2,19 +2,22 @@
 from __future__ import absolute_import, unicode_literals
 
 from typing import List, Tuple, Type
+from unittest import mock
 
 from django.db import connections
 from django.db.models import Model
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from fias.config import DATABASE_ALIAS
 from fias.models import House
-from gar_loader.indexes import remove_indexes_from_model, restore_indexes_for_model
+from gar_loader.indexes import (
+    maintenance_session,
+    remove_indexes_from_model,
+    restore_indexes_for_model,
+)
 
 
-class TestIndexes(TestCase):
-    databases = {"default", "gar"}
-
+class IndexesMixin(object):
     @staticmethod
     def _get_constraints(model: Type[Model]) -> Tuple[List[str], List[str]]:
         connection = connections[DATABASE_ALIAS]
@@ -29,6 +32,10 @@ class TestIndexes(TestCase):
                     other_constraints.append(constraint)
             return pk_constraints, other_constraints
 
+
+class TestIndexes(IndexesMixin, TestCase):
+    databases = {"default", "gar"}
+
     def test_indexes_with_pk(self) -> None:
         pk, other = self._get_constraints(House)
         self.assertListEqual(["fias_house_pkey"], pk)
@@ -66,3 +73,35 @@ class TestIndexes(TestCase):
         self.assertListEqual(
             ["fias_house_region78_idx", "fias_house_tree_ve_4bdad3_idx", "fias_house_ver_4fd60c_idx"], other
         )
+
+    @mock.patch("gar_loader.indexes.MAINTENANCE_WORK_MEM", "96MB")
+    @mock.patch("gar_loader.indexes.MAX_PARALLEL_MAINTENANCE_WORKERS", 0)
+    def test_maintenance_session(self) -> None:
+        connection = connections[DATABASE_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW maintenance_work_mem")
+            default = cursor.fetchone()[0]
+            with maintenance_session(connection):
+                cursor.execute("SHOW maintenance_work_mem")
+                self.assertEqual("96MB", cursor.fetchone()[0])
+                cursor.execute("SHOW max_parallel_maintenance_workers")
+                self.assertEqual("0", cursor.fetchone()[0])
+            cursor.execute("SHOW maintenance_work_mem")
+            self.assertEqual(default, cursor.fetchone()[0])
+
+
+class TestParallelIndexes(IndexesMixin, TransactionTestCase):
+    databases = {"default", "gar"}
+
+    @mock.patch("gar_loader.indexes.MAINTENANCE_WORK_MEM", "96MB")
+    def test_parallel_restore(self) -> None:
+        pk_before, _ = self._get_constraints(House)
+        remove_indexes_from_model(House, False)
+        with self.assertLogs("gar_loader.indexes") as logs:
+            restore_indexes_for_model(House, False, workers=3)
+        self.assertEqual(3, len(logs.records))
+        pk, other = self._get_constraints(House)
+        self.assertListEqual(pk_before, pk)
+        self.assertListEqual(
+            ["fias_house_region78_idx", "fias_house_tree_ve_4bdad3_idx", "fias_house_ver_4fd60c_idx"], other
+        )
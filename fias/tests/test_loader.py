@@ -0,0 +1,160 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import json
+from datetime import date
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
+from typing import Any, List
+
+from django.test import SimpleTestCase, TestCase
+
+from fias.config import TableName
+from fias.importer.loader import BatchWriterPool, LoadingBar, TableLoader, TableUpdater
+from fias.importer.record import Record, get_record_class
+from fias.importer.table import Table
+from fias.importer.table.xml import XMLTable
+from fias.models import HouseType
+
+
+class TestBatchWriterPool(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.table: Any = object()
+        self.bar = LoadingBar()
+
+    def test_write(self) -> None:
+        written: List[List[Record]] = []
+
+        def write(table: Table, objects: List[Record], bar: LoadingBar) -> None:
+            written.append(objects)
+
+        batches: List[Any] = [[1, 2], [3], [4, 5, 6]]
+        with BatchWriterPool(write, workers=1, queue_size=1) as pool:
+            for batch in batches:
+                pool.put(self.table, batch, self.bar)
+            pool.join()
+            self.assertEqual(batches, written)
+
+    def test_backpressure(self) -> None:
+        release = Event()
+
+        def write(table: Table, objects: List[Record], bar: LoadingBar) -> None:
+            release.wait()
+
+        pool = BatchWriterPool(write, workers=1, queue_size=1)
+        pool.put(self.table, [], self.bar)
+        pool.put(self.table, [], self.bar)
+        # Один пакет пишется, второй в очереди: очередь заполнена
+        self.assertTrue(pool._queue.full())
+        release.set()
+        pool.join()
+        pool.close()
+
+    def test_error(self) -> None:
+        def write(table: Table, objects: List[Record], bar: LoadingBar) -> None:
+            raise ValueError("write error")
+
+        with BatchWriterPool(write, workers=2, queue_size=1) as pool:
+            pool.put(self.table, [], self.bar)
+            self.assertRaisesRegex(ValueError, "write error", pool.join)
+            self.assertRaises(ValueError, pool.put, self.table, [], self.bar)
+
+
+class HouseTypeTestCase(TestCase):
+    databases = {"default", "gar"}
+
+    def setUp(self) -> None:
+        super().setUp()
+        for pk, updatedate in ((1, date(2022, 1, 2)), (2, date(2022, 1, 1))):
+            HouseType.objects.create(
+                id=pk,
+                name="old",
+                updatedate=updatedate,
+                startdate=date(2022, 1, 1),
+                enddate=date(2079, 6, 6),
+                isactive=True,
+                ver=1,
+            )
+        self.table = XMLTable(filename="AS_HOUSE_TYPES.XML", name=TableName.HOUSE_TYPE, ver=2)
+
+    def record(self, pk: int, updatedate: date, name: str = "new") -> Record:
+        return get_record_class(HouseType)(
+            id=pk,
+            name=name,
+            updatedate=updatedate,
+            startdate=date(2022, 1, 1),
+            enddate=date(2079, 6, 6),
+            isactive=True,
+            ver=2,
+        )
+
+
+class TestTableUpdater(HouseTypeTestCase):
+    def test_update(self) -> None:
+        objects = [self.record(1, date(2022, 1, 1)), self.record(2, date(2022, 1, 5))]
+        old_dates = dict(HouseType.objects.values_list("pk", "updatedate"))
+        updater = TableUpdater()
+        for _ in range(2):
+            # Повторное обновление в той же транзакции тоже должно работать
+            self.assertEqual(1, updater.update(self.table, objects, old_dates))
+
+        self.assertEqual("old", HouseType.objects.get(pk=1).name)
+        ht = HouseType.objects.get(pk=2)
+        self.assertEqual("new", ht.name)
+        self.assertEqual(date(2022, 1, 5), ht.updatedate)
+        self.assertEqual(2, ht.ver)
+
+
+class TestIsolatingCreate(HouseTypeTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "quarantine.jsonl"
+        self.loader = TableLoader(quarantine=self.path)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def quarantined(self) -> List[Any]:
+        with self.path.open(encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_duplicate_key(self) -> None:
+        objects = [self.record(1, date(2022, 1, 5)), self.record(3, date(2022, 1, 5))]
+        self.loader.create(self.table, objects, bar=LoadingBar())
+
+        self.assertEqual("old", HouseType.objects.get(pk=1).name)
+        self.assertEqual("new", HouseType.objects.get(pk=3).name)
+        self.assertEqual(1, self.loader.err_counter)
+        rows = self.quarantined()
+        self.assertEqual(1, len(rows))
+        self.assertEqual("duplicate key", rows[0]["reason"])
+        self.assertEqual(TableName.HOUSE_TYPE, rows[0]["table"])
+        self.assertEqual(1, rows[0]["row"]["id"])
+        self.assertEqual("2022-01-05", rows[0]["row"]["updatedate"])
+
+    def test_invalid_value(self) -> None:
+        objects = [
+            self.record(1, date(2022, 1, 5)),
+            self.record(3, date(2022, 1, 5)),
+            self.record(4, date(2022, 1, 5), name="x" * 256),
+            self.record(5, date(2022, 1, 5)),
+        ]
+        self.loader.create(self.table, objects, bar=LoadingBar())
+
+        self.assertEqual([1, 2, 3, 5], list(HouseType.objects.order_by("pk").values_list("pk", flat=True)))
+        self.assertEqual(2, self.loader.err_counter)
+        rows = {row["row"]["id"]: row["reason"] for row in self.quarantined()}
+        self.assertEqual("duplicate key", rows[1])
+        self.assertIn("too long", rows[4])
+
+    def test_no_quarantine(self) -> None:
+        loader = TableLoader()
+        with self.assertLogs("fias.importer.loader", level="WARNING") as cm:
+            loader.create(self.table, [self.record(1, date(2022, 1, 5))], bar=LoadingBar())
+        self.assertEqual(1, loader.err_counter)
+        self.assertIn("duplicate key", cm.output[0])
+        self.assertFalse(self.path.exists())
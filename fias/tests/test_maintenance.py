@@ -0,0 +1,114 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from datetime import date
+from unittest import mock
+
+from django.db import connections
+from django.test import SimpleTestCase, TestCase
+
+from fias.config import TableName
+from fias.importer.commands import remove_not_active
+from fias.importer.maintenance import FixChunking, split_range
+from fias.models import AddrObjType, AdmHierarchy, House, HouseParam
+
+
+class TestSplitRange(SimpleTestCase):
+    def test_even(self) -> None:
+        self.assertEqual([(0, 5), (5, 10)], split_range(0, 10, 2))
+
+    def test_uneven(self) -> None:
+        bounds = split_range(10, 21, 3)
+        self.assertEqual([(10, 14), (14, 18), (18, 21)], bounds)
+
+    def test_more_chunks_than_values(self) -> None:
+        self.assertEqual([(5, 6), (6, 7)], split_range(5, 7, 10))
+
+    def test_single(self) -> None:
+        self.assertEqual([(1, 2)], split_range(1, 2, 0))
+
+
+class TestRefBounds(TestCase):
+    databases = {"default", "gar"}
+    fixtures = ["fias/tests/data/fixtures/gar_99.json"]
+
+    def _param(self, pk: int, objectid: int) -> HouseParam:
+        return HouseParam.objects.create(
+            id=pk,
+            objectid=objectid,
+            region="99",
+            typeid=6,
+            value="1",
+            ver=20221125,
+            updatedate=date(2022, 11, 25),
+            startdate=date(2022, 11, 25),
+            enddate=date(2079, 6, 6),
+        )
+
+    def test_delete_orphans(self) -> None:
+        low = self._param(1, 1)
+        high = self._param(2, 30000000)
+        # Верхняя граница не входит в диапазон
+        self.assertEqual(1, HouseParam.objects.delete_orphans(bounds=(1, 30000000)))
+        self.assertFalse(HouseParam.objects.filter(pk=low.pk).exists())
+        self.assertTrue(HouseParam.objects.filter(pk=high.pk).exists())
+        self.assertEqual(3, HouseParam.objects.filter(objectid=19273112).count())
+
+    def test_update_tree_ver(self) -> None:
+        HouseParam.objects.filter(pk=119564345).update(ver=20221202)
+        self.assertEqual(0, HouseParam.objects.update_tree_ver(20221202, bounds=(1, 19273112)))
+        self.assertEqual(0, HouseParam.objects.update_tree_ver(20221202, bounds=(19273113, 30000000)))
+        self.assertEqual(20221125, House.objects.get(pk=19273112).tree_ver)
+        self.assertEqual(1, HouseParam.objects.update_tree_ver(20221202, bounds=(19273112, 19273113)))
+        self.assertEqual(20221202, House.objects.get(pk=19273112).tree_ver)
+
+
+class TestDeleteNotActive(TestCase):
+    databases = {"default", "gar"}
+    fixtures = ["fias/tests/data/fixtures/gar_99.json"]
+
+    def test_regions(self) -> None:
+        AdmHierarchy.objects.filter(pk__in=[84786086, 84786087]).update(isactive=False)
+        AdmHierarchy.objects.filter(pk=84786097).update(isactive=False, region="77")
+        # Верхняя граница не входит в диапазон
+        self.assertEqual({"99": 1}, AdmHierarchy.objects.delete_not_active(bounds=(84786086, 84786087)))
+        self.assertEqual({"99": 1, "77": 1}, AdmHierarchy.objects.delete_not_active())
+        self.assertEqual({}, AdmHierarchy.objects.delete_not_active())
+        self.assertEqual(2, AdmHierarchy.objects.count())
+
+    def test_keys(self) -> None:
+        AdmHierarchy.objects.filter(pk__in=[84786086, 84786087]).update(isactive=False)
+        self.assertEqual({"99": 1}, AdmHierarchy.objects.delete_not_active(keys=[84786086, 84785687]))
+        self.assertTrue(AdmHierarchy.objects.filter(pk=84786087).exists())
+
+    def test_generic_sql(self) -> None:
+        # Запросы для других СУБД
+        AdmHierarchy.objects.filter(pk__in=[84786086, 84786087]).update(isactive=False)
+        AdmHierarchy.objects.filter(pk=84786097).update(isactive=False, region="77")
+        with mock.patch.object(type(connections["gar"]), "vendor", "sqlite"):
+            self.assertEqual({}, AdmHierarchy.objects.delete_not_active(keys=[]))
+            self.assertEqual({"99": 1}, AdmHierarchy.objects.delete_not_active(keys=[84786086, 84785687]))
+            self.assertEqual({"77": 1}, AdmHierarchy.objects.delete_not_active(bounds=(84786090, 84786100)))
+            self.assertEqual({"99": 1}, AdmHierarchy.objects.delete_not_active())
+        self.assertFalse(AdmHierarchy.objects.filter(isactive=False).exists())
+
+    def test_remove_not_active(self) -> None:
+        AddrObjType.objects.filter(pk__in=AddrObjType.objects.values("pk")[:3]).update(isactive=False)
+        AdmHierarchy.objects.filter(pk__in=[84786086, 84786087, 84786097]).update(isactive=False)
+        with self.assertLogs("fias.importer.commands", "INFO") as logs:
+            remove_not_active([TableName.ADDR_OBJ_TYPE, TableName.ADM_HIERARCHY])
+        self.assertFalse(AddrObjType.objects.filter(isactive=False).exists())
+        self.assertFalse(AdmHierarchy.objects.filter(isactive=False).exists())
+        self.assertIn("Removed 3 inactive records of `adm_hierarchy`, region 99.", "\n".join(logs.output))
+
+    def test_remove_not_active_chunks(self) -> None:
+        AdmHierarchy.objects.filter(pk__in=[84786086, 84786087]).update(isactive=False)
+        AdmHierarchy.objects.filter(pk=84786097).update(isactive=False, region="77")
+        with self.assertLogs("fias.importer", "INFO") as logs:
+            remove_not_active([TableName.ADM_HIERARCHY], chunking=FixChunking(rows=1, workers=1))
+        output = "\n".join(logs.output)
+        # Количества по регионам суммируются по всем диапазонам
+        self.assertIn("Removed 2 inactive records of `adm_hierarchy`, region 99.", output)
+        self.assertIn("Removed 1 inactive records of `adm_hierarchy`, region 77.", output)
+        self.assertIn("chunk 2/", output)
+        self.assertFalse(AdmHierarchy.objects.filter(isactive=False).exists())
@@ -0,0 +1,89 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import shutil
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from typing import Any, List
+
+from django.test import SimpleTestCase
+
+from fias.importer.source import prefetch_archives
+from fias.importer.source.archive import BadArchiveError, RetrieveError
+
+BASE_DIR = Path(__file__).resolve().parent
+DELTAS = ["gar_delta_99_20221128.rar", "gar_delta_99_20221202.rar"]
+
+
+class TestPrefetchArchives(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.serve_dir = Path(temp_dir.name) / "serve"
+        self.tempdir = Path(temp_dir.name) / "download"
+        self.tempdir.mkdir()
+        shutil.copytree(BASE_DIR / "data/fake/deltas", self.serve_dir)
+
+        self.requested: List[str] = []
+        lock = Lock()
+        requested = self.requested
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self) -> None:
+                with lock:
+                    requested.append(self.path.lstrip("/"))
+                super().do_GET()
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=str(self.serve_dir)))
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def test_order(self) -> None:
+        names = DELTAS * 2
+        paths: List[Path] = []
+        for path in prefetch_archives([self.url(n) for n in names], tempdir=self.tempdir, lookahead=1):
+            # Следующий архив скачивается, пока обрабатывается текущий; дальше - не скачивается
+            self.assertLessEqual(len(self.requested), len(paths) + 2)
+            paths.append(path)
+            self.assertEqual((self.serve_dir / names[len(paths) - 1]).read_bytes(), path.read_bytes())
+
+        self.assertEqual(names, self.requested)
+        self.assertEqual(len(set(paths)), len(paths))
+        # Обработанные архивы удаляются
+        self.assertEqual([], list(self.tempdir.iterdir()))
+
+    def test_interrupted(self) -> None:
+        archives = prefetch_archives([self.url(n) for n in DELTAS * 2], tempdir=self.tempdir, lookahead=2)
+        next(archives)
+        archives.close()
+        self.assertEqual([], list(self.tempdir.iterdir()))
+
+    def test_bad_archive(self) -> None:
+        good = self.serve_dir / "good.zip"
+        with zipfile.ZipFile(good, "w") as archive:
+            archive.writestr("AS_HOUSE_TYPES_20221123_78b12eeb-5e0b-442c-8728-8b85101a6499.XML", b"<HOUSETYPES/>" * 100)
+        data = bytearray(good.read_bytes())
+        # Портим сжатые данные файла, оставляя заголовки целыми
+        data[60] ^= 0xFF
+        (self.serve_dir / "bad.zip").write_bytes(bytes(data))
+
+        archives = prefetch_archives([self.url("good.zip"), self.url("bad.zip")], tempdir=self.tempdir)
+        self.assertEqual(good.read_bytes(), next(archives).read_bytes())
+        self.assertRaises(BadArchiveError, next, archives)
+        self.assertEqual([], list(self.tempdir.iterdir()))
+
+    def test_not_found(self) -> None:
+        archives = prefetch_archives([self.url("missing.zip")], tempdir=self.tempdir)
+        self.assertRaises(RetrieveError, next, archives)
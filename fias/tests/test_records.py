@@ -0,0 +1,46 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+
+from django.test import TestCase
+
+from fias.importer.record import Record, get_record_class
+from fias.models import AddrObj, House
+
+
+class TestRecord(TestCase):
+    def test_record_class_cache(self) -> None:
+        self.assertIs(get_record_class(AddrObj), get_record_class(AddrObj))
+        self.assertIsNot(get_record_class(AddrObj), get_record_class(House))
+
+    def test_slots(self) -> None:
+        r = get_record_class(AddrObj)(objectid=1)
+        self.assertIsInstance(r, Record)
+        self.assertRaises(AttributeError, setattr, r, "unknown_field", 1)
+
+    def test_values_order(self) -> None:
+        r = get_record_class(AddrObj)(objectid=1, name="Школьная")
+        self.assertEqual(len(AddrObj._meta.fields), len(r.values()))
+        for f, value in zip(AddrObj._meta.fields, r.values()):
+            self.assertEqual(getattr(r, f.attname), value)
+
+    def test_equality(self) -> None:
+        record_class = get_record_class(AddrObj)
+        self.assertEqual(record_class(objectid=1, name="a"), record_class(objectid=1, name="b"))
+        self.assertNotEqual(record_class(objectid=1), record_class(objectid=2))
+        self.assertNotEqual(record_class(objectid=1), get_record_class(House)(objectid=1))
+        self.assertEqual(1, len({record_class(objectid=1), record_class(objectid=1)}))
+        self.assertRaises(TypeError, hash, record_class())
+
+    def test_to_model(self) -> None:
+        r = get_record_class(AddrObj)(
+            objectid=1, name="Школьная", isactive=True, isactual=True, startdate=datetime.date(2022, 1, 1)
+        )
+        m = r.to_model()
+        assert isinstance(m, AddrObj)
+        self.assertEqual(1, m.pk)
+        self.assertEqual("Школьная", m.name)
+        self.assertTrue(m.isactive)
+        self.assertEqual(datetime.date(2022, 1, 1), m.startdate)
+        self.assertEqual(r.as_dict(), {f.attname: getattr(m, f.attname) for f in AddrObj._meta.fields})
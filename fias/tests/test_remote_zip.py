@@ -0,0 +1,114 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import io
+import os
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from fias import config
+from fias.config import TableName
+from fias.importer.commands import get_tablelist
+from fias.importer.downloader import RangeNotSupportedError, RangeReader
+from fias.importer.source import RemoteZipTableList
+from fias.models import Version
+
+from .mock.server import FileServer
+
+HOUSES_99 = "99/AS_HOUSES_20221124_9e59866e-91df-44ed-94c6-2d22f4c765c0.XML"
+HOUSES_01 = "01/AS_HOUSES_20221124_1c3ba3ea-6f5f-4a36-9d4b-9d1fd5b6cd57.XML"
+HOUSE_TYPES = "AS_HOUSE_TYPES_20221123_78b12eeb-5e0b-442c-8728-8b85101a6499.XML"
+
+
+class TestRemoteZip(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.serve_dir = Path(temp_dir.name)
+        self.houses_99 = b'<?xml version="1.0" encoding="utf-8"?><HOUSES>' + b"<HOUSE/>" * 1000 + b"</HOUSES>"
+        # Несжимаемые данные другого региона
+        self.houses_01 = os.urandom(2 * 1024 * 1024)
+        with zipfile.ZipFile(self.serve_dir / "gar_xml.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("version.txt", b"2022.11.25\n")
+            archive.writestr(HOUSE_TYPES, b"<HOUSETYPES/>")
+            archive.writestr(HOUSES_01, self.houses_01)
+            archive.writestr(HOUSES_99, self.houses_99)
+        self.size = (self.serve_dir / "gar_xml.zip").stat().st_size
+        self.version = Version(ver=20221125, dumpdate=datetime.date(2022, 11, 25))
+
+        self.server = FileServer(self.serve_dir)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_selected_members(self) -> None:
+        with mock.patch.object(config, "REGIONS", ("99",)):
+            tablelist = RemoteZipTableList(src=self.server.url("gar_xml.zip"), version=self.version)
+            tables = tablelist.tables
+
+        self.assertEqual({TableName.HOUSE, TableName.HOUSE_TYPE}, set(tables))
+        self.assertEqual(["99"], [t.region for t in tables[TableName.HOUSE]])
+        with tables[TableName.HOUSE][0].open(tablelist) as f:
+            self.assertEqual(self.houses_99, f.read())
+        self.assertEqual(datetime.datetime(2022, 11, 25), tablelist.wrapper.get_date())
+        # Файл другого региона не скачивается
+        self.assertLess(self.server.sent, len(self.houses_01) // 4)
+
+    def test_get_tablelist(self) -> None:
+        url = self.server.url("gar_xml.zip")
+        with mock.patch("fias.importer.source.archive.SELECTIVE_DOWNLOAD", True):
+            with mock.patch.object(config, "REGIONS", ("99",)):
+                self.assertIsInstance(get_tablelist(path=url, version=self.version), RemoteZipTableList)
+
+                # Сервер без запросов диапазонов - архив скачивается целиком
+                self.server.ranges = False
+                with mock.patch("fias.importer.commands.RemoteArchiveTableList") as remote_archive:
+                    get_tablelist(path=url, version=self.version)
+                remote_archive.assert_called_once_with(src=url, version=self.version, tempdir=None)
+
+            self.server.ranges = True
+            with mock.patch.object(config, "REGIONS", config.ALL):
+                with mock.patch("fias.importer.commands.RemoteArchiveTableList") as remote_archive:
+                    get_tablelist(path=url, version=self.version)
+                remote_archive.assert_called_once_with(src=url, version=self.version, tempdir=None)
+
+
+class TestRangeReader(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.data = os.urandom(100000)
+        (Path(temp_dir.name) / "data").write_bytes(self.data)
+        self.server = FileServer(Path(temp_dir.name))
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_read(self) -> None:
+        reader = RangeReader(self.server.url("data"))
+        self.assertEqual(len(self.data), reader.size)
+        self.assertEqual(self.data[:10], reader.read(10))
+        # Последовательное чтение продолжает открытый ответ
+        self.assertEqual(self.data[10:1000], reader.read(990))
+        self.assertEqual(2, len(self.server.requests))
+
+        reader.seek(-100, io.SEEK_END)
+        self.assertEqual(self.data[-100:], reader.read())
+        self.assertEqual(b"", reader.read(10))
+        reader.seek(50000)
+        self.assertEqual(self.data[50000:50010], reader.read(10))
+        reader.close()
+
+    def test_retry(self) -> None:
+        self.server.break_after["data"] = 5000
+        with RangeReader(self.server.url("data")) as reader:
+            self.assertEqual(self.data, io.BufferedReader(reader).read())
+
+    def test_not_supported(self) -> None:
+        self.server.ranges = False
+        self.assertRaises(RangeNotSupportedError, RangeReader, self.server.url("data"))
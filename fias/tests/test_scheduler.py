@@ -0,0 +1,178 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from time import sleep
+from typing import Dict, List
+
+from django.test import SimpleTestCase
+
+from fias.config import TableName
+from fias.importer.commands import add_fix_tasks, get_tablelist, group_tables
+from fias.importer.scheduler import TaskGraph
+from fias.importer.table import get_table_refs
+from fias.models import Version
+
+BASE_DIR = Path(__file__).resolve().parent
+
+
+class TestTaskGraph(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.log: List[str] = []
+        self.lock = Lock()
+
+    def task(self, name: str, delay: float = 0.0) -> None:
+        sleep(delay)
+        with self.lock:
+            self.log.append(name)
+
+    def graph(self) -> TaskGraph:
+        graph = TaskGraph()
+        graph.add("a1", partial(self.task, "a1", 0.05))
+        graph.add("a2", partial(self.task, "a2"))
+        graph.add("b", partial(self.task, "b"))
+        graph.add("a", partial(self.task, "a"), ["a1", "a2"], local=True)
+        graph.add("ab", partial(self.task, "ab"), ["a", "b"], local=True)
+        return graph
+
+    def test_sequential(self) -> None:
+        self.graph().run()
+        self.assertEqual(["a1", "a2", "b", "a", "ab"], self.log)
+
+    def test_parallel(self) -> None:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self.graph().run(executor, local_workers=2)
+        self.assertEqual(5, len(self.log))
+        # Независимые задачи не ждут медленную a1
+        self.assertLess(self.log.index("b"), self.log.index("a1"))
+        self.assertLess(self.log.index("a1"), self.log.index("a"))
+        self.assertEqual("ab", self.log[-1])
+
+    def test_local_workers_only(self) -> None:
+        self.graph().run(local_workers=2)
+        self.assertEqual(5, len(self.log))
+        self.assertEqual("ab", self.log[-1])
+
+    def test_add(self) -> None:
+        graph = self.graph()
+        self.assertIn("ab", graph)
+        self.assertEqual({"a", "b"}, graph["ab"].deps)
+        self.assertRaises(ValueError, graph.add, "ab", print)
+        self.assertRaises(ValueError, graph.add, "c", print, ["unknown"])
+
+    def test_error(self) -> None:
+        def fail() -> None:
+            raise ValueError("task error")
+
+        graph = TaskGraph()
+        graph.add("fail", fail)
+        graph.add("after", partial(self.task, "after"), ["fail"])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertRaisesRegex(ValueError, "task error", graph.run, executor)
+        self.assertEqual([], self.log)
+
+    def test_largest_first(self) -> None:
+        graph = TaskGraph()
+        for name, weight in (("small", 1), ("large", 100), ("medium", 10)):
+            graph.add(name, partial(self.task, name), weight=weight)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            graph.run(executor, pool_workers=1)
+        self.assertEqual(["large", "medium", "small"], self.log)
+
+    def test_memory_budget(self) -> None:
+        running: List[str] = []
+        overlaps: List[List[str]] = []
+
+        def task(name: str) -> None:
+            with self.lock:
+                running.append(name)
+                overlaps.append(list(running))
+            sleep(0.02)
+            with self.lock:
+                running.remove(name)
+
+        graph = TaskGraph()
+        graph.add("large", partial(task, "large"), weight=3, memory=80)
+        graph.add("small1", partial(task, "small1"), weight=2, memory=20)
+        graph.add("small2", partial(task, "small2"), weight=1, memory=20)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            graph.run(executor, memory_budget=90)
+        # Мелкие задачи вместе с крупной не помещаются в бюджет, друг с другом - помещаются
+        self.assertEqual(["large"], overlaps[0])
+        self.assertIn(["small1", "small2"], overlaps)
+        self.assertFalse([names for names in overlaps if "large" in names and len(names) > 1])
+
+
+class TestFixTasks(SimpleTestCase):
+    def test_table_refs(self) -> None:
+        self.assertEqual([TableName.HOUSE], get_table_refs(TableName.HOUSE_PARAM))
+        self.assertEqual([TableName.ADDR_OBJ, TableName.HOUSE], get_table_refs(TableName.ADM_HIERARCHY))
+        self.assertEqual([], get_table_refs(TableName.HOUSE))
+
+    def test_dependencies(self) -> None:
+        tables = [TableName(tbl) for tbl in TableName]
+        graph = TaskGraph()
+        ready: Dict[TableName, str] = {tbl: graph.add(f"finish:{tbl}", print) for tbl in tables}
+        add_fix_tasks(graph, tables, 0, ready)
+
+        self.assertEqual({"finish:house_param", "finish:house"}, graph["tree_ver:house_param"].deps)
+        # Версия дерева в одну таблицу переносится по очереди
+        self.assertIn("tree_ver:adm_hierarchy", graph["tree_ver:mun_hierarchy"].deps)
+        self.assertNotIn("tree_ver:house", graph)
+        # Неактивные записи удаляются после переноса версий дерева в таблицу и из неё
+        # и после удаления неактивных записей ссылающихся таблиц
+        self.assertEqual(
+            {
+                "finish:house",
+                "tree_ver:house_param",
+                "tree_ver:adm_hierarchy",
+                "tree_ver:mun_hierarchy",
+                "not_active:house_param",
+                "not_active:adm_hierarchy",
+                "not_active:mun_hierarchy",
+            },
+            graph["not_active:house"].deps,
+        )
+        self.assertIn("tree_ver:house_param", graph["not_active:house_param"].deps)
+        self.assertEqual({"not_active:house_param", "not_active:house"}, graph["orphans:house_param"].deps)
+        self.assertNotIn("orphans:house", graph)
+
+
+class TestGroupTables(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.tablelist = get_tablelist(
+            path=BASE_DIR / "data/fake/gar_99.rar",
+            version=Version(ver=20221125, dumpdate=datetime.date(2022, 11, 25)),
+            tempdir=BASE_DIR,
+        )
+
+    def test_coalesce(self) -> None:
+        tables = [t for tables in self.tablelist.tables.values() for t in tables]
+        groups = group_tables(self.tablelist, tables, 4000)
+
+        sizes = [size for size, _ in groups]
+        self.assertEqual(sorted(sizes, reverse=True), sizes)
+        self.assertEqual(sum(t.get_size(self.tablelist) for t in tables), sum(sizes))
+        self.assertEqual(len(tables), sum(len(group) for _, group in groups))
+        for size, group in groups:
+            self.assertTrue(len(group) == 1 or size <= 4000)
+        self.assertLess(len(groups), len(tables))
+
+    def test_parts(self) -> None:
+        table = self.tablelist.tables[TableName.ADDR_OBJ_PARAM][0]
+        parts = table.split(tablelist=self.tablelist, size=1024)
+        self.assertEqual(table.get_size(self.tablelist), sum(t.get_size(self.tablelist) for t in parts))
+
+        # Части файла не объединяются
+        groups = group_tables(self.tablelist, parts, 1024 * 1024)
+        self.assertEqual([[t] for t in parts], [group for _, group in groups])
+
+    def test_no_coalesce(self) -> None:
+        tables = [t for tables in self.tablelist.tables.values() for t in tables]
+        self.assertEqual(len(tables), len(group_tables(self.tablelist, tables, 0)))
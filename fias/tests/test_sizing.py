@@ -0,0 +1,55 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+from django.test import SimpleTestCase
+
+from fias.importer.sizing import AdaptiveBatchSize, BatchSizing, get_rss
+
+
+class TestAdaptiveBatchSize(SimpleTestCase):
+    sizing = BatchSizing(min_size=100, max_size=1000, target_latency=1.0, max_rss=1024)
+
+    def test_bounds(self) -> None:
+        self.assertEqual(100, AdaptiveBatchSize(1, self.sizing).size)
+        self.assertEqual(1000, AdaptiveBatchSize(5000, self.sizing)())
+
+    def test_grow(self) -> None:
+        batch_size = AdaptiveBatchSize(400, self.sizing)
+        batch_size.record(400, 0.5, rss=0)
+        self.assertEqual(500, batch_size.size)
+        batch_size.record(500, 0.5, rss=0)
+        self.assertEqual(600, batch_size.size)
+        for _ in range(10):
+            batch_size.record(batch_size.size, 0.5, rss=0)
+        self.assertEqual(1000, batch_size.size)
+        self.assertEqual([400, 500, 600, 700, 800, 900, 1000], batch_size.sizes)
+
+    def test_hold_on_slower_rate(self) -> None:
+        batch_size = AdaptiveBatchSize(400, self.sizing)
+        batch_size.record(400, 0.1, rss=0)
+        # Скорость записи упала больше чем на 10%: размер не меняется
+        batch_size.record(500, 0.5, rss=0)
+        self.assertEqual(500, batch_size.size)
+
+    def test_shrink_on_latency(self) -> None:
+        batch_size = AdaptiveBatchSize(800, self.sizing)
+        batch_size.record(800, 2.0, rss=0)
+        self.assertEqual(400, batch_size.size)
+        batch_size.record(400, 1.2, rss=0)
+        self.assertEqual(400, batch_size.size)
+
+    def test_shrink_on_rss(self) -> None:
+        batch_size = AdaptiveBatchSize(150, self.sizing)
+        batch_size.record(150, 0.1, rss=2048)
+        self.assertEqual(100, batch_size.size)
+
+    def test_short_batch(self) -> None:
+        batch_size = AdaptiveBatchSize(400, self.sizing)
+        batch_size.record(10, 10.0, rss=0)
+        self.assertEqual(400, batch_size.size)
+        self.assertIn("final=400", batch_size.summary())
+
+    def test_get_rss(self) -> None:
+        rss = get_rss()
+        if rss is not None:
+            self.assertGreater(rss, 0)
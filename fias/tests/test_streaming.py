@@ -0,0 +1,97 @@
+# coding: utf-8
+from __future__ import absolute_import, unicode_literals
+
+import datetime
+import os
+import zipfile
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from fias.config import TableName
+from fias.importer.source import StreamingArchiveTableList
+from fias.importer.source.archive import RetrieveError
+from fias.importer.source.streaming import GrowingFile
+from fias.models import Version
+
+from .mock.server import FileServer
+
+HOUSES = "99/AS_HOUSES_20221124_9e59866e-91df-44ed-94c6-2d22f4c765c0.XML"
+HOUSE_TYPES = "AS_HOUSE_TYPES_20221123_78b12eeb-5e0b-442c-8728-8b85101a6499.XML"
+
+
+class TestStreamingArchive(SimpleTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.serve_dir = Path(temp_dir.name) / "serve"
+        self.serve_dir.mkdir()
+        self.tempdir = Path(temp_dir.name)
+        self.house_types = b"<HOUSETYPES/>"
+        # Несжимаемые данные, чтобы архив скачивался заметное время
+        self.houses = os.urandom(1024 * 1024)
+        with zipfile.ZipFile(self.serve_dir / "gar_xml.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(HOUSE_TYPES, self.house_types)
+            archive.writestr(HOUSES, self.houses)
+        self.version = Version(ver=20221125, dumpdate=datetime.date(2022, 11, 25))
+
+        self.server = FileServer(self.serve_dir)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+
+    def test_read_while_downloading(self) -> None:
+        self.server.chunk_delay = 0.05
+        tablelist = StreamingArchiveTableList(
+            src=self.server.url("gar_xml.zip"), version=self.version, tempdir=self.tempdir
+        )
+        self.assertEqual({TableName.HOUSE, TableName.HOUSE_TYPE}, set(tablelist.tables))
+
+        # Первый файл архива доступен до окончания скачивания
+        with tablelist.tables[TableName.HOUSE_TYPE][0].open(tablelist) as f:
+            self.assertEqual(self.house_types, f.read())
+        self.assertLess((self.tempdir / "gar_xml.zip").stat().st_size, len(self.houses))
+
+        with tablelist.tables[TableName.HOUSE][0].open(tablelist) as f:
+            self.assertEqual(self.houses, f.read())
+        self.assertLess(
+            tablelist.get_file_offset(HOUSE_TYPES),
+            tablelist.get_file_offset(HOUSES),
+        )
+        tablelist.wait()
+        self.assertEqual((self.serve_dir / "gar_xml.zip").read_bytes(), (self.tempdir / "gar_xml.zip").read_bytes())
+        self.assertFalse(GrowingFile.tail_path(self.tempdir / "gar_xml.zip").exists())
+
+    def test_retry(self) -> None:
+        self.server.break_after["gar_xml.zip"] = 64 * 1024
+        tablelist = StreamingArchiveTableList(
+            src=self.server.url("gar_xml.zip"), version=self.version, tempdir=self.tempdir
+        )
+        with tablelist.tables[TableName.HOUSE][0].open(tablelist) as f:
+            self.assertEqual(self.houses, f.read())
+        tablelist.wait()
+
+    def test_download_failed(self) -> None:
+        error = OSError("no space left")
+        download = mock.patch("fias.importer.source.streaming.Downloader.download", side_effect=error)
+        with download, self.assertLogs("fias.importer.source.streaming", "ERROR"):
+            tablelist = StreamingArchiveTableList(
+                src=self.server.url("gar_xml.zip"), version=self.version, tempdir=self.tempdir
+            )
+            with self.assertRaisesRegex(RetrieveError, "no space left"):
+                tablelist.tables[TableName.HOUSE][0].open(tablelist).read()
+        # Ошибка скачивания, случившаяся после чтения файлов, не теряется
+        with self.assertRaisesRegex(RetrieveError, "no space left"):
+            tablelist.wait()
+        self.assertFalse(GrowingFile.failed_path(self.tempdir / "gar_xml.zip").exists())
+
+    def test_temporary_archive(self) -> None:
+        tablelist = StreamingArchiveTableList(src=self.server.url("gar_xml.zip"), version=self.version)
+        with tablelist.tables[TableName.HOUSE][0].open(tablelist) as f:
+            self.assertEqual(self.houses, f.read())
+        path = tablelist._path
+        tablelist.wait()
+        self.assertFalse(path.exists())
+        self.assertFalse(GrowingFile.tail_path(path).exists())
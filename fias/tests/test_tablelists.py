@@ -2,6 +2,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import datetime
+import pickle
 from pathlib import Path
 from typing import Type
 
@@ -10,6 +11,7 @@ from django.test import TestCase
 from fias.models import Version
 
 from ..importer.source import TableList
+from ..importer.source.tablelist import _wrapper_cache
 from ..importer.source.wrapper import SourceWrapper
 from .info import FAKE_FILES
 from .mock.wrapper import Wrapper
@@ -48,3 +50,15 @@ class TestTableList(TestCase):
             fd = tl.open(f)
             self.assertEqual(Path(fd.name).name, f)
             fd.close()
+
+    def test_pickle_reuses_wrapper(self) -> None:
+        _wrapper_cache.clear()
+        self.addCleanup(_wrapper_cache.clear)
+        tl = TableList(src="first")
+        data = pickle.dumps(tl)
+        self.assertNotIn("wrapper", pickle.loads(pickle.dumps(tl)).__getstate__())
+
+        # Задачи одного источника в процессе пула используют один открытый источник
+        wrapper = pickle.loads(data).wrapper
+        self.assertIs(wrapper, pickle.loads(data).wrapper)
+        self.assertIsNot(wrapper, pickle.loads(pickle.dumps(TableList(src="second"))).wrapper)
@@ -1,8 +1,197 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals
 
+import datetime
+from io import BytesIO
+from typing import Any, List, Union
+from unittest import mock
+
 from django.test import TestCase
+from lxml import etree
+
+from fias.config import TableName
+from fias.importer.filters import RawRow
+from fias.importer.table.xml import (
+    DateDecoder,
+    XMLIterator,
+    XMLRangeReader,
+    XMLRowConvertor,
+)
+from fias.models import AddrObj
+
+_addr_obj_xml = """<?xml version="1.0" encoding="utf-8"?>
+<ADDRESSOBJECTS>
+<OBJECT ID="1" OBJECTID="10" OBJECTGUID="2a1c7bdb-05ea-492f-9e1c-b3999f79dcbc" CHANGEID="1" NAME="A" TYPENAME="ул"
+ LEVEL="8" OPERTYPEID="1" PREVID="0" NEXTID="0" UPDATEDATE="2022-01-01" STARTDATE="2022-01-01" ENDDATE="2079-06-06"
+ ISACTUAL="1" ISACTIVE="1" />
+<OBJECT ID="2" OBJECTID="20" OBJECTGUID="ef8c0e45-7da6-4e70-a9c6-b0ac8bcd0fe5" CHANGEID="2" NAME="B" TYPENAME="ул"
+ LEVEL="8" OPERTYPEID="1" PREVID="0" NEXTID="0" UPDATEDATE="2022-01-01" STARTDATE="2022-01-01" ENDDATE="2079-06-06"
+ ISACTUAL="0" ISACTIVE="1" />
+<OBJECT ID="3" OBJECTID="30" OBJECTGUID="4a0b5bce-7f0b-4d65-a4e4-1d0fa1ecdbb3" CHANGEID="3" NAME="C" TYPENAME="ул"
+ LEVEL="8" OPERTYPEID="1" PREVID="0" NEXTID="0" UPDATEDATE="2022-01-01" STARTDATE="2022-01-01" ENDDATE="2079-06-06"
+ ISACTUAL="1" ISACTIVE="0" />
+</ADDRESSOBJECTS>
+""".encode(
+    "utf-8"
+)
 
 
 class TestTable(TestCase):
     pass
+
+
+class TestXMLIterator(TestCase):
+    def rows(self, *raw_predicates: Any) -> XMLIterator:
+        row_convertor = XMLRowConvertor(AddrObj, TableName.ADDR_OBJ, {"ver": 1, "tree_ver": 1, "region": "01"})
+        return XMLIterator(BytesIO(_addr_obj_xml), AddrObj, row_convertor, raw_predicates)
+
+    def test_builtin_raw_filters(self) -> None:
+        # filter_is_actual для addrobj проверяется ещё и на исходных атрибутах
+        rows = self.rows()
+        self.assertEqual([10, 30], [item.objectid for item in rows if item is not None])
+        self.assertEqual(1, rows.get_stats()["raw_rejected"])
+
+    def test_raw_predicates(self) -> None:
+        seen: List[str] = []
+
+        def is_active(row: RawRow) -> bool:
+            seen.append(row.get("OBJECTID") or "")
+            return row.get("ISACTIVE") != "0"
+
+        rows = self.rows(is_active)
+        self.assertEqual([10], [item.objectid for item in rows if item is not None])
+        self.assertEqual(["10", "20", "30"], seen[:3])
+        self.assertEqual(2, rows.get_stats()["raw_rejected"])
+
+    def test_batches(self) -> None:
+        rows = self.rows()
+        batches = [[item.objectid for item in batch] for batch in rows.batches(1)]
+        self.assertEqual([[10], [30]], batches)
+        # Строка 20 отброшена по исходным атрибутам, корневой элемент - фильтром
+        self.assertEqual(1, rows.raw_rejected)
+        self.assertEqual(1, rows.filtered)
+
+    def test_batches_callable_size(self) -> None:
+        sizes = [1, 5]
+
+        def size() -> int:
+            return sizes.pop(0)
+
+        batches = [[item.objectid for item in batch] for batch in self.rows().batches(size)]
+        self.assertEqual([[10], [30]], batches)
+        self.assertEqual([], sizes)
+
+
+class TestXMLFormatRow(TestCase):
+    def rows(self) -> XMLIterator:
+        row_convertor = XMLRowConvertor(AddrObj, TableName.ADDR_OBJ)
+        return XMLIterator(BytesIO(_addr_obj_xml), AddrObj, row_convertor)
+
+    def test_convert(self) -> None:
+        rows = self.rows()
+        row = {
+            "OBJECTID": "10",
+            "OBJECTGUID": "",
+            "NAME": "A",
+            "LEVEL": "",
+            "UPDATEDATE": "2022-01-01",
+            "ENDDATE": "01.12.22 00:00:00",
+            "ISACTUAL": "1",
+            "ISACTIVE": "0",
+            # Атрибутов нет в модели
+            "ID": "1",
+            "CHANGEID": "1",
+        }
+        self.assertEqual(
+            {
+                "objectid": 10,
+                "objectguid": None,
+                "name": "A",
+                "level": None,
+                "updatedate": datetime.date(2022, 1, 1),
+                "enddate": datetime.date(2022, 12, 1),
+                "isactual": True,
+                "isactive": False,
+            },
+            rows.format_row(row),
+        )
+        self.assertIsNone(rows._converters["ID"])
+        self.assertIsNone(rows._converters["CHANGEID"])
+
+    def test_field_map(self) -> None:
+        with mock.patch.dict(
+            "fias.importer.table.xml.field_map", {TableName.ADDR_OBJ: {"changeid": "typename", "name": "unknown"}}
+        ):
+            rows = self.rows()
+        # Атрибут переименовывается, преобразование определяется исходным именем;
+        # переименованный в отсутствующее в модели поле атрибут отбрасывается
+        self.assertEqual({"typename": "7", "level": 8}, rows.format_row({"CHANGEID": "7", "NAME": "A", "LEVEL": "8"}))
+
+    def test_related(self) -> None:
+        rows = self.rows()
+        rows.related_fields = {"level": AddrObj}
+        rows._attnames = rows._attnames | {"level_id"}
+        self.assertEqual({"level_id": "8"}, rows.format_row({"LEVEL": "8"}))
+        self.assertEqual({"level_id": None}, rows.format_row({"LEVEL": ""}))
+
+    def test_compiled_once(self) -> None:
+        rows = self.rows()
+        with mock.patch.object(rows, "compile_converter", wraps=rows.compile_converter) as compile_converter:
+            for i in range(3):
+                rows.format_row({"OBJECTID": str(i), "ISACTIVE": "1", "CHANGEID": str(i)})
+            rows.format_row({"OBJECTID": "4", "NAME": "D"})
+        self.assertEqual(
+            ["OBJECTID", "ISACTIVE", "CHANGEID", "NAME"], [call.args[0] for call in compile_converter.call_args_list]
+        )
+
+
+class TestXMLRangeReader(TestCase):
+    xml = (
+        b"\xef\xbb\xbf<?xml version='1.0' encoding='utf-8'?>\n<HOUSES>"
+        + b"".join(b'<HOUSE ID="%d" HOUSENUM="%d" />\n' % (i, i) for i in range(50))
+        + b"</HOUSES>\n"
+    )
+
+    def read_ids(self, size: int) -> List[Union[str, None]]:
+        ids: List[Union[str, None]] = []
+        count = -(-len(self.xml) // size)
+        for i in range(count):
+            end = (i + 1) * size if i < count - 1 else None
+            reader = XMLRangeReader(BytesIO(self.xml), i * size, end, b"HOUSES", b"HOUSE")
+            ids += [house.get("ID") for house in etree.fromstring(reader.readall())]
+        return ids
+
+    def test_ranges(self) -> None:
+        for size in (1, 7, 30, 31, 100, 999, len(self.xml) - 1, len(self.xml)):
+            with self.subTest(size=size):
+                self.assertEqual([str(i) for i in range(50)], self.read_ids(size))
+
+    def test_empty_range(self) -> None:
+        reader = XMLRangeReader(BytesIO(self.xml), len(self.xml) - 3, None, b"HOUSES", b"HOUSE")
+        self.assertEqual(b"<HOUSES></HOUSES>", reader.read())
+
+
+class TestDateDecoder(TestCase):
+    def test_decode(self) -> None:
+        decoder = DateDecoder()
+        self.assertEqual(datetime.date(2079, 6, 6), decoder.decode("2079-06-06"))
+        self.assertEqual(datetime.date(2022, 11, 28), decoder.decode("28.11.22 10:15:00"))
+        self.assertIsNone(decoder.decode(""))
+        self.assertRaises(ValueError, decoder.decode, "not a date")
+
+    def test_hit_rate(self) -> None:
+        decoder = DateDecoder()
+        self.assertEqual(0.0, decoder.hit_rate)
+        for _ in range(4):
+            decoder.decode("2079-06-06")
+        self.assertEqual(3, decoder.hits)
+        self.assertEqual(1, decoder.misses)
+        self.assertEqual(0.75, decoder.hit_rate)
+
+    def test_bounded(self) -> None:
+        decoder = DateDecoder(maxsize=2)
+        for day in range(1, 4):
+            decoder.decode(f"2022-01-0{day}")
+        decoder.decode("2022-01-01")
+        self.assertEqual(0, decoder.hits)
+        self.assertEqual(4, decoder.misses)
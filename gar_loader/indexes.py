@@ -1,10 +1,28 @@
 # coding: utf-8
 from __future__ import absolute_import, unicode_literals
 
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
-from typing import TYPE_CHECKING, Any, Dict, Iterable, Tuple, Type
-
+from functools import partial
+from time import monotonic
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Type,
+    Union,
+)
+
+from django.conf import settings
 from django.db import connections, models
+from django.db.backends.base.base import BaseDatabaseWrapper
 from django.db.models import ForeignObjectRel, Index
 from django.db.models.fields.related import RelatedField
 from django.db.models.options import Options
@@ -21,6 +39,13 @@ else:
     _Field = models.Field
     _Options = Options
 
+logger = logging.getLogger(__name__)
+
+# Память для построения индекса в сессии восстановления индексов (PostgreSQL), например "1GB"; None - как в БД
+MAINTENANCE_WORK_MEM: Union[str, None] = getattr(settings, "FIAS_MAINTENANCE_WORK_MEM", None)
+# Количество параллельных процессов PostgreSQL для построения одного индекса; None - как в БД
+MAX_PARALLEL_MAINTENANCE_WORKERS: Union[int, None] = getattr(settings, "FIAS_MAX_PARALLEL_MAINTENANCE_WORKERS", None)
+
 
 def get_simple_field(field: _Field) -> _Field:
     params: Dict[str, Any] = {
@@ -117,8 +142,67 @@ def remove_indexes_from_model(model: Type[models.Model], pk: bool) -> None:
         change_indexes_for_model(model=model, field_from=field, field_to=simple_field)
 
 
-def restore_indexes_for_model(model: Type[models.Model], pk: bool) -> None:
+@contextmanager
+def maintenance_session(connection: BaseDatabaseWrapper) -> Iterator[None]:
+    """Параметры сессии PostgreSQL для построения индексов, на время построения"""
+    params: List[Tuple[str, str]] = []
+    if connection.vendor == "postgresql":
+        if MAINTENANCE_WORK_MEM:
+            params.append(("maintenance_work_mem", str(MAINTENANCE_WORK_MEM)))
+        if MAX_PARALLEL_MAINTENANCE_WORKERS is not None:
+            params.append(("max_parallel_maintenance_workers", str(MAX_PARALLEL_MAINTENANCE_WORKERS)))
+    with connection.cursor() as cursor:
+        for name, value in params:
+            cursor.execute("SELECT set_config(%s, %s, false)", [name, value])
+    try:
+        yield
+    finally:
+        if params and connection.connection is not None:
+            with connection.cursor() as cursor:
+                for name, _ in params:
+                    cursor.execute(f"RESET {name}")
+
+
+def _build_index(model: Type[models.Model], label: str, build: Callable[[], None]) -> None:
+    with maintenance_session(connections[DATABASE_ALIAS]):
+        start = monotonic()
+        build()
+        logger.info(f"Index {label} of `{model._meta.db_table}` is built in {monotonic() - start:.1f}s.")
+
+
+def _build_index_in_thread(model: Type[models.Model], label: str, build: Callable[[], None]) -> None:
+    try:
+        _build_index(model, label, build)
+    finally:
+        # У каждого потока своё соединение с БД
+        connections.close_all()
+
+
+def restore_indexes_for_model(model: Type[models.Model], pk: bool, workers: int = 1) -> None:
+    """
+    Восстанавливает индексы модели. Первичный ключ и ограничения уникальности меняют таблицу
+    под исключительной блокировкой, поэтому строятся по очереди первыми; остальные индексы
+    строятся одновременно в workers соединениях
+    """
+    constraints: List[Tuple[str, Callable[[], None]]] = []
+    indexes: List[Tuple[str, Callable[[], None]]] = []
     for field, simple_field in get_indexed_fields(model=model, pk=pk):
-        change_indexes_for_model(model=model, field_from=simple_field, field_to=field)
+        build = partial(change_indexes_for_model, model=model, field_from=simple_field, field_to=field)
+        if field.primary_key or field.unique:
+            constraints.append((f"`{field.name}`", build))
+        else:
+            indexes.append((f"`{field.name}`", build))
     for index in get_meta_indexes(model):
-        restore_meta_index(model, index)
+        indexes.append((f"`{index.name}`", partial(restore_meta_index, model, index)))
+
+    for label, job in constraints:
+        _build_index(model, label, job)
+    if workers <= 1 or len(indexes) <= 1:
+        for label, job in indexes:
+            _build_index(model, label, job)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(indexes)), thread_name_prefix="fias-index") as executor:
+        futures = [executor.submit(_build_index_in_thread, model, label, job) for label, job in indexes]
+        for future in futures:
+            future.result()